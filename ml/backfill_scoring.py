@@ -0,0 +1,453 @@
+"""
+Historical Backfill Scoring for BK Pulse Churn Prediction
+Scores customers as of past dates to build churn score trend lines per customer
+and for the portfolio.
+
+Each as-of date is one partition, scored in vectorized chunks, with dates spread
+over parallel workers. Snapshots come from either:
+  - dated snapshot files (a Snapshot_Date column, or a YYYY-MM-DD date in the file name)
+  - one current extract, rolled back to each date (snapshot_as_of):
+      reference date      Last_Transaction_Date + Days_Since_Last_Transaction
+                          (or --reference-date for the whole extract)
+      days since last     shrinks by the days rolled back; customers who transacted
+      transaction         after the as-of date count as active that day (0 days)
+      tenure, account     shrink with the months rolled back
+      age and age
+      account open        customers opened after the as-of date are left out
+      after the reference customers are left out of as-of dates after their own reference
+                          date (rolling forward would invent inactivity), unless
+                          --allow-forward is given
+    The as-of dates end at the latest reference date by default; later dates are refused
+    unless --allow-forward is given.
+    Balances and activity counts are not reconstructed; dated snapshots give exact history.
+
+The store (data/history/churn_scores) is compact and positional:
+  customer_ids.npy          append-only fixed-width customer ids
+  partitions/<date>.npy     one (churn_score x10 as uint16, risk code as uint8) record
+                            per customer id (ABSENT when the customer was not scored that day)
+  manifest.json             per-partition kind (snapshot or derived), model version, source
+                            and portfolio summary
+A partition that exists for the current model version is reused, so extending
+the history or resuming an interrupted run only scores the missing dates. A
+snapshot always replaces a derived partition of the same date, and derive never
+overwrites a snapshot partition.
+
+Usage:
+    python ml/backfill_scoring.py derive customers.csv --periods 52 --every 7D   # a year of weekly history
+    python ml/backfill_scoring.py derive --dsn sqlite:///path/to/bk_pulse.db --start 2026-01-01 --end 2026-06-30
+    python ml/backfill_scoring.py snapshots snapshots/2026-*.csv
+    python ml/backfill_scoring.py customer CUST000123
+    python ml/backfill_scoring.py portfolio --output portfolio_history.csv
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from predict import load_artifacts, get_model_version, normalize_customer_columns, parse_date_series
+from batch_scoring import DEFAULT_CHUNK_SIZE, score_chunks, resolve_customer_ids, read_customer_file
+from customer_batch import ID_COLUMNS
+from resource_governor import govern, resolve_jobs, split_threads, configure_estimator
+from scoring_profiler import install_signal_handler
+
+BASE_DIR = Path(__file__).parent
+HISTORY_DIR = BASE_DIR / '../data/history/churn_scores'
+SNAPSHOT_DATE_COLUMN = 'Snapshot_Date'
+DAYS_PER_MONTH = 30.44
+DAYS_PER_YEAR = 365.25
+SCORE_SCALE = 10                # churn_score has one decimal
+ABSENT = np.iinfo(np.uint16).max
+RISK_LEVELS = ['low', 'medium', 'high']
+RISK_CODES = {level: code for code, level in enumerate(RISK_LEVELS)}
+RECORD_DTYPE = np.dtype([('score', '<u2'), ('risk', 'u1')])
+SNAPSHOT, DERIVED = 'snapshot', 'derived'   # Partition kinds: exact history, or rolled back from an extract
+
+# Accepted spellings of the date columns (predict.COLUMN_MAPPING has none)
+LAST_TRANSACTION_COLUMNS = ['Last_Transaction_Date', 'last_transaction_date', 'lastTransactionDate']
+ACCOUNT_OPEN_COLUMNS = ['Account_Open_Date', 'account_open_date', 'accountOpenDate']
+
+
+def _first_column(df, names):
+    """First of the given columns present in df (all-missing Series if none)"""
+    for name in names:
+        if name in df.columns:
+            return df[name]
+    return pd.Series(None, index=df.index, dtype=object)
+
+
+def _numeric(df, name):
+    """Numeric column, or all-NaN when absent"""
+    if name not in df.columns:
+        return pd.Series(np.nan, index=df.index)
+    return pd.to_numeric(df[name], errors='coerce')
+
+
+def reference_dates(df, reference_date=None):
+    """Date each (normalized) row was observed: `reference_date`, else Last_Transaction_Date
+    + Days_Since_Last_Transaction, else today"""
+    if reference_date is not None:
+        return pd.Series(pd.Timestamp(reference_date).normalize(), index=df.index)
+    last_transaction = parse_date_series(_first_column(df, LAST_TRANSACTION_COLUMNS))
+    reference = last_transaction + pd.to_timedelta(_numeric(df, 'Days_Since_Last_Transaction'), unit='D')
+    return reference.dt.normalize().fillna(pd.Timestamp.now().normalize())
+
+
+def latest_reference_date(customers, reference_date=None):
+    """Latest reference date of an extract, at most today (today when it has none)"""
+    today = pd.Timestamp('today').normalize()
+    if reference_date is not None or customers.empty:
+        return pd.Timestamp(reference_date).normalize() if reference_date else today
+    return min(reference_dates(normalize_customer_columns(customers)).max(), today)
+
+
+def snapshot_as_of(customers, as_of, reference_date=None, allow_forward=False):
+    """Roll a current customer extract back to its state on `as_of` (forward only with allow_forward)"""
+    df = normalize_customer_columns(customers)
+    as_of = pd.Timestamp(as_of)
+    last_transaction = parse_date_series(_first_column(df, LAST_TRANSACTION_COLUMNS))
+    account_open = parse_date_series(_first_column(df, ACCOUNT_OPEN_COLUMNS))
+    days_since = _numeric(df, 'Days_Since_Last_Transaction')
+
+    reference = reference_dates(df, reference_date)
+    days_since = days_since.fillna((reference - last_transaction).dt.days)
+    shift = (reference - as_of).dt.days.astype(float)
+
+    age_months = _numeric(df, 'Account_Age_Months') - shift / DAYS_PER_MONTH
+    exists = np.where(account_open.notna(), account_open <= as_of, ~(age_months < 0))
+    if not allow_forward:
+        # Nothing was observed about a customer after their reference date
+        exists &= (shift >= 0).to_numpy()
+    df = df[exists].copy()
+    shift = shift[exists]
+
+    days_at = (days_since[exists] - shift).clip(lower=0)
+    df['Days_Since_Last_Transaction'] = days_at.round()
+    df['Last_Transaction_Date'] = as_of - pd.to_timedelta(days_at.fillna(0), unit='D')
+    for column in ('Tenure_Months', 'Account_Age_Months'):
+        if column in df.columns:
+            df[column] = (_numeric(df, column) - shift / DAYS_PER_MONTH).clip(lower=0).round()
+    if 'Age' in df.columns:
+        df['Age'] = _numeric(df, 'Age') - np.floor(shift / DAYS_PER_YEAR)
+    return df
+
+
+def as_of_dates(start=None, end=None, periods=None, every='7D'):
+    """Partition dates: start..end (or `periods` dates ending at `end`, default today) every `every`"""
+    end = pd.Timestamp(end if end else 'today').normalize()
+    if start:
+        periods = len(pd.date_range(start=pd.Timestamp(start).normalize(), end=end, freq=every))
+    # Anchored on end, so a later run with the same spacing lands on the same dates
+    dates = pd.date_range(end=end, periods=periods or 52, freq=every)
+    return [date.date().isoformat() for date in dates]
+
+
+class HistoryStore:
+    """Time-partitioned churn score history (customer_ids.npy, partitions/<date>.npy, manifest.json)"""
+
+    def __init__(self, history_dir=HISTORY_DIR):
+        self.dir = Path(history_dir)
+        self.partition_dir = self.dir / 'partitions'
+        self.manifest_path = self.dir / 'manifest.json'
+        self.ids_path = self.dir / 'customer_ids.npy'
+
+    def manifest(self):
+        """Partition metadata by date ({} for a new store)"""
+        if not self.manifest_path.exists():
+            return {'partitions': {}}
+        with open(self.manifest_path, 'r') as f:
+            return json.load(f)
+
+    def write_manifest(self, manifest):
+        """Atomically replace the manifest"""
+        self.dir.mkdir(parents=True, exist_ok=True)
+        temporary_path = self.manifest_path.with_suffix('.tmp')
+        with open(temporary_path, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(temporary_path, self.manifest_path)
+
+    def customer_ids(self):
+        """Customer ids in store order (positions never change)"""
+        if not self.ids_path.exists():
+            return np.array([], dtype=object)
+        return np.char.decode(np.load(self.ids_path), 'utf-8').astype(object)
+
+    def add_customer_ids(self, ids):
+        """Append unseen ids and return the full id dictionary"""
+        known = self.customer_ids()
+        ids = pd.unique(pd.Series(ids, dtype=object).dropna().astype(str))
+        new = ids[~pd.Index(ids).isin(known)]
+        if len(new):
+            known = np.concatenate([known, new.astype(object)])
+            self.dir.mkdir(parents=True, exist_ok=True)
+            temporary_path = self.dir / 'customer_ids.tmp.npy'
+            np.save(temporary_path, np.char.encode(known.astype(str), 'utf-8'))
+            os.replace(temporary_path, self.ids_path)
+        return known
+
+    def partition_path(self, date):
+        """File of one as-of date"""
+        return self.partition_dir / f'{date}.npy'
+
+    def write_partition(self, date, records):
+        """Atomically write one partition"""
+        self.partition_dir.mkdir(parents=True, exist_ok=True)
+        temporary_path = self.partition_dir / f'{date}.tmp.npy'
+        np.save(temporary_path, records)
+        os.replace(temporary_path, self.partition_path(date))
+
+    def read_partition(self, date):
+        """Memory-mapped records of one partition"""
+        return np.load(self.partition_path(date), mmap_mode='r')
+
+    @staticmethod
+    def kind(entry):
+        """Kind of a manifest entry (entries written before kinds were recorded go by their source)"""
+        return entry.get('kind') or (SNAPSHOT if entry.get('source') == 'snapshots' else DERIVED)
+
+    def has_snapshot(self, date, manifest):
+        """Whether a date already holds a partition scored from a dated snapshot"""
+        entry = manifest['partitions'].get(date)
+        return entry is not None and self.kind(entry) == SNAPSHOT and self.partition_path(date).exists()
+
+    def reusable(self, date, model_version, manifest, kind=DERIVED, extrapolated=False):
+        """Whether a partition was already scored from the same kind of source with this model version
+        (and forward-rolling mode)"""
+        entry = manifest['partitions'].get(date)
+        return (entry is not None and self.kind(entry) == kind and entry.get('model_version') == model_version
+                and entry.get('extrapolated', False) == extrapolated and self.partition_path(date).exists())
+
+
+def score_partition(date, customers, artifacts, id_dictionary, store, chunk_size=DEFAULT_CHUNK_SIZE,
+                    reference_date=None, derive=True, allow_forward=False):
+    """Score all customers as of one date and write its partition; returns the partition summary"""
+    started = time.time()
+    if derive:
+        customers = snapshot_as_of(customers, date, reference_date, allow_forward)
+    elif not isinstance(customers, pd.DataFrame):
+        customers = pd.concat(read_customer_file(customers, chunk_size), ignore_index=True)
+    chunks = (customers.iloc[start:start + chunk_size] for start in range(0, len(customers), chunk_size))
+    scored = list(score_chunks(chunks, artifacts))
+
+    records = np.zeros(len(id_dictionary), dtype=RECORD_DTYPE)
+    records['score'] = ABSENT
+    summary = {'customers': 0, 'mean_churn_score': None, 'expected_churn': 0.0,
+               **{f'{level}_risk': 0 for level in RISK_LEVELS}}
+    if scored:
+        scores = pd.concat(scored, ignore_index=True)
+        scores = scores[scores['customer_id'].notna()].drop_duplicates('customer_id', keep='last')
+        positions = pd.Index(id_dictionary).get_indexer(scores['customer_id'])
+        found = positions >= 0
+        risk = scores['risk_level'].map(RISK_CODES).fillna(0).to_numpy(dtype=np.uint8)
+        records['score'][positions[found]] = np.round(scores['churn_score'].to_numpy()[found] * SCORE_SCALE)
+        records['risk'][positions[found]] = risk[found]
+        counts = np.bincount(risk[found], minlength=len(RISK_LEVELS))
+        churn_score = scores['churn_score'].to_numpy(dtype=float)[found]
+        summary.update({
+            'customers': int(found.sum()),
+            'mean_churn_score': round(float(churn_score.mean()), 3) if found.any() else None,
+            'expected_churn': round(float(churn_score.sum() / 100), 3),
+            **{f'{level}_risk': int(counts[code]) for code, level in enumerate(RISK_LEVELS)},
+        })
+    store.write_partition(date, records)
+    summary['seconds'] = round(time.time() - started, 3)
+    return date, summary
+
+
+def backfill(partitions, store, derive=True, reference_date=None, source=None, chunk_size=DEFAULT_CHUNK_SIZE,
+             n_jobs=-1, force=False, allow_forward=False):
+    """Score the missing partitions ({date: customers DataFrame or snapshot file}) in parallel"""
+    start_time = time.time()
+    artifacts = load_artifacts()
+    model_version = get_model_version()
+    manifest = store.manifest()
+    kind = DERIVED if derive else SNAPSHOT
+
+    if derive:
+        # Exact history is never replaced by an approximation, even with force
+        kept = sorted(date for date in partitions if store.has_snapshot(date, manifest))
+        if kept:
+            print(f"Keeping {len(kept)} partition(s) scored from dated snapshots ({kept[0]} .. {kept[-1]})",
+                  file=sys.stderr)
+            partitions = {date: customers for date, customers in partitions.items() if date not in kept}
+    pending = {date: customers for date, customers in sorted(partitions.items())
+               if force or not store.reusable(date, model_version, manifest, kind, derive and allow_forward)}
+    reused = len(partitions) - len(pending)
+    if reused:
+        print(f"Reusing {reused} of {len(partitions)} partitions scored with {model_version}", file=sys.stderr)
+    if not pending:
+        return manifest
+
+    # Every id that can appear gets its position before the workers start
+    sources = list(pending.values())[:1] if derive else pending.values()
+    ids = [resolve_customer_ids(customers if isinstance(customers, pd.DataFrame) else read_ids(customers, chunk_size))
+           for customers in sources]
+    id_dictionary = store.add_customer_ids(pd.concat(ids, ignore_index=True))
+
+    # Worker processes share this process's thread allocation
+    n_jobs = resolve_jobs(n_jobs)
+    configure_estimator(artifacts[0], split_threads(n_jobs)[1])
+    tasks = (delayed(score_partition)(date, customers, artifacts, id_dictionary, store, chunk_size,
+                                      reference_date, derive, allow_forward)
+             for date, customers in pending.items())
+    done = 0
+    for date, summary in Parallel(n_jobs=n_jobs, return_as='generator_unordered')(tasks):
+        # Recorded as each partition lands, so an interrupted run resumes where it stopped
+        manifest['partitions'][date] = dict(summary, kind=kind, model_version=model_version, source=source,
+                                            extrapolated=derive and allow_forward,
+                                            created_at=datetime.now().isoformat(timespec='seconds'))
+        store.write_manifest(manifest)
+        done += 1
+        print(f"Partition {date}: {summary['customers']:,} customers in {summary['seconds']:.1f}s "
+              f"({done}/{len(pending)}, {time.time() - start_time:.1f}s)", file=sys.stderr)
+    return manifest
+
+
+def read_ids(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Only the customer id columns of a snapshot file (whole rows for JSON lines)"""
+    if Path(path).suffix.lower() == '.csv':
+        return pd.read_csv(path, usecols=lambda column: column in ID_COLUMNS, dtype=str)
+    return pd.concat(read_customer_file(path, chunk_size), ignore_index=True)
+
+
+def snapshot_partitions(paths, chunk_size=DEFAULT_CHUNK_SIZE):
+    """{date: customers} from dated snapshot files (Snapshot_Date column or a date in the file name)"""
+    partitions = {}
+    for path in paths:
+        first = next(iter(read_customer_file(path, 1)), pd.DataFrame())
+        if SNAPSHOT_DATE_COLUMN in first.columns:
+            frame = pd.concat(read_customer_file(path, chunk_size), ignore_index=True)
+            dates = parse_date_series(frame[SNAPSHOT_DATE_COLUMN]).dt.date.astype(str)
+            for date, group in frame.groupby(dates.to_numpy()):
+                partitions[date] = pd.concat([partitions[date], group]) if date in partitions else group
+            continue
+        match = re.search(r'(\d{4}-\d{2}-\d{2})', Path(path).name)
+        if not match:
+            raise ValueError(f"{path}: no {SNAPSHOT_DATE_COLUMN} column and no YYYY-MM-DD date in the file name")
+        # Read by the worker that scores it
+        partitions[match.group(1)] = str(path)
+    return partitions
+
+
+def read_extract(input_path=None, dsn=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """The current customer extract from a file or the customers table"""
+    if dsn is not None or input_path is None:
+        from score_database import connect, stream_customers, transform_customer_rows
+        conn, dialect = connect(dsn)
+        try:
+            chunks = [transform_customer_rows(chunk)
+                      for chunk in stream_customers(conn, dialect, chunk_size=chunk_size, update_all=True)]
+        finally:
+            conn.close()
+    else:
+        chunks = list(read_customer_file(input_path, chunk_size))
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+
+
+def customer_history(store, customer_id):
+    """Churn score and risk level of one customer on every stored date"""
+    ids = store.customer_ids()
+    positions = np.flatnonzero(ids == str(customer_id))
+    history = []
+    if not len(positions):
+        return pd.DataFrame(columns=['date', 'churn_score', 'risk_level'])
+    position = positions[0]
+    for date in sorted(store.manifest()['partitions']):
+        records = store.read_partition(date)
+        if position < len(records) and records['score'][position] != ABSENT:
+            history.append({'date': date, 'churn_score': records['score'][position] / SCORE_SCALE,
+                            'risk_level': RISK_LEVELS[records['risk'][position]]})
+    return pd.DataFrame(history, columns=['date', 'churn_score', 'risk_level'])
+
+
+def portfolio_history(store):
+    """Portfolio summary per stored date (from the manifest, no partition reads)"""
+    partitions = store.manifest()['partitions']
+    columns = ['date', 'customers', 'mean_churn_score', 'expected_churn', 'high_risk', 'medium_risk',
+               'low_risk', 'kind', 'model_version']
+    return pd.DataFrame([dict(entry, date=date, kind=store.kind(entry)) for date, entry in sorted(partitions.items())],
+                        columns=columns)
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Historical churn scoring of point-in-time snapshots')
+    parser.add_argument('--history-dir', default=str(HISTORY_DIR), help='Time-partitioned score store')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    derive = subparsers.add_parser('derive', help='Roll the current extract back to each as-of date and score it')
+    derive.add_argument('input', nargs='?', help='Customer CSV / JSON lines file (default: the customers table)')
+    derive.add_argument('--dsn', default=None,
+                        help='PostgreSQL URL or sqlite:///path (default: DATABASE_URL or DB_* settings)')
+    derive.add_argument('--start', help='First as-of date (default: --periods dates back from --end)')
+    derive.add_argument('--end', help='Last as-of date (default: the latest reference date of the extract)')
+    derive.add_argument('--periods', type=int, default=52, help='Number of as-of dates when --start is not given')
+    derive.add_argument('--every', default='7D', help='Spacing of the as-of dates (pandas frequency, e.g. 7D, 1D)')
+    derive.add_argument('--reference-date',
+                        help='Date the extract was taken (default: per customer, Last_Transaction_Date '
+                             '+ Days_Since_Last_Transaction)')
+    derive.add_argument('--allow-forward', action='store_true',
+                        help='Also roll customers forward past their reference date (extrapolated, '
+                             'not observed history)')
+
+    snapshots = subparsers.add_parser('snapshots', help='Score dated snapshot files')
+    snapshots.add_argument('paths', nargs='+', help=f'Files with a {SNAPSHOT_DATE_COLUMN} column or a '
+                                                    'YYYY-MM-DD date in the name')
+
+    for command in (derive, snapshots):
+        command.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        command.add_argument('--n-jobs', type=int, default=-1, help='Partitions scored in parallel')
+        command.add_argument('--force', action='store_true', help='Rescore partitions that already exist')
+
+    customer = subparsers.add_parser('customer', help="Print one customer's score history")
+    customer.add_argument('customer_id')
+    portfolio = subparsers.add_parser('portfolio', help='Print the portfolio summary per date')
+    portfolio.add_argument('--output', help='Also write it as CSV')
+    args = parser.parse_args()
+    store = HistoryStore(args.history_dir)
+
+    if args.command == 'customer':
+        history = customer_history(store, args.customer_id)
+        print(history.to_string(index=False) if not history.empty else f"No history for {args.customer_id}")
+        return
+    if args.command == 'portfolio':
+        history = portfolio_history(store)
+        print(history.to_string(index=False) if not history.empty else 'No partitions')
+        if args.output:
+            history.to_csv(args.output, index=False)
+        return
+
+    govern(role='backfill_scoring.py', quiet=False)
+    install_signal_handler()
+    start_time = time.time()
+    if args.command == 'derive':
+        extract = read_extract(args.input, args.dsn, args.chunk_size)
+        latest = latest_reference_date(extract, args.reference_date)
+        dates = as_of_dates(args.start, args.end or latest, args.periods, args.every)
+        if dates and pd.Timestamp(dates[-1]) > latest and not args.allow_forward:
+            parser.error(f"as-of dates after the extract's latest reference date {latest.date()} "
+                         "would be extrapolated; pass an earlier --end or --allow-forward")
+        source = f"derive:{args.input or 'customers table'}"
+        manifest = backfill({date: extract for date in dates}, store, derive=True,
+                            reference_date=args.reference_date, source=source, chunk_size=args.chunk_size,
+                            n_jobs=args.n_jobs, force=args.force, allow_forward=args.allow_forward)
+    else:
+        partitions = snapshot_partitions(args.paths, args.chunk_size)
+        dates = sorted(partitions)
+        manifest = backfill(partitions, store, derive=False, source='snapshots', chunk_size=args.chunk_size,
+                            n_jobs=args.n_jobs, force=args.force)
+
+    print(f"History has {len(manifest['partitions'])} partitions ({dates[0]} .. {dates[-1]} requested) "
+          f"in {time.time() - start_time:.1f}s -> {store.dir}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
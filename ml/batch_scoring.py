@@ -0,0 +1,138 @@
+"""
+Batch Scoring Engine for BK Pulse Churn Prediction
+Scores large customer populations in vectorized chunks.
+Used by the database scoring job and for scoring CSV / JSON lines files directly.
+Scored features are added to a drift monitor (see drift_monitor.py) when
+reference histograms are available.
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import pandas as pd
+
+from predict import load_artifacts, predict_frame, get_model_version
+from drift_monitor import DRIFT_REPORT_PATH, load_monitor
+from customer_batch import ID_COLUMNS, CustomerBatch
+from resource_governor import govern
+from scoring_metrics import METRICS, backend_name, write_metrics
+from scoring_profiler import install_signal_handler
+
+DEFAULT_CHUNK_SIZE = 50000
+
+
+def resolve_customer_ids(chunk):
+    """Return the customer identifier column of a chunk as strings"""
+    if isinstance(chunk, CustomerBatch):
+        return chunk.customer_id_series()
+    ids = pd.Series(None, index=chunk.index, dtype=object)
+    for col in ID_COLUMNS:
+        if col in chunk.columns:
+            ids = ids.where(ids.notna(), chunk[col])
+    return ids.astype(str).where(ids.notna())
+
+
+def score_chunk(chunk, artifacts, monitor=None, shadow=None):
+    """Score one chunk of customers and attach their customer_id"""
+    model, scaler, encoders = artifacts
+    scores = predict_frame(chunk, model, scaler, encoders, monitor=monitor, shadow=shadow)
+    scores.insert(0, 'customer_id', resolve_customer_ids(chunk))
+    return scores
+
+
+def score_chunks(chunks, artifacts=None, monitor=None, shadow=None):
+    """Score an iterable of customer DataFrames, yielding one result frame per chunk
+
+    Artifacts are loaded once for the whole run. A chunk that fails to score
+    is reported on stderr and skipped so one bad chunk does not stop a full rescore.
+    """
+    if artifacts is None:
+        artifacts = load_artifacts()
+
+    for chunk_number, chunk in enumerate(chunks, start=1):
+        if chunk.empty:
+            continue
+        try:
+            yield score_chunk(chunk, artifacts, monitor, shadow)
+        except Exception as e:
+            METRICS.errors.inc(backend_name(artifacts[0]), 'score_chunk')
+            print(f"Warning: Could not score chunk {chunk_number} ({len(chunk)} rows): {e}", file=sys.stderr)
+
+
+def read_customer_file(input_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Stream a CSV or JSON lines customer file in chunks"""
+    input_path = Path(input_path)
+    if input_path.suffix.lower() in ('.jsonl', '.ndjson', '.json'):
+        return pd.read_json(input_path, lines=True, chunksize=chunk_size, dtype=False)
+    return pd.read_csv(input_path, chunksize=chunk_size, low_memory=False)
+
+
+def read_customer_batches(input_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Stream a CSV or JSON lines customer file as CustomerBatch chunks"""
+    if Path(input_path).suffix.lower() in ('.jsonl', '.ndjson'):
+        return CustomerBatch.iter_json_lines(input_path, chunk_size)
+    return (CustomerBatch.from_frame(chunk) for chunk in read_customer_file(input_path, chunk_size))
+
+
+def score_file(input_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE, drift_report=DRIFT_REPORT_PATH,
+               shadow_models=None, shadow_log=None):
+    """Score every customer in a file and write the results as CSV
+
+    shadow_models ('all' or a comma-separated list, see shadow_scoring.py) also
+    scores the model rows with challenger models in the background.
+    """
+    start_time = time.time()
+    total = 0
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    artifacts = load_artifacts()
+    monitor = load_monitor() if drift_report else None
+    shadow = None
+    if shadow_models:
+        from shadow_scoring import start_shadow
+        shadow = start_shadow(shadow_models, shadow_log)
+
+    header = True
+    for scores in score_chunks(read_customer_batches(input_path, chunk_size), artifacts, monitor, shadow):
+        scores.to_csv(output_path, mode='w' if header else 'a', header=header, index=False)
+        header = False
+        total += len(scores)
+        print(f"Scored {total:,} customers...", file=sys.stderr)
+
+    elapsed = time.time() - start_time
+    print(f"Scored {total:,} customers in {elapsed:.1f}s -> {output_path}", file=sys.stderr)
+    if monitor is not None:
+        monitor.write_report(drift_report, model_version=get_model_version())
+    if shadow is not None:
+        shadow.close()
+    return total
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Score a customer file in vectorized chunks')
+    parser.add_argument('input', help='Customer CSV or JSON lines file')
+    parser.add_argument('output', help='Output CSV file for churn scores')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f'Rows per scoring chunk (default: {DEFAULT_CHUNK_SIZE})')
+    parser.add_argument('--drift-report', default=str(DRIFT_REPORT_PATH),
+                        help='Where to write the population drift report ("" to disable)')
+    parser.add_argument('--shadow', nargs='?', const='all', default=None, metavar='MODELS',
+                        help='Also score with challenger models: "all" (default) or e.g. lightgbm,random_forest')
+    parser.add_argument('--shadow-log', help='CSV of per-customer production and challenger probabilities')
+    parser.add_argument('--metrics-output', help='Where to write the run metrics JSON '
+                        '(default: data/monitoring/metrics/batch_scoring.json)')
+    args = parser.parse_args()
+    govern(role='batch_scoring.py')
+    install_signal_handler()
+
+    score_file(args.input, args.output, chunk_size=args.chunk_size, drift_report=args.drift_report,
+               shadow_models=args.shadow, shadow_log=args.shadow_log)
+    write_metrics('batch_scoring', args.metrics_output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+BK / BNR Business Rules for BK Pulse Churn Prediction
+Declarative rule table applied before the model in the batch scoring path.
+Mirrors the rules in server/utils/mlPredictor.js (predictChurn).
+
+Each rule is a list of (column, operator, value) conditions that must all hold.
+Rules are evaluated as boolean masks over a whole batch; the first matching
+rule decides the row, and decided rows never reach feature building or the model.
+"""
+
+import numpy as np
+import pandas as pd
+
+BUSINESS_RULES = [
+    {
+        'name': 'savings_fixed_deposit_no_churn',
+        'conditions': [('Account_Type', 'in', ['Savings', 'Fixed Deposit'])],
+        'churn_probability': 0.0,
+        'churn_prediction': 0,
+        'risk_level': 'low',
+        'note': 'Savings/Fixed Deposit accounts cannot churn per BNR regulations'
+    },
+    {
+        'name': 'current_account_inactive_12_months',
+        'conditions': [
+            ('Account_Type', '==', 'Current'),
+            ('Days_Since_Last_Transaction', '>=', 365)
+        ],
+        'churn_probability': 0.95,
+        'churn_prediction': 1,
+        'risk_level': 'high',
+        'note': 'No transaction in 12+ months - already churned per BK rules'
+    },
+]
+
+RULES_BY_NAME = {rule['name']: rule for rule in BUSINESS_RULES}
+
+# Input spellings accepted for each rule column (same precedence as mlPredictor.js)
+RULE_COLUMN_ALIASES = {
+    'Account_Type': ['Account_Type', 'account_type', 'product_type'],
+    'Days_Since_Last_Transaction': ['Days_Since_Last_Transaction', 'days_since_last_transaction',
+                                    'daysSinceLastTransaction'],
+}
+
+OPERATORS = {
+    '==': lambda series, value: series == value,
+    '!=': lambda series, value: series != value,
+    '>=': lambda series, value: series >= value,
+    '>': lambda series, value: series > value,
+    '<=': lambda series, value: series <= value,
+    '<': lambda series, value: series < value,
+    'in': lambda series, value: series.isin(value),
+}
+
+
+def resolve_rule_column(df, column):
+    """Coalesce every accepted spelling of a rule column into one Series"""
+    resolved = pd.Series(None, index=df.index, dtype=object)
+    for alias in RULE_COLUMN_ALIASES.get(column, [column]):
+        if alias in df.columns:
+            resolved = resolved.where(resolved.notna(), df[alias])
+    if column == 'Days_Since_Last_Transaction':
+        return pd.to_numeric(resolved, errors='coerce').fillna(0)
+    return resolved
+
+
+def evaluate_business_rules(df, rules=BUSINESS_RULES):
+    """Return the name of the rule deciding each row (None where no rule applies)"""
+    decided_by = pd.Series(None, index=df.index, dtype=object)
+    columns = {}
+    for rule in rules:
+        mask = decided_by.isna().to_numpy(copy=True)
+        if not mask.any():
+            break
+        for column, operator, value in rule['conditions']:
+            if column not in columns:
+                columns[column] = resolve_rule_column(df, column)
+            mask &= OPERATORS[operator](columns[column], value).fillna(False).to_numpy(dtype=bool)
+        decided_by[mask] = rule['name']
+    return decided_by
+
+
+def rule_outcomes(rule_names):
+    """Map rule names to their fixed (churn_probability, churn_prediction, risk_level) outcomes"""
+    names = np.asarray(rule_names, dtype=object)
+    return (
+        np.array([RULES_BY_NAME[name]['churn_probability'] for name in names], dtype=float),
+        np.array([RULES_BY_NAME[name]['churn_prediction'] for name in names], dtype=int),
+        np.array([RULES_BY_NAME[name]['risk_level'] for name in names], dtype=object),
+    )
@@ -0,0 +1,347 @@
+"""
+Budget-Constrained Retention Campaign Optimizer for BK Pulse
+Chooses which customers to target, and with which incentive, so the expected
+saved customer value is as large as possible within a campaign budget.
+
+Incentives, their cost per segment, eligibility and expected retention uplift
+come from retention_incentives.json (modelled on the Bank of Kigali Customer
+Retention Incentives Guide). Offering incentive i to a customer with churn
+probability p and value V saves p * uplift_i * V in expectation at cost c_i.
+
+Giving at most one incentive per customer under a campaign budget and
+per-segment budget caps is a multiple-choice knapsack, solved through its LP
+relaxation: at a price λ per RWF of budget every customer independently takes
+the incentive with the best positive saved value - λ * cost, and λ is found by
+bisection so spending fits the budget (a segment whose cap binds gets its own,
+higher price). Every step is a vectorized pass over a flat array of eligible
+(customer, incentive) pairs, so millions of candidates take seconds.
+
+Usage:
+    python campaign_optimizer.py optimize customers.csv --budget 50000000 -o campaign.csv
+    python campaign_optimizer.py optimize customers.csv --scores scores.csv --budget 50000000 -o campaign.csv
+"""
+
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from predict import load_artifacts, predict_frame, prepare_features_batch
+from business_rules import OPERATORS
+from batch_scoring import DEFAULT_CHUNK_SIZE, resolve_customer_ids, read_customer_file
+
+BASE_DIR = Path(__file__).parent
+INCENTIVES_CONFIG_PATH = BASE_DIR / 'retention_incentives.json'
+
+SEGMENT_COLUMNS = ['Customer_Segment', 'customer_segment', 'segment']
+PRICE_PRECISION = 1e-7          # Relative precision of the budget price bisection
+UNKNOWN_SEGMENT = 'Unknown'
+
+
+def load_incentive_config(path=INCENTIVES_CONFIG_PATH):
+    """Read the retention incentives configuration"""
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def condition_columns(config):
+    """Feature columns referenced by incentive eligibility conditions"""
+    columns = {'Balance', 'Num_Products'}
+    for incentive in config['incentives']:
+        columns.update(column for column, _, _ in incentive.get('conditions', []))
+    return sorted(columns - {'Customer_Segment'})
+
+
+def resolve_segments(customers):
+    """Customer segment of every row (first available spelling)"""
+    segments = pd.Series(None, index=customers.index, dtype=object)
+    for col in SEGMENT_COLUMNS:
+        if col in customers.columns:
+            segments = segments.where(segments.notna(), customers[col])
+    return segments.fillna(UNKNOWN_SEGMENT).astype(str)
+
+
+def customer_values(candidates, config):
+    """Expected value of keeping each customer over the planning horizon (RWF)"""
+    settings = config['customer_value']
+    annual = (candidates['Balance'].clip(lower=0) * settings['balance_margin']
+              + candidates['Num_Products'].clip(lower=0) * settings['product_annual_value'])
+    return (annual * settings['horizon_years']).to_numpy(dtype=np.float64)
+
+
+def build_candidates(customers, churn_probability, encoders, config, risk_level=None):
+    """Candidate frame (one row per customer) from raw customers and their churn probabilities
+
+    churn_probability can come from predict_frame / batch scoring or from the
+    churn_probability of every predict_batch() result, in the same order.
+    """
+    features = prepare_features_batch(customers, encoders)
+    candidates = features[condition_columns(config)].copy()
+    candidates.insert(0, 'customer_id', resolve_customer_ids(customers).to_numpy(dtype=object))
+    candidates.insert(1, 'Customer_Segment', resolve_segments(customers).to_numpy(dtype=object))
+    candidates.insert(2, 'churn_probability', np.asarray(churn_probability, dtype=np.float64))
+    if risk_level is not None:
+        candidates.insert(3, 'risk_level', np.asarray(risk_level, dtype=object))
+    candidates['customer_value'] = customer_values(candidates, config)
+    return candidates.reset_index(drop=True)
+
+
+def segment_table(segment_names, mapping, default=0):
+    """Per-segment setting for each factorized segment (names matched case-insensitively, 'default' otherwise)"""
+    lowered = {str(key).lower(): value for key, value in mapping.items()}
+    default = lowered.get('default', default)
+    return np.array([lowered.get(str(segment).lower(), default) for segment in segment_names], dtype=np.float64)
+
+
+def incentive_pairs(candidates, config):
+    """Flat arrays of every eligible (customer, incentive) pair worth its cost
+
+    Returns (owner, incentive, cost, value) sorted by owner: the candidate row,
+    the position of the incentive in the config, its cost and the expected
+    saved value. Pairs below their incentive's min_return are dropped here.
+    """
+    probability = candidates['churn_probability'].to_numpy(dtype=np.float64)
+    value_at_risk = probability * candidates['customer_value'].to_numpy(dtype=np.float64)
+    balance = candidates['Balance'].clip(lower=0).to_numpy(dtype=np.float64)
+    segment_codes, segment_names = pd.factorize(candidates['Customer_Segment'])
+    default_return = config.get('min_return', 1.0)
+
+    owners, incentives, costs, values = [], [], [], []
+    for position, incentive in enumerate(config['incentives']):
+        eligible = value_at_risk > 0
+        for column, operator, threshold in incentive.get('conditions', []):
+            eligible &= OPERATORS[operator](candidates[column], threshold).fillna(False).to_numpy(dtype=bool)
+        rows = np.flatnonzero(eligible)
+        if rows.size == 0:
+            continue
+        cost = segment_table(segment_names, incentive['cost'])[segment_codes[rows]]
+        cost += balance[rows] * incentive.get('cost_balance_rate', 0.0)
+        value = value_at_risk[rows] * incentive['uplift']
+        worth = (value >= cost * incentive.get('min_return', default_return)) & (value > 0)
+        owners.append(rows[worth])
+        incentives.append(np.full(worth.sum(), position, dtype=np.int16))
+        costs.append(cost[worth])
+        values.append(value[worth])
+
+    if not owners:
+        empty = np.array([], dtype=np.float64)
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int16), empty, empty
+    owner = np.concatenate(owners)
+    order = np.argsort(owner, kind='stable')
+    return owner[order], np.concatenate(incentives)[order], np.concatenate(costs)[order], np.concatenate(values)[order]
+
+
+def pack_pairs(owner):
+    """Dense layout of owner-sorted pairs: one row per customer with offers, -1 in unused slots"""
+    if len(owner) == 0:
+        return np.empty((0, 0), dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, owner[1:] != owner[:-1]])
+    counts = np.diff(np.r_[starts, len(owner)])
+    layout = np.full((len(starts), counts.max()), -1, dtype=np.int64)
+    layout[np.repeat(np.arange(len(starts)), counts), np.arange(len(owner)) - np.repeat(starts, counts)] = \
+        np.arange(len(owner))
+    return layout
+
+
+def choose(layout, cost, value, price):
+    """Pair positions each customer takes at a budget price (scalar or one price per layout row)
+
+    cost and value are in the dense layout (unused slots: cost 0, value -inf).
+    """
+    if layout.size == 0:
+        return np.array([], dtype=np.int64)
+    gain = value - np.reshape(price, (-1, 1)) * cost
+    best = gain.argmax(axis=1)
+    rows = np.flatnonzero(gain[np.arange(len(best)), best] > 0)
+    return layout[rows, best[rows]]
+
+
+def find_price(layout, cost, value, budget, floor, floors=None):
+    """Smallest price >= floor (and >= floors per row) at which the chosen pairs cost at most budget"""
+    def spend(price):
+        price = price if floors is None else np.maximum(price, floors)
+        gain = value - np.reshape(price, (-1, 1)) * cost
+        best = gain.argmax(axis=1)
+        rows = np.arange(len(best))
+        return cost[rows, best][gain[rows, best] > 0].sum()
+
+    if layout.size == 0 or spend(floor) <= budget:
+        return floor
+    low = floor
+    high = max(float(np.max(value / np.maximum(cost, 1e-9))), floor) * 1.01 + 1e-9
+    while high - low > high * PRICE_PRECISION:
+        middle = (low + high) / 2
+        if spend(middle) <= budget:
+            high = middle
+        else:
+            low = middle
+    return high
+
+
+def segment_budgets(config, budget, segments):
+    """Budget cap (RWF) per segment present in the candidates"""
+    caps = {}
+    settings = {str(name).lower(): spec for name, spec in config.get('segments', {}).items()}
+    for segment in segments:
+        spec = settings.get(str(segment).lower())
+        if spec is None:
+            continue
+        caps[segment] = spec['budget'] if 'budget' in spec else spec['budget_share'] * budget
+    return caps
+
+
+def optimize_campaign(candidates, budget, config=None):
+    """Pick the customer/incentive assignment with the largest expected saved value within budget
+
+    Returns (assignments, summary): one row per targeted customer, sorted by
+    expected saved value, and a summary of spend and value per segment and incentive.
+    """
+    config = config or load_incentive_config()
+    floor = config.get('min_return', 1.0)
+    owner, incentive, pair_cost, pair_value = incentive_pairs(candidates, config)
+    layout = pack_pairs(owner)
+    cost = np.where(layout >= 0, pair_cost[layout], 0.0) if layout.size else np.empty((0, 0))
+    value = np.where(layout >= 0, pair_value[layout], -np.inf) if layout.size else np.empty((0, 0))
+
+    # Segment caps first: each binding segment gets its own price, then one campaign-wide price on top
+    segment_codes, segment_names = pd.factorize(candidates['Customer_Segment'])
+    row_segment = segment_codes[owner[layout[:, 0]]] if layout.size else np.array([], dtype=np.int64)
+    segment_price = np.full(len(segment_names), floor)
+    for segment, cap in segment_budgets(config, budget, segment_names).items():
+        code = segment_names.get_loc(segment)
+        in_segment = row_segment == code
+        segment_price[code] = find_price(layout[in_segment], cost[in_segment], value[in_segment], cap, floor)
+    floors = segment_price[row_segment]
+    price = find_price(layout, cost, value, budget, floor, floors)
+    chosen = choose(layout, cost, value, np.maximum(price, floors))
+
+    rows = owner[chosen]
+    incentives = config['incentives']
+    names = np.array([item['name'] for item in incentives], dtype=object)
+    labels = np.array([item.get('label', item['name']) for item in incentives], dtype=object)
+    zones = np.array([item.get('zone') for item in incentives], dtype=object)
+    assignments = pd.DataFrame({
+        'customer_id': candidates['customer_id'].to_numpy(dtype=object)[rows],
+        'segment': candidates['Customer_Segment'].to_numpy(dtype=object)[rows],
+        'churn_probability': candidates['churn_probability'].to_numpy()[rows],
+        'customer_value': np.round(candidates['customer_value'].to_numpy()[rows], 2),
+        'incentive': names[incentive[chosen]],
+        'incentive_label': labels[incentive[chosen]],
+        'zone': zones[incentive[chosen]],
+        'cost': np.round(pair_cost[chosen], 2),
+        'expected_saved_value': np.round(pair_value[chosen], 2),
+        'return_per_rwf': np.round(pair_value[chosen] / np.maximum(pair_cost[chosen], 1e-9), 3),
+    })
+    if 'risk_level' in candidates.columns:
+        assignments.insert(3, 'risk_level', candidates['risk_level'].to_numpy(dtype=object)[rows])
+    assignments = assignments.sort_values('expected_saved_value', ascending=False, ignore_index=True)
+    return assignments, summarize(assignments, candidates, budget, price, config, len(owner))
+
+
+def summarize(assignments, candidates, budget, price, config, n_pairs):
+    """Spend and expected saved value of a campaign, overall and per segment and incentive"""
+    caps = segment_budgets(config, budget, candidates['Customer_Segment'].unique())
+    by_segment = assignments.groupby('segment').agg(
+        customers=('customer_id', 'size'), spent=('cost', 'sum'), expected_saved_value=('expected_saved_value', 'sum'))
+    by_incentive = assignments.groupby('incentive').agg(
+        customers=('customer_id', 'size'), spent=('cost', 'sum'), expected_saved_value=('expected_saved_value', 'sum'))
+    return {
+        'budget': float(budget),
+        'spent': round(float(assignments['cost'].sum()), 2),
+        'customers_considered': int(len(candidates)),
+        'eligible_pairs': int(n_pairs),
+        'customers_targeted': int(len(assignments)),
+        'expected_saved_value': round(float(assignments['expected_saved_value'].sum()), 2),
+        'budget_price': round(float(price), 6),
+        'segments': {
+            str(segment): {
+                'budget_cap': round(float(caps[segment]), 2) if segment in caps else None,
+                'customers': int(row.customers), 'spent': round(float(row.spent), 2),
+                'expected_saved_value': round(float(row.expected_saved_value), 2),
+            }
+            for segment, row in by_segment.iterrows()
+        },
+        'incentives': {
+            str(name): {
+                'customers': int(row.customers), 'spent': round(float(row.spent), 2),
+                'expected_saved_value': round(float(row.expected_saved_value), 2),
+            }
+            for name, row in by_incentive.iterrows()
+        },
+    }
+
+
+def optimize_predictions(customers_data, predictions, budget, config=None):
+    """Optimize a campaign over customer dicts and their predict_batch() results"""
+    config = config or load_incentive_config()
+    _, _, encoders = load_artifacts()
+    customers = pd.DataFrame(customers_data)
+    candidates = build_candidates(
+        customers, [prediction.get('churn_probability', 0.0) for prediction in predictions], encoders, config,
+        risk_level=[prediction.get('risk_level') for prediction in predictions]
+    )
+    return optimize_campaign(candidates, budget, config)
+
+
+def load_candidates(input_path, config, scores_path=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Candidates for every customer in a file, scored here or joined from a batch_scoring output"""
+    model, scaler, encoders = load_artifacts()
+    scores = None
+    if scores_path:
+        scores = pd.read_csv(scores_path, usecols=['customer_id', 'churn_probability', 'risk_level'],
+                             dtype={'customer_id': str}).drop_duplicates('customer_id', keep='last')
+        scores = scores.set_index('customer_id')
+
+    frames = []
+    for chunk in read_customer_file(input_path, chunk_size):
+        if scores is not None:
+            matched = scores.reindex(resolve_customer_ids(chunk))
+            probability = matched['churn_probability'].fillna(0.0).to_numpy()
+            risk_level = matched['risk_level'].to_numpy(dtype=object)
+        else:
+            scored = predict_frame(chunk, model, scaler, encoders)
+            probability, risk_level = scored['churn_probability'].to_numpy(), scored['risk_level'].to_numpy()
+        frames.append(build_candidates(chunk, probability, encoders, config, risk_level=risk_level))
+        print(f"Prepared {sum(len(frame) for frame in frames):,} candidates...", file=sys.stderr)
+    return pd.concat(frames, ignore_index=True)
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Budget-constrained retention campaign targeting')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    optimize = subparsers.add_parser('optimize', help='Choose customers and incentives for a campaign budget')
+    optimize.add_argument('input', help='Customer CSV or JSON lines file')
+    optimize.add_argument('--budget', type=float, required=True, help='Campaign budget (RWF)')
+    optimize.add_argument('--scores', help='batch_scoring.py output to use instead of scoring here')
+    optimize.add_argument('--config', default=str(INCENTIVES_CONFIG_PATH), help='Retention incentives config')
+    optimize.add_argument('-o', '--output', required=True, help='Output CSV of assignments')
+    optimize.add_argument('--summary', help='Write the campaign summary JSON here (default: stdout)')
+    optimize.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    config = load_incentive_config(args.config)
+    candidates = load_candidates(args.input, config, args.scores, args.chunk_size)
+    prepared = time.time()
+    assignments, summary = optimize_campaign(candidates, args.budget, config)
+    print(f"Optimized {len(candidates):,} customers ({summary['eligible_pairs']:,} eligible offers) "
+          f"in {time.time() - prepared:.1f}s", file=sys.stderr)
+
+    assignments.to_csv(args.output, index=False)
+    if args.summary:
+        with open(args.summary, 'w') as f:
+            json.dump(summary, f, indent=2)
+    else:
+        print(json.dumps(summary, indent=2))
+    print(f"Targeted {summary['customers_targeted']:,} customers for {summary['spent']:,.0f} of "
+          f"{summary['budget']:,.0f} RWF (expected saved value {summary['expected_saved_value']:,.0f} RWF) "
+          f"in {time.time() - start_time:.1f}s -> {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
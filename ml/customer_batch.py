@@ -0,0 +1,349 @@
+"""
+Compact Customer Batch Container for BK Pulse Churn Prediction
+Holds a batch of customer inputs as typed column arrays instead of a list of
+dicts or an object-dtype DataFrame:
+  - numeric inputs as float64 arrays (NaN where missing)
+  - Balance / Average_Transaction_Value cleaned to float64 while reading
+  - categorical inputs and dates as int32 codes into a small interned table of
+    distinct values, so dates are parsed and categories encoded once per
+    distinct value rather than once per customer
+  - customer ids as a fixed-width string array
+
+Key spellings (camelCase, snake_case, TitleCase) are resolved once per distinct
+record layout (set of keys), not per record. A batch is built in one pass from JSON lines, dicts or a
+DataFrame, and predict_frame() / prepare_features_batch() consume it directly.
+batch.record(i) gives a dict-like view with __slots__ for single-row access.
+"""
+
+import re
+import json
+from array import array
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+from predict import (
+    FEATURE_COLS, CATEGORICAL_COLS, COLUMN_MAPPING,
+    clean_numeric_series, parse_date_series, normalize_customer_columns
+)
+from business_rules import RULE_COLUMN_ALIASES
+
+ID_COLUMNS = ['customer_id', 'Customer_ID', 'id']
+MONEY_COLS = ['Balance', 'Average_Transaction_Value']
+DATE_COLS = ['Account_Open_Date', 'Last_Transaction_Date']
+CODED_COLS = list(CATEGORICAL_COLS) + DATE_COLS
+NUMERIC_COLS = [
+    col for col in FEATURE_COLS
+    if not col.endswith('_encoded') and col not in MONEY_COLS
+    and not col.endswith('_Month') and not col.endswith('_Year')
+]
+DEFAULTS = {'Age': 50}  # Missing numeric inputs default to 0, as in prepare_features
+
+MONEY_PATTERN = re.compile(r'[\s,]|RWF|USD|EUR')
+
+
+def _key_ranks():
+    """Map every accepted input key to (column, precedence); lower precedence wins"""
+    ranks = {}
+    aliases = dict(COLUMN_MAPPING)
+    for col_name in list(CATEGORICAL_COLS) + MONEY_COLS:
+        aliases[col_name.lower()] = col_name
+    for col in CODED_COLS + MONEY_COLS + NUMERIC_COLS:
+        ranks[col] = (col, 0)
+    # Same order as normalize_customer_columns: earlier aliases fill gaps first
+    for rank, (alias, col) in enumerate(aliases.items(), start=1):
+        ranks.setdefault(alias, (col, rank))
+    # Rule-only spellings (e.g. product_type) are kept under their own name for the rules
+    for col, rule_aliases in RULE_COLUMN_ALIASES.items():
+        for alias in rule_aliases:
+            ranks.setdefault(alias, (alias, 0))
+    for rank, col in enumerate(ID_COLUMNS):
+        ranks[col] = ('customer_id', rank)
+    return ranks
+
+
+KEY_RANKS = _key_ranks()
+RULE_ONLY_COLS = [col for col, (target, _) in KEY_RANKS.items() if target == col and col not in
+                  CODED_COLS + MONEY_COLS + NUMERIC_COLS and col != 'customer_id']
+
+
+def _to_float(value):
+    """float() that returns NaN for anything non-numeric (like pd.to_numeric(errors='coerce'))"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _to_money(value):
+    """Per-value equivalent of clean_numeric_series (missing / unparseable -> 0.0)"""
+    if isinstance(value, str):
+        value = MONEY_PATTERN.sub('', value)
+    value = _to_float(value)
+    return 0.0 if value != value else value
+
+
+class CustomerRecord:
+    """Read-only, dict-like view of one customer in a CustomerBatch"""
+    __slots__ = ('batch', 'position')
+
+    def __init__(self, batch, position):
+        self.batch = batch
+        self.position = position
+
+    def get(self, key, default=None):
+        value = self.batch.value(KEY_RANKS.get(key, (key, 0))[0], self.position)
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def to_dict(self):
+        """Plain dict with the resolved column names"""
+        return {col: value for col in self.batch.column_names()
+                if (value := self.batch.value(col, self.position)) is not None}
+
+    def __repr__(self):
+        return f"CustomerRecord({self.to_dict()!r})"
+
+
+class CustomerBatch:
+    """Typed, column-oriented batch of customer inputs"""
+
+    def __init__(self, numeric, codes, categories, customer_ids, index=None):
+        self.numeric = numeric            # column -> float64 array
+        self.codes = codes                # column -> int32 codes (-1 = missing)
+        self.categories = categories      # column -> object array of distinct raw values
+        self.customer_ids = customer_ids  # fixed-width str array ('' = missing)
+        self.index = pd.RangeIndex(len(customer_ids)) if index is None else index
+
+    def __len__(self):
+        return len(self.customer_ids)
+
+    @property
+    def empty(self):
+        return len(self) == 0
+
+    def __getitem__(self, selection):
+        """Sub-batch for a boolean mask or integer positions (shares the category tables)"""
+        selection = np.asarray(selection)
+        return CustomerBatch(
+            {col: values[selection] for col, values in self.numeric.items()},
+            {col: codes[selection] for col, codes in self.codes.items()},
+            self.categories,
+            self.customer_ids[selection],
+            self.index[selection]
+        )
+
+    def column_names(self):
+        return ['customer_id'] + list(self.codes) + list(self.numeric)
+
+    def value(self, col, position):
+        """Decoded value of one cell (None if missing or unknown column)"""
+        if col == 'customer_id':
+            return str(self.customer_ids[position]) or None
+        if col in self.codes:
+            code = self.codes[col][position]
+            return self.categories[col][code] if code >= 0 else None
+        if col in self.numeric:
+            value = self.numeric[col][position]
+            return None if np.isnan(value) else float(value)
+        return None
+
+    def record(self, position):
+        return CustomerRecord(self, position)
+
+    def __iter__(self):
+        return (CustomerRecord(self, position) for position in range(len(self)))
+
+    def nbytes(self):
+        """Memory held by the column arrays (category tables excluded)"""
+        return (sum(values.nbytes for values in self.numeric.values())
+                + sum(codes.nbytes for codes in self.codes.values()) + self.customer_ids.nbytes)
+
+    # -- construction --------------------------------------------------------
+
+    @classmethod
+    def from_records(cls, records):
+        """Build a batch from an iterable of customer dicts in one pass"""
+        # Growable typed buffers (array.array), turned into numpy arrays without copying
+        numeric_values = {}
+        codes = {}
+        tables = {}
+        customer_ids = []
+        plans = {}
+
+        def interner(table):
+            def intern(value):
+                if not isinstance(value, str):
+                    value = str(value)
+                code = table.get(value)
+                if code is None:
+                    code = table[value] = len(table)
+                return code
+            return intern
+
+        def layout_plan(keys, position):
+            """Resolve one record layout (its key tuple) to per-column candidate keys, by precedence"""
+            candidates = {}
+            for key in keys:
+                col, rank = KEY_RANKS.get(key, (None, 0))
+                if col is not None:
+                    candidates.setdefault(col, []).append((rank, key))
+            id_keys = [key for _, key in sorted(candidates.pop('customer_id', []))]
+
+            plan = []
+            for col, ranked in candidates.items():
+                keys_by_rank = tuple(key for _, key in sorted(ranked))
+                if col in MONEY_COLS or col in NUMERIC_COLS:
+                    if col not in numeric_values:
+                        numeric_values[col] = array('d', [np.nan]) * position
+                        plans.clear()  # Older layouts must now pad this column too
+                    convert = _to_money if col in MONEY_COLS else _to_float
+                    plan.append((keys_by_rank, numeric_values[col].append, convert, np.nan))
+                else:
+                    if col not in codes:
+                        codes[col] = array('i', [-1]) * position
+                        tables[col] = {}
+                        plans.clear()
+                    plan.append((keys_by_rank, codes[col].append, interner(tables[col]), -1))
+
+            padding = [(column.append, np.nan) for col, column in numeric_values.items() if col not in candidates]
+            padding += [(column.append, -1) for col, column in codes.items() if col not in candidates]
+            return id_keys, plan, padding
+
+        for position, record in enumerate(records):
+            layout = tuple(record)
+            entry = plans.get(layout)
+            if entry is None:
+                entry = plans[layout] = layout_plan(layout, position)
+            id_keys, plan, padding = entry
+
+            # Same as get_customer_id(): first truthy id spelling wins
+            ident = ''
+            for key in id_keys:
+                value = record[key]
+                if value:
+                    ident = str(value)
+                    break
+            customer_ids.append(ident)
+
+            for keys, append, convert, missing in plan:
+                for key in keys:
+                    value = record[key]
+                    if value is not None:
+                        append(convert(value))
+                        break
+                else:
+                    append(missing)
+            for append, missing in padding:
+                append(missing)
+
+        return cls(
+            {col: np.frombuffer(values, dtype=np.float64) for col, values in numeric_values.items()},
+            {col: np.frombuffer(values, dtype=np.int32) for col, values in codes.items()},
+            {col: np.array(list(tables[col]), dtype=object) for col in codes},
+            np.asarray(customer_ids, dtype=str) if customer_ids else np.array([], dtype='<U1')
+        )
+
+    @classmethod
+    def from_json_lines(cls, lines):
+        """Build a batch from JSON lines (any iterable of strings, e.g. an open file)"""
+        return cls.from_records(json.loads(line) for line in lines if line.strip())
+
+    @classmethod
+    def iter_json_lines(cls, path, chunk_size):
+        """Stream a JSON lines file as batches of at most chunk_size customers"""
+        with open(path, 'r', encoding='utf-8') as f:
+            while True:
+                batch = cls.from_json_lines(islice(f, chunk_size))
+                if batch.empty:
+                    return
+                yield batch
+
+    @classmethod
+    def from_frame(cls, df):
+        """Build a batch from a customer DataFrame (any supported column spelling)"""
+        df = normalize_customer_columns(df)
+        numeric, codes, categories = {}, {}, {}
+        for col in MONEY_COLS:
+            if col in df.columns:
+                numeric[col] = clean_numeric_series(df[col]).to_numpy(dtype=np.float64, copy=True)
+        for col in NUMERIC_COLS:
+            if col in df.columns:
+                numeric[col] = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64, copy=True)
+        for col in CODED_COLS + RULE_ONLY_COLS:
+            if col in df.columns:
+                values = df[col] if col in DATE_COLS else df[col].where(df[col].isna(), df[col].astype(str))
+                col_codes, uniques = pd.factorize(values)
+                codes[col] = col_codes.astype(np.int32)
+                categories[col] = np.asarray(uniques, dtype=object)
+
+        ids = pd.Series(None, index=df.index, dtype=object)
+        for col in ID_COLUMNS:
+            if col in df.columns:
+                ids = ids.where(ids.notna(), df[col])
+        return cls(numeric, codes, categories, ids.fillna('').astype(str).to_numpy(dtype=str), df.index)
+
+    # -- consumers -----------------------------------------------------------
+
+    def customer_id_series(self):
+        """Customer ids as a Series (None where missing), like batch_scoring.resolve_customer_ids"""
+        ids = pd.Series(self.customer_ids, index=self.index, dtype=object)
+        return ids.where(ids != '')
+
+    def rule_frame(self):
+        """Small DataFrame with just the columns the business rules read"""
+        frame = {}
+        for col, aliases in RULE_COLUMN_ALIASES.items():
+            for alias in aliases:
+                if alias in self.codes:
+                    frame[alias] = self.decoded(alias)
+                elif alias in self.numeric:
+                    frame[alias] = self.numeric[alias]
+        return pd.DataFrame(frame, index=self.index)
+
+    def decoded(self, col):
+        """Raw values of a coded column as an object array (None where missing)"""
+        table = np.append(self.categories[col], None)
+        return table[self.codes[col]]  # code -1 picks the trailing None
+
+    def features(self, encoders):
+        """Model feature matrix; same result as prepare_features_batch() on the equivalent DataFrame"""
+        n_rows = len(self)
+        features = {}
+
+        for col_name in CATEGORICAL_COLS:
+            if col_name in self.codes and col_name in encoders:
+                # Encode each distinct value once; unknown values map to 0, missing ones like str(NaN)
+                lookup = {cls: idx for idx, cls in enumerate(encoders[col_name].classes_)}
+                encoded = np.array([lookup.get(str(value), 0) for value in self.categories[col_name]]
+                                   + [lookup.get('nan', 0)], dtype=np.float64)
+                features[col_name + '_encoded'] = encoded[self.codes[col_name]]
+
+        for col in MONEY_COLS:
+            if col in self.numeric:
+                features[col] = np.nan_to_num(self.numeric[col], nan=0.0)
+
+        for prefix, date_col in zip(['Account_Open', 'Last_Transaction'], DATE_COLS):
+            if date_col in self.codes:
+                # Parse each distinct date once
+                dates = parse_date_series(pd.Series(self.categories[date_col], dtype=object))
+                months = np.append(dates.dt.month.fillna(0).to_numpy(dtype=np.float64), 0)
+                years = np.append(dates.dt.year.fillna(0).to_numpy(dtype=np.float64), 0)
+                features[prefix + '_Month'] = months[self.codes[date_col]]
+                features[prefix + '_Year'] = years[self.codes[date_col]]
+
+        for col in FEATURE_COLS:
+            if col in features:
+                continue
+            if col in self.numeric:
+                features[col] = np.nan_to_num(self.numeric[col], nan=0.0)
+            else:
+                features[col] = np.full(n_rows, DEFAULTS.get(col, 0), dtype=np.float64)
+
+        return pd.DataFrame({col: features[col] for col in FEATURE_COLS}, index=self.index)
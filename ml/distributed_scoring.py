@@ -0,0 +1,452 @@
+"""
+Sharded Multi-Node Scoring for BK Pulse Churn Prediction
+Spreads one scoring run over any number of worker processes, on one host or many.
+
+The coordinator splits the input into shards and publishes them to a work queue
+in a shared directory:
+  - a customer file is cut into shard files (shards/shard-00000.csv, ...)
+  - the customers table is cut into id ranges (the same customers as score_database.py)
+The queue itself is a SQLite database in that directory (queue.db). Workers claim
+one shard at a time under a lease, renew the lease while scoring, and commit:
+  - file shards: results/shard-NNNNN.csv, written to a temporary file and renamed
+  - table shards: a set-based UPDATE through the staging table (score_database.py)
+Both commits are idempotent, so a shard scored twice (after its lease expired
+while the first worker was still busy) gives the same result. Expired leases are
+claimed again by the next free worker; a shard that fails MAX_ATTEMPTS times is
+marked failed. Each shard also writes its drift histograms, merged by collect,
+and each worker writes its run metrics to metrics/<worker_id>.json.
+
+The shared directory needs working file locks (local disk, NFSv4 or SMB).
+All workers must run the model version the queue was published with.
+
+Usage:
+    python ml/distributed_scoring.py publish customers.csv --queue /shared/run1
+    python ml/distributed_scoring.py publish --dsn "$DATABASE_URL" --all --queue /shared/run1
+    python ml/distributed_scoring.py worker --queue /shared/run1          # on every scoring host
+    python ml/distributed_scoring.py worker --queue /shared/run1 --metrics-port 9108   # Prometheus scrape target
+    python ml/distributed_scoring.py status --queue /shared/run1
+    python ml/distributed_scoring.py collect --queue /shared/run1 -o scores.csv
+    python ml/distributed_scoring.py run-local customers.csv --queue /tmp/run1 --workers 4 -o scores.csv
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import shutil
+import sqlite3
+import argparse
+import threading
+import subprocess
+from pathlib import Path
+
+import pandas as pd
+
+from batch_scoring import DEFAULT_CHUNK_SIZE, read_customer_file, read_customer_batches, score_chunks
+from drift_monitor import DRIFT_REPORT_PATH, DriftMonitor, load_monitor, load_reference
+from predict import load_artifacts, get_model_version
+from resource_governor import WORKERS_ENV, govern
+from scoring_metrics import METRICS, backend_name, serve_metrics, write_metrics
+from scoring_profiler import install_signal_handler
+
+QUEUE_FILE = 'queue.db'
+SHARDS_DIR = 'shards'
+RESULTS_DIR = 'results'
+DRIFT_DIR = 'drift'
+METRICS_DIR = 'metrics'
+DEFAULT_SHARD_SIZE = 200000     # Customers per shard
+DEFAULT_LEASE_SECONDS = 600     # A shard whose lease is not renewed in time is handed to another worker
+POLL_INTERVAL = 5               # Seconds between claims while other workers hold the remaining shards
+MAX_ATTEMPTS = 3
+
+
+def open_queue(queue_dir):
+    """Connection to the queue database (autocommit; claims use explicit IMMEDIATE transactions)"""
+    conn = sqlite3.connect(Path(queue_dir) / QUEUE_FILE, timeout=60, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def create_queue(queue_dir, meta, reset=False):
+    """Create an empty queue in queue_dir and record the run settings"""
+    queue_dir = Path(queue_dir)
+    if (queue_dir / QUEUE_FILE).exists():
+        if not reset:
+            raise FileExistsError(f"A queue already exists in {queue_dir}. Use --reset to replace it.")
+        for name in (SHARDS_DIR, RESULTS_DIR, DRIFT_DIR, METRICS_DIR):
+            shutil.rmtree(queue_dir / name, ignore_errors=True)
+        (queue_dir / QUEUE_FILE).unlink()
+    for name in (SHARDS_DIR, RESULTS_DIR, DRIFT_DIR, METRICS_DIR):
+        (queue_dir / name).mkdir(parents=True, exist_ok=True)
+
+    conn = open_queue(queue_dir)
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute(
+        "CREATE TABLE shards (shard_id INTEGER PRIMARY KEY, kind TEXT NOT NULL, source TEXT, "
+        "range_start INTEGER, range_end INTEGER, row_count INTEGER, status TEXT NOT NULL DEFAULT 'pending', "
+        "worker TEXT, lease_token TEXT, lease_expires REAL, attempts INTEGER NOT NULL DEFAULT 0, "
+        "scored INTEGER, error TEXT, completed_at REAL)"
+    )
+    conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)",
+                     [(key, json.dumps(value)) for key, value in meta.items()])
+    return conn
+
+
+def read_meta(conn):
+    """Run settings recorded by the coordinator"""
+    return {row['key']: json.loads(row['value']) for row in conn.execute("SELECT key, value FROM meta")}
+
+
+def current_model_version():
+    """Version of the model this host would score with (recorded in the queue)"""
+    load_artifacts()
+    return get_model_version()
+
+
+def publish_file(input_path, queue_dir, shard_size=DEFAULT_SHARD_SIZE, lease_seconds=DEFAULT_LEASE_SECONDS,
+                 reset=False):
+    """Cut a customer file into shard files and queue them"""
+    conn = create_queue(queue_dir, {'kind': 'file', 'input': str(input_path),
+                                    'model_version': current_model_version(), 'lease_seconds': lease_seconds}, reset)
+    shard_id = rows = 0
+    for shard_id, shard in enumerate(read_customer_file(input_path, shard_size)):
+        path = Path(queue_dir) / SHARDS_DIR / f"shard-{shard_id:05d}.csv"
+        shard.to_csv(path, index=False)
+        conn.execute("INSERT INTO shards (shard_id, kind, source, range_start, range_end, row_count) "
+                     "VALUES (?, 'file', ?, ?, ?, ?)",
+                     (shard_id, path.name, rows, rows + len(shard), len(shard)))
+        rows += len(shard)
+    conn.close()
+    print(f"Published {rows:,} customers in {shard_id + 1 if rows else 0} shards -> {queue_dir}", file=sys.stderr)
+    return rows
+
+
+def publish_table(queue_dir, dsn=None, update_all=False, shard_size=DEFAULT_SHARD_SIZE,
+                  lease_seconds=DEFAULT_LEASE_SECONDS, reset=False):
+    """Cut the customers to rescore into id ranges of shard_size rows and queue them"""
+    from score_database import connect, customer_filter
+    from risk_index import read_query
+    conn_db, dialect = connect(dsn)
+    try:
+        ids = [chunk['id'] for chunk in read_query(
+            conn_db, dialect, f"SELECT id FROM customers{customer_filter(dialect, update_all)} ORDER BY id",
+            chunk_size=shard_size, name='bk_pulse_shard_ids')]
+    finally:
+        conn_db.close()
+
+    conn = create_queue(queue_dir, {'kind': 'table', 'dsn': dsn, 'update_all': update_all,
+                                    'model_version': current_model_version(), 'lease_seconds': lease_seconds}, reset)
+    # read_query chunks are exactly shard_size ids, so each chunk is one id range
+    for shard_id, chunk in enumerate(ids):
+        conn.execute("INSERT INTO shards (shard_id, kind, source, range_start, range_end, row_count) "
+                     "VALUES (?, 'table', 'customers', ?, ?, ?)",
+                     (shard_id, int(chunk.iloc[0]), int(chunk.iloc[-1]), len(chunk)))
+    conn.close()
+    rows = sum(len(chunk) for chunk in ids)
+    print(f"Published {rows:,} customers in {len(ids)} shards -> {queue_dir}", file=sys.stderr)
+    return rows
+
+
+def claim_shard(conn, worker_id, lease_seconds):
+    """Lease the next pending (or lease-expired) shard; returns (shard, token) or (None, None)"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        now = time.time()
+        shard = conn.execute(
+            "SELECT * FROM shards WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+            "ORDER BY shard_id LIMIT 1", (now,)
+        ).fetchone()
+        if shard is None:
+            conn.execute("COMMIT")
+            return None, None
+        token = uuid.uuid4().hex
+        conn.execute(
+            "UPDATE shards SET status = 'leased', worker = ?, lease_token = ?, lease_expires = ?, "
+            "attempts = attempts + 1 WHERE shard_id = ?",
+            (worker_id, token, now + lease_seconds, shard['shard_id'])
+        )
+        conn.execute("COMMIT")
+        return dict(shard), token
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def complete_shard(conn, shard_id, worker_id, scored):
+    """Mark a shard done (a no-op if another worker already finished it)"""
+    conn.execute(
+        "UPDATE shards SET status = 'done', worker = ?, scored = ?, lease_expires = NULL, error = NULL, "
+        "completed_at = ? WHERE shard_id = ? AND status != 'done'",
+        (worker_id, scored, time.time(), shard_id)
+    )
+
+
+def release_shard(conn, shard_id, token, error):
+    """Give a failed shard back to the queue, or mark it failed after MAX_ATTEMPTS"""
+    conn.execute(
+        "UPDATE shards SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+        "lease_expires = NULL, error = ? WHERE shard_id = ? AND lease_token = ? AND status = 'leased'",
+        (MAX_ATTEMPTS, str(error)[:500], shard_id, token)
+    )
+
+
+def open_shards(conn):
+    """Number of shards not yet done or failed"""
+    return conn.execute("SELECT COUNT(*) FROM shards WHERE status IN ('pending', 'leased')").fetchone()[0]
+
+
+class LeaseHeartbeat(threading.Thread):
+    """Renews a shard lease in the background while the shard is being scored"""
+
+    def __init__(self, queue_dir, shard_id, token, lease_seconds):
+        super().__init__(daemon=True)
+        self.queue_dir, self.shard_id, self.token = queue_dir, shard_id, token
+        self.lease_seconds = lease_seconds
+        self.stopped = threading.Event()
+
+    def run(self):
+        conn = open_queue(self.queue_dir)
+        try:
+            while not self.stopped.wait(self.lease_seconds / 3):
+                conn.execute("UPDATE shards SET lease_expires = ? WHERE shard_id = ? AND lease_token = ?",
+                             (time.time() + self.lease_seconds, self.shard_id, self.token))
+        finally:
+            conn.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def score_file_shard(queue_dir, shard, artifacts, monitor, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Score one shard file into results/ (written to a temporary file, then renamed)"""
+    output_path = Path(queue_dir) / RESULTS_DIR / shard['source']
+    temporary_path = output_path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+    scored = 0
+    header = True
+    for scores in score_chunks(read_customer_batches(Path(queue_dir) / SHARDS_DIR / shard['source'], chunk_size),
+                               artifacts, monitor):
+        scores.to_csv(temporary_path, mode='w' if header else 'a', header=header, index=False)
+        header = False
+        scored += len(scores)
+    if header:
+        pd.DataFrame(columns=['customer_id']).to_csv(temporary_path, index=False)
+    os.replace(temporary_path, output_path)
+    return scored
+
+
+def score_table_shard(meta, shard, artifacts, monitor, dsn=None):
+    """Score one id range of the customers table and write the scores back in one transaction"""
+    from score_database import (CUSTOMER_COLUMNS, connect, get_table_columns, customer_filter,
+                                transform_customer_rows, create_staging_table, stage_scores, apply_staged_scores)
+    from risk_index import read_query
+    conn, dialect = connect(dsn or meta.get('dsn'))
+    try:
+        available = get_table_columns(conn)
+        columns = ', '.join(col for col in CUSTOMER_COLUMNS if col in available)
+        query = (f"SELECT * FROM (SELECT {columns} FROM customers{customer_filter(dialect, meta['update_all'])}) "
+                 f"shard WHERE id >= ? AND id <= ?")
+        chunks = read_query(conn, dialect, query, (shard['range_start'], shard['range_end']))
+        # Score the whole shard before writing, so the write transaction is short
+        results = list(score_chunks((transform_customer_rows(chunk) for chunk in chunks), artifacts, monitor))
+        create_staging_table(conn, dialect)
+        scored = sum(stage_scores(conn, dialect, scores) for scores in results)
+        # Rewriting the same scores is harmless, so a shard that is committed twice stays correct
+        apply_staged_scores(conn, dialect, meta['model_version'] if 'model_version' in available else None)
+        conn.commit()
+        return scored
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def run_worker(queue_dir, worker_id=None, dsn=None, chunk_size=DEFAULT_CHUNK_SIZE, metrics_port=None):
+    """Claim and score shards until the queue has no open shards left"""
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    govern(role=f"worker {worker_id}", quiet=False)
+    install_signal_handler()
+    if metrics_port is not None:
+        serve_metrics(metrics_port)
+    conn = open_queue(queue_dir)
+    meta = read_meta(conn)
+    artifacts = load_artifacts()
+    model_version = get_model_version()
+    if model_version != meta['model_version']:
+        conn.close()
+        raise RuntimeError(f"Queue was published for model {meta['model_version']}, "
+                           f"this worker has {model_version}")
+    lease_seconds = meta['lease_seconds']
+    start_time = time.time()
+    shards = scored = 0
+
+    try:
+        while True:
+            shard, token = claim_shard(conn, worker_id, lease_seconds)
+            if shard is None:
+                if not open_shards(conn):
+                    break
+                # Remaining shards are leased by other workers; wait in case a lease expires
+                time.sleep(POLL_INTERVAL)
+                continue
+
+            heartbeat = LeaseHeartbeat(queue_dir, shard['shard_id'], token, lease_seconds)
+            heartbeat.start()
+            monitor = load_monitor()
+            try:
+                if shard['kind'] == 'file':
+                    count = score_file_shard(queue_dir, shard, artifacts, monitor, chunk_size)
+                else:
+                    count = score_table_shard(meta, shard, artifacts, monitor, dsn)
+                if monitor is not None:
+                    with open(Path(queue_dir) / DRIFT_DIR / f"shard-{shard['shard_id']:05d}.json", 'w') as f:
+                        json.dump(monitor.report(model_version), f)
+            except Exception as e:
+                METRICS.errors.inc(backend_name(artifacts[0]), 'shard')
+                release_shard(conn, shard['shard_id'], token, e)
+                print(f"Warning: Could not score shard {shard['shard_id']}: {e}", file=sys.stderr)
+                continue
+            finally:
+                heartbeat.stop()
+
+            complete_shard(conn, shard['shard_id'], worker_id, count)
+            shards += 1
+            scored += count
+            print(f"[{worker_id}] Shard {shard['shard_id']} done ({count:,} customers, "
+                  f"{time.time() - start_time:.1f}s)", file=sys.stderr)
+    finally:
+        conn.close()
+        write_metrics(f"worker {worker_id}", Path(queue_dir) / METRICS_DIR / f"{worker_id}.json")
+
+    print(f"[{worker_id}] Scored {scored:,} customers in {shards} shards in {time.time() - start_time:.1f}s",
+          file=sys.stderr)
+    return shards, scored
+
+
+def queue_status(queue_dir):
+    """Shard and customer counts per status"""
+    conn = open_queue(queue_dir)
+    try:
+        rows = conn.execute(
+            "SELECT status, COUNT(*) AS shards, SUM(row_count) AS customers, SUM(scored) AS scored "
+            "FROM shards GROUP BY status ORDER BY status"
+        ).fetchall()
+    finally:
+        conn.close()
+    return pd.DataFrame([dict(row) for row in rows], columns=['status', 'shards', 'customers', 'scored'])
+
+
+def collect(queue_dir, output_path=None, drift_report=DRIFT_REPORT_PATH):
+    """Concatenate shard results in shard order and merge the shard drift reports"""
+    conn = open_queue(queue_dir)
+    try:
+        meta = read_meta(conn)
+        remaining = open_shards(conn)
+        failed = conn.execute("SELECT COUNT(*) FROM shards WHERE status = 'failed'").fetchone()[0]
+        done = [row['source'] for row in conn.execute(
+            "SELECT source FROM shards WHERE status = 'done' ORDER BY shard_id")]
+    finally:
+        conn.close()
+    if remaining or failed:
+        print(f"Warning: {remaining} shard(s) still open and {failed} failed; collecting finished shards only",
+              file=sys.stderr)
+
+    if output_path and meta['kind'] == 'file':
+        output_path = Path(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, 'w', newline='') as out:
+            for position, name in enumerate(done):
+                with open(Path(queue_dir) / RESULTS_DIR / name, 'r', newline='') as shard:
+                    header = shard.readline()
+                    if position == 0:
+                        out.write(header)
+                    shutil.copyfileobj(shard, out)
+        print(f"Collected {len(done)} shards -> {output_path}", file=sys.stderr)
+
+    reference = load_reference()
+    drift_files = sorted((Path(queue_dir) / DRIFT_DIR).glob('shard-*.json'))
+    if drift_report and reference is not None and drift_files:
+        monitor = DriftMonitor(reference)
+        for path in drift_files:
+            with open(path, 'r') as f:
+                monitor.merge(DriftMonitor.from_report(json.load(f), reference))
+        monitor.write_report(drift_report, model_version=meta['model_version'])
+    return len(done)
+
+
+def run_local(input_path, queue_dir, workers=2, output_path=None, shard_size=DEFAULT_SHARD_SIZE, reset=False):
+    """Publish a file, score it with several local worker processes and collect the results"""
+    publish_file(input_path, queue_dir, shard_size, reset=reset)
+    # The workers split this host's CPU budget between them
+    env = dict(os.environ, **{WORKERS_ENV: str(workers)})
+    processes = [
+        subprocess.Popen([sys.executable, str(Path(__file__).resolve()), 'worker', '--queue', str(queue_dir),
+                          '--worker-id', f"local-{number}"], env=env)
+        for number in range(workers)
+    ]
+    codes = [process.wait() for process in processes]
+    if any(codes):
+        print(f"Warning: worker exit codes {codes}", file=sys.stderr)
+    return collect(queue_dir, output_path)
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Sharded scoring with a shared-directory work queue')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    publish = subparsers.add_parser('publish', help='Split a file or the customers table into queued shards')
+    publish.add_argument('input', nargs='?', help='Customer CSV or JSON lines file (omit to shard the database)')
+    publish.add_argument('--queue', required=True, help='Shared queue directory')
+    publish.add_argument('--dsn', default=None, help='Database to shard (default: DATABASE_URL or DB_* settings)')
+    publish.add_argument('--all', action='store_true', dest='update_all',
+                         help='Rescore every customer (default: only unscored or stale customers)')
+    publish.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE)
+    publish.add_argument('--lease-seconds', type=int, default=DEFAULT_LEASE_SECONDS)
+    publish.add_argument('--reset', action='store_true', help='Replace an existing queue in the directory')
+
+    worker = subparsers.add_parser('worker', help='Claim and score shards until the queue is drained')
+    worker.add_argument('--queue', required=True)
+    worker.add_argument('--worker-id', default=None)
+    worker.add_argument('--dsn', default=None, help='Database connection of this host (table shards)')
+    worker.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    worker.add_argument('--metrics-port', type=int, default=None,
+                        help='Serve Prometheus metrics on this port while the worker runs')
+
+    status = subparsers.add_parser('status', help='Shard counts per status')
+    status.add_argument('--queue', required=True)
+
+    collect_parser = subparsers.add_parser('collect', help='Concatenate results and merge drift reports')
+    collect_parser.add_argument('--queue', required=True)
+    collect_parser.add_argument('-o', '--output', default=None, help='Output CSV (file queues)')
+    collect_parser.add_argument('--drift-report', default=str(DRIFT_REPORT_PATH))
+
+    local = subparsers.add_parser('run-local', help='Publish a file and score it with local worker processes')
+    local.add_argument('input')
+    local.add_argument('--queue', required=True)
+    local.add_argument('--workers', type=int, default=2)
+    local.add_argument('-o', '--output', required=True)
+    local.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE)
+    local.add_argument('--reset', action='store_true')
+
+    args = parser.parse_args()
+    if args.command == 'publish':
+        if args.input:
+            publish_file(args.input, args.queue, args.shard_size, args.lease_seconds, args.reset)
+        else:
+            publish_table(args.queue, args.dsn, args.update_all, args.shard_size, args.lease_seconds, args.reset)
+    elif args.command == 'worker':
+        run_worker(args.queue, args.worker_id, args.dsn, args.chunk_size, args.metrics_port)
+    elif args.command == 'status':
+        print(queue_status(args.queue).to_string(index=False))
+    elif args.command == 'collect':
+        collect(args.queue, args.output, args.drift_report)
+    else:
+        run_local(args.input, args.queue, args.workers, args.output, args.shard_size, args.reset)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+"""
+Population Drift Monitor for BK Pulse Churn Prediction
+Compares the customers being scored with the data the model was trained on.
+
+preprocess.py saves compact reference histograms of the training features
+(quantile bins for continuous features, value frequencies for discrete and
+encoded categorical features). While scoring, DriftMonitor adds the
+prepare_features_batch() output of every batch to histograms with the same
+bins - a searchsorted and a bincount per feature on at most MONITOR_SAMPLE_ROWS
+rows of each batch, no raw rows are kept - and reports PSI and KS per feature.
+Histograms are plain counts, so reports from separate runs or workers can be
+merged.
+
+Usage:
+    python drift_monitor.py check customers.csv        # drift of a customer file
+    python drift_monitor.py merge report_a.json report_b.json -o drift_report.json
+"""
+
+import sys
+import json
+import argparse
+from pathlib import Path
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = Path(__file__).parent
+REFERENCE_PATH = BASE_DIR / '../data/processed/reference_histograms.json'
+DRIFT_REPORT_PATH = BASE_DIR / '../data/monitoring/drift_report.json'
+
+REFERENCE_BINS = 20             # Quantile bins for continuous features
+MAX_DISCRETE_VALUES = 32        # Features with at most this many distinct values are tracked per value
+MONITOR_SAMPLE_ROWS = 5000      # Larger batches are sampled systematically to keep the overhead flat
+PSI_MODERATE = 0.1              # Usual PSI rule of thumb: < 0.1 stable, 0.1-0.25 moderate, > 0.25 shifted
+PSI_SHIFTED = 0.25
+
+
+def build_reference(X, encoders=None):
+    """Reference histograms of an (unscaled) training feature matrix"""
+    encoders = encoders or {}
+    features = {}
+    for col in X.columns:
+        values = pd.to_numeric(X[col], errors='coerce').fillna(0).to_numpy(dtype=float)
+        categorical = col.endswith('_encoded')
+        distinct, counts = np.unique(values, return_counts=True)
+        if categorical or len(distinct) <= MAX_DISCRETE_VALUES:
+            spec = {'kind': 'categorical' if categorical else 'discrete',
+                    'values': distinct.tolist(), 'counts': counts.tolist()}
+            encoder = encoders.get(col[:-len('_encoded')]) if categorical else None
+            if encoder is not None:
+                spec['labels'] = [str(encoder.classes_[int(code)]) if 0 <= code < len(encoder.classes_) else str(code)
+                                  for code in distinct]
+        else:
+            # Interior quantile edges; the outer bins are open-ended so any new value has a bin
+            edges = np.unique(np.quantile(values, np.linspace(0, 1, REFERENCE_BINS + 1)[1:-1]))
+            counts = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+            spec = {'kind': 'binned', 'edges': edges.tolist(), 'counts': counts.tolist()}
+        features[col] = spec
+    return {
+        'created_at': datetime.now().isoformat(),
+        'rows': int(len(X)),
+        'features': features,
+    }
+
+
+def save_reference(X, encoders=None, path=REFERENCE_PATH):
+    """Build and save reference histograms (called by preprocess.py)"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(build_reference(X, encoders), f)
+    return path
+
+
+@lru_cache(maxsize=2)
+def _load_reference(path, mtime):
+    """Read a reference file (cached until it changes)"""
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def load_reference(path=REFERENCE_PATH):
+    """Reference histograms saved by preprocess.py, or None if there are none"""
+    path = Path(path).resolve()
+    if not path.exists():
+        return None
+    return _load_reference(str(path), path.stat().st_mtime)
+
+
+def psi(reference_counts, current_counts):
+    """Population stability index between two histograms with the same bins"""
+    reference_share = np.clip(reference_counts / max(reference_counts.sum(), 1), 1e-6, None)
+    current_share = np.clip(current_counts / max(current_counts.sum(), 1), 1e-6, None)
+    return float(np.sum((current_share - reference_share) * np.log(current_share / reference_share)))
+
+
+def ks_statistic(reference_counts, current_counts):
+    """Two-sample KS statistic evaluated at the bin boundaries"""
+    reference_cdf = np.cumsum(reference_counts) / max(reference_counts.sum(), 1)
+    current_cdf = np.cumsum(current_counts) / max(current_counts.sum(), 1)
+    return float(np.max(np.abs(reference_cdf - current_cdf)))
+
+
+def drift_status(value):
+    """Stable / moderate / shifted label for a PSI value"""
+    if value > PSI_SHIFTED:
+        return 'shifted'
+    return 'moderate' if value > PSI_MODERATE else 'stable'
+
+
+class DriftMonitor:
+    """Mergeable per-feature histograms of scored customers, binned like the reference"""
+
+    def __init__(self, reference):
+        self.reference = reference
+        self.columns = list(reference['features'])
+        self.rows = 0
+        self.sampled_rows = 0
+        self.batches = 0
+        self._bins = {}
+        self.reference_counts = {}
+        self.counts = {}
+        for col, spec in reference['features'].items():
+            if spec['kind'] == 'binned':
+                self._bins[col] = ('binned', np.asarray(spec['edges'], dtype=float))
+                reference_counts = spec['counts']
+            else:
+                # Values never seen in training fall into an extra "other" bucket
+                self._bins[col] = ('discrete', np.asarray(spec['values'], dtype=float))
+                reference_counts = spec['counts'] + [0]
+            self.reference_counts[col] = np.asarray(reference_counts, dtype=np.int64)
+            self.counts[col] = np.zeros(len(reference_counts), dtype=np.int64)
+
+    def bin_index(self, col, values):
+        """Bin of every value of one feature"""
+        kind, bins = self._bins[col]
+        if kind == 'binned':
+            return np.searchsorted(bins, values, side='right')
+        position = np.minimum(np.searchsorted(bins, values), len(bins) - 1)
+        return np.where(bins[position] == values, position, len(bins))
+
+    def update(self, features):
+        """Add one batch of prepare_features_batch() output"""
+        if len(features) == 0:
+            return
+        step = -(-len(features) // MONITOR_SAMPLE_ROWS)
+        sample = features.iloc[::step] if step > 1 else features
+        # One contiguous row per feature
+        matrix = np.ascontiguousarray(sample[self.columns].to_numpy(dtype=float).T)
+        for col, values in zip(self.columns, matrix):
+            counts = self.counts[col]
+            counts += np.bincount(self.bin_index(col, values), minlength=len(counts))
+        self.rows += len(features)
+        self.sampled_rows += len(sample)
+        self.batches += 1
+
+    def merge(self, other):
+        """Add the histograms of another monitor over the same reference"""
+        for col in self.columns:
+            self.counts[col] += other.counts[col]
+        self.rows += other.rows
+        self.sampled_rows += other.sampled_rows
+        self.batches += other.batches
+        return self
+
+    def feature_drift(self):
+        """PSI, KS and status per feature for everything seen so far"""
+        drift = {}
+        seen = self.sampled_rows
+        for col in self.columns:
+            reference_counts, counts = self.reference_counts[col], self.counts[col]
+            value = psi(reference_counts, counts) if seen else 0.0
+            spec = self.reference['features'][col]
+            drift[col] = {
+                'psi': round(value, 6),
+                # Encoded categories have no meaningful order, so KS is only reported for ordered features
+                'ks': round(ks_statistic(reference_counts, counts), 6)
+                      if seen and spec['kind'] != 'categorical' else None,
+                'status': drift_status(value),
+                'unseen_share': round(float(counts[-1] / seen), 6)
+                                if seen and spec['kind'] != 'binned' else None,
+                'counts': counts.tolist(),
+            }
+        return drift
+
+    def report(self, model_version=None):
+        """Drift report (histogram counts included so reports can be merged later)"""
+        drift = self.feature_drift()
+        shifted = sorted((col for col in drift if drift[col]['status'] == 'shifted'),
+                         key=lambda col: -drift[col]['psi'])
+        return {
+            'generated_at': datetime.now().isoformat(),
+            'model_version': model_version,
+            'reference_created_at': self.reference['created_at'],
+            'reference_rows': self.reference['rows'],
+            'rows': int(self.rows),
+            'sampled_rows': int(self.sampled_rows),
+            'batches': int(self.batches),
+            'max_psi': max((d['psi'] for d in drift.values()), default=0.0),
+            'shifted_features': shifted,
+            'features': drift,
+        }
+
+    def write_report(self, path=DRIFT_REPORT_PATH, model_version=None):
+        """Write the drift report as JSON and print a one-line summary"""
+        report = self.report(model_version)
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        summary = f"max PSI {report['max_psi']:.3f}"
+        if report['shifted_features']:
+            summary += f", shifted: {', '.join(report['shifted_features'])}"
+        print(f"Drift report for {self.rows:,} customers ({summary}) -> {path}", file=sys.stderr)
+        return report
+
+    @classmethod
+    def from_report(cls, report, reference):
+        """Rebuild a monitor from the counts stored in a drift report"""
+        monitor = cls(reference)
+        for col in monitor.columns:
+            monitor.counts[col] += np.asarray(report['features'][col]['counts'], dtype=np.int64)
+        monitor.rows = report['rows']
+        monitor.sampled_rows = report['sampled_rows']
+        monitor.batches = report['batches']
+        return monitor
+
+
+def load_monitor(reference_path=REFERENCE_PATH):
+    """A fresh DriftMonitor, or None when preprocess.py has not saved a reference yet"""
+    reference = load_reference(reference_path)
+    return DriftMonitor(reference) if reference is not None else None
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Population drift against the training reference')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    check = subparsers.add_parser('check', help='Report drift of a customer CSV or JSON lines file')
+    check.add_argument('input')
+    check.add_argument('-o', '--output', default=str(DRIFT_REPORT_PATH))
+    check.add_argument('--chunk-size', type=int, default=50000)
+
+    merge = subparsers.add_parser('merge', help='Merge drift reports from separate runs')
+    merge.add_argument('reports', nargs='+')
+    merge.add_argument('-o', '--output', default=str(DRIFT_REPORT_PATH))
+
+    args = parser.parse_args()
+
+    reference = load_reference()
+    if reference is None:
+        print(f"No reference histograms at {REFERENCE_PATH.resolve()}. Run preprocess.py first.", file=sys.stderr)
+        sys.exit(1)
+
+    if args.command == 'merge':
+        monitor = DriftMonitor(reference)
+        for report_path in args.reports:
+            with open(report_path, 'r') as f:
+                monitor.merge(DriftMonitor.from_report(json.load(f), reference))
+        monitor.write_report(args.output)
+        return
+
+    from predict import load_artifacts, prepare_features_batch
+    from batch_scoring import read_customer_file
+    _, _, encoders = load_artifacts()
+    monitor = DriftMonitor(reference)
+    for chunk in read_customer_file(args.input, args.chunk_size):
+        monitor.update(prepare_features_batch(chunk, encoders))
+    monitor.write_report(args.output)
+
+
+if __name__ == '__main__':
+    main()
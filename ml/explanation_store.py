@@ -0,0 +1,246 @@
+"""
+Offline SHAP Explanation Store for BK Pulse Churn Prediction
+Precomputes the top-10 SHAP contributions for every model-scored customer in
+parallel chunks and saves them in a compact, memory-mapped store. Each build
+writes a new generation directory:
+  customer_ids.npy   sorted fixed-width customer ids
+  feature_index.npy  (n, top_k) feature positions ordered by |SHAP|
+  shap_values.npy    (n, top_k) float32 SHAP values
+  feature_hash.npy   (n,) hash of the unscaled feature vector that was explained
+  metadata.json      model version, feature names, top_k
+and then atomically replaces the CURRENT pointer file naming it, so readers
+switch from one complete generation to the next. The previous generation is
+kept for readers that still have it open.
+
+Serving an explanation is a binary search on customer_ids. predict_churn()
+uses the store when the model version and the customer's features still match.
+
+Usage:
+    python ml/explanation_store.py build --input customers.csv
+    python ml/explanation_store.py build --dsn sqlite:///path/to/bk_pulse.db
+    python ml/explanation_store.py lookup CUST000123
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+from pathlib import Path
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from predict import (
+    FEATURE_COLS, load_artifacts, get_model_version, prepare_features_batch,
+    format_shap_values
+)
+from business_rules import evaluate_business_rules
+from batch_scoring import resolve_customer_ids, read_customer_file
+from resource_governor import govern, resolve_jobs, split_threads, configure_estimator
+
+BASE_DIR = Path(__file__).parent
+STORE_DIR = BASE_DIR / '../data/models/explanation_store'
+TOP_K = 10
+DEFAULT_CHUNK_SIZE = 10000
+CURRENT_FILE = 'CURRENT'        # Name of the generation readers use
+KEEP_GENERATIONS = 2            # Current and previous
+
+
+def feature_hashes(features):
+    """Stable per-row hash of unscaled feature vectors"""
+    return pd.util.hash_pandas_object(features.astype('float64'), index=False).to_numpy(dtype=np.uint64)
+
+
+def positive_class_shap(shap_values):
+    """Extract the positive-class (churn=1) SHAP matrix from any shap output layout"""
+    if isinstance(shap_values, list):
+        shap_values = shap_values[1]
+    shap_values = np.asarray(shap_values)
+    if shap_values.ndim == 3:
+        shap_values = shap_values[:, :, 1]
+    return shap_values
+
+
+def explain_chunk(chunk, model, scaler, encoders, top_k=TOP_K):
+    """Compute top-k SHAP contributions for the model-scored customers of one chunk"""
+    import shap
+
+    # Rule-decided customers are not scored by the model, so there is nothing to explain
+    chunk = chunk[evaluate_business_rules(chunk).isna().to_numpy()]
+    if chunk.empty:
+        return None
+
+    features = prepare_features_batch(chunk, encoders)
+    shap_values = positive_class_shap(shap.TreeExplainer(model).shap_values(scaler.transform(features)))
+
+    top_index = np.argsort(-np.abs(shap_values), axis=1, kind='stable')[:, :top_k]
+    return {
+        'customer_ids': resolve_customer_ids(chunk).fillna('').to_numpy(dtype=str),
+        'feature_index': top_index.astype(np.int16),
+        'shap_values': np.take_along_axis(shap_values, top_index, axis=1).astype(np.float32),
+        'feature_hash': feature_hashes(features),
+    }
+
+
+def write_store(parts, store_dir, metadata):
+    """Merge chunk results, index them by customer_id and write them as the store's new generation"""
+    store_dir = Path(store_dir)
+    generation = f"generation-{datetime.now().strftime('%Y%m%dT%H%M%S%f')}"
+    generation_dir = store_dir / generation
+    generation_dir.mkdir(parents=True)
+
+    customer_ids = np.concatenate([part['customer_ids'] for part in parts])
+    # Keep the last explanation for duplicate ids; np.unique also sorts them for binary search
+    _, last_index = np.unique(customer_ids[::-1], return_index=True)
+    order = len(customer_ids) - 1 - last_index
+    order = order[customer_ids[order] != '']
+
+    arrays = {
+        'customer_ids': np.char.encode(customer_ids[order], 'utf-8'),
+        'feature_index': np.concatenate([part['feature_index'] for part in parts])[order],
+        'shap_values': np.concatenate([part['shap_values'] for part in parts])[order],
+        'feature_hash': np.concatenate([part['feature_hash'] for part in parts])[order],
+    }
+    for name, array in arrays.items():
+        np.save(generation_dir / f'{name}.npy', array)
+    metadata = dict(metadata, count=int(len(order)), generation=generation)
+    with open(generation_dir / 'metadata.json', 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+    # One atomic rename switches readers to the complete new generation
+    with open(store_dir / f'{CURRENT_FILE}.tmp', 'w') as f:
+        f.write(generation)
+    os.replace(store_dir / f'{CURRENT_FILE}.tmp', store_dir / CURRENT_FILE)
+
+    for old in sorted(store_dir.glob('generation-*'))[:-KEEP_GENERATIONS]:
+        shutil.rmtree(old, ignore_errors=True)
+    return metadata['count']
+
+
+def build_explanation_store(chunks, store_dir=STORE_DIR, n_jobs=-1, top_k=TOP_K):
+    """Explain every customer in an iterable of DataFrame chunks and write the store"""
+    try:
+        import shap  # noqa: F401
+    except ImportError:
+        raise ImportError("SHAP is required to build the explanation store. Install with: pip install shap")
+
+    start_time = time.time()
+    model, scaler, encoders = load_artifacts()
+    model_version = get_model_version()
+    # Worker processes share this process's thread allocation
+    n_jobs = resolve_jobs(n_jobs)
+    configure_estimator(model, split_threads(n_jobs)[1])
+
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(explain_chunk)(chunk, model, scaler, encoders, top_k) for chunk in chunks
+    )
+    parts = [part for part in results if part is not None]
+    if not parts:
+        print("No model-scored customers to explain", file=sys.stderr)
+        return 0
+
+    count = write_store(parts, store_dir, {
+        'model_version': model_version,
+        'feature_names': FEATURE_COLS,
+        'top_k': top_k,
+        'created_at': datetime.now().isoformat(),
+    })
+    print(f"Stored explanations for {count:,} customers in {time.time() - start_time:.1f}s -> {store_dir}",
+          file=sys.stderr)
+    return count
+
+
+@lru_cache(maxsize=4)
+def _open_store(generation_dir):
+    """Memory-map the arrays of one generation (generations never change once written)"""
+    generation_dir = Path(generation_dir)
+    with open(generation_dir / 'metadata.json', 'r') as f:
+        metadata = json.load(f)
+    arrays = {
+        name: np.load(generation_dir / f'{name}.npy', mmap_mode='r')
+        for name in ['customer_ids', 'feature_index', 'shap_values', 'feature_hash']
+    }
+    return metadata, arrays
+
+
+def open_store(store_dir=STORE_DIR):
+    """Return (metadata, arrays) of the store's current generation, or None if it has not been built"""
+    current_path = Path(store_dir) / CURRENT_FILE
+    if not current_path.exists():
+        return None
+    generation = current_path.read_text().strip()
+    return _open_store(str((Path(store_dir) / generation).resolve()))
+
+
+def lookup_explanation(customer_id, store_dir=STORE_DIR, model_version=None, feature_hash=None):
+    """Look up a customer's precomputed explanation
+
+    Returns SHAP values in the same format as predict_churn(include_shap=True),
+    or None when the customer is not in the store or the stored entry was
+    produced by a different model version / different feature values.
+    """
+    store = open_store(store_dir)
+    if store is None:
+        return None
+    metadata, arrays = store
+    if model_version is not None and metadata['model_version'] != model_version:
+        return None
+
+    key = str(customer_id).encode('utf-8')
+    customer_ids = arrays['customer_ids']
+    position = int(np.searchsorted(customer_ids, key))
+    if position >= len(customer_ids) or customer_ids[position] != key:
+        return None
+    if feature_hash is not None and int(arrays['feature_hash'][position]) != int(feature_hash):
+        return None
+
+    feature_names = [metadata['feature_names'][i] for i in arrays['feature_index'][position]]
+    return format_shap_values(feature_names, arrays['shap_values'][position], top_k=metadata['top_k'])
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Precompute and look up SHAP explanations')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='Explain every customer in a file or the customers table')
+    build.add_argument('--input', help='Customer CSV or JSON lines file')
+    build.add_argument('--dsn', help='Database to read customers from (see score_database.py)')
+    build.add_argument('--store-dir', default=str(STORE_DIR))
+    build.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    build.add_argument('--jobs', type=int, default=-1, help='Parallel worker processes (default: all cores)')
+
+    lookup = subparsers.add_parser('lookup', help='Print the stored explanation for a customer')
+    lookup.add_argument('customer_id')
+    lookup.add_argument('--store-dir', default=str(STORE_DIR))
+
+    args = parser.parse_args()
+    # Only the parallel build logs its allocation; lookups run once per request
+    govern(role='explanation_store.py', quiet=None if args.command == 'lookup' else False)
+
+    if args.command == 'lookup':
+        print(json.dumps(lookup_explanation(args.customer_id, store_dir=args.store_dir)))
+        return
+
+    if args.input:
+        chunks = read_customer_file(args.input, args.chunk_size)
+        build_explanation_store(chunks, store_dir=args.store_dir, n_jobs=args.jobs)
+        return
+
+    from score_database import connect, stream_customers, transform_customer_rows
+    conn, dialect = connect(args.dsn)
+    try:
+        customers = stream_customers(conn, dialect, chunk_size=args.chunk_size, update_all=True)
+        chunks = (transform_customer_rows(chunk) for chunk in customers)
+        build_explanation_store(chunks, store_dir=args.store_dir, n_jobs=args.jobs)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
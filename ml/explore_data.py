@@ -1,6 +1,11 @@
 """
 Exploratory Data Analysis Script for BK Pulse Churn Dataset
 Generates insights and visualizations about the dataset
+
+Usage:
+    python explore_data.py                          # load the whole dataset in memory
+    python explore_data.py --stream                 # single chunked pass (streaming_eda.py)
+    python explore_data.py --stream --sample 0.1    # streaming pass over a 10% sample
 """
 
 import pandas as pd
@@ -8,6 +13,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
+import argparse
 from datetime import datetime
 
 # Configuration
@@ -225,12 +231,27 @@ def generate_report(stats, categorical, numerical):
     print(f"\nEDA Report saved to: {report_path}")
 
 
-def main():
+def main(stream=False, chunk_size=None, sample_fraction=None, n_jobs=1):
     """Main EDA function"""
     print("="*60)
     print("BK Pulse - Exploratory Data Analysis")
     print("="*60)
     
+    # Streaming mode: statistics and plots from one chunked pass with bounded memory
+    if stream:
+        import streaming_eda
+        stats, categorical, numerical = streaming_eda.run_streaming_eda(
+            RAW_DATA_PATH, OUTPUT_DIR,
+            chunk_size=chunk_size or streaming_eda.DEFAULT_CHUNK_SIZE,
+            sample_fraction=sample_fraction,
+            n_jobs=n_jobs
+        )
+        generate_report(stats, categorical, numerical)
+        print("\n" + "="*60)
+        print("EDA Complete!")
+        print("="*60)
+        return
+    
     # Load data
     df = load_data()
     
@@ -255,5 +276,12 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Exploratory data analysis of the raw churn dataset')
+    parser.add_argument('--stream', action='store_true', help='Single chunked pass with bounded memory')
+    parser.add_argument('--chunk-size', type=int, help='Rows per chunk in streaming mode (default: 100000)')
+    parser.add_argument('--sample', type=float, dest='sample_fraction',
+                        help='Fraction of rows to sample in streaming mode (e.g. 0.1)')
+    parser.add_argument('--jobs', type=int, default=1, help='Chunks summarized in parallel in streaming mode')
+    args = parser.parse_args()
+    main(stream=args.stream, chunk_size=args.chunk_size, sample_fraction=args.sample_fraction, n_jobs=args.jobs)
 
@@ -0,0 +1,233 @@
+"""
+Incremental Retraining Script for BK Pulse Churn Prediction
+Continues boosting the current production XGBoost / LightGBM model on only the
+new or changed rows of the raw dataset (compared with the training manifest
+written by preprocess.py). A drift check and a holdout comparison against the
+production model decide between the incremental model and a full retrain.
+
+Usage:
+    python incremental_train.py            # incremental, falls back to a full retrain when needed
+    python incremental_train.py --full     # force a full retrain
+"""
+
+import os
+import argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import joblib
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, roc_auc_score
+
+import preprocess
+import train_model
+from predict import FEATURE_COLS, prepare_features_batch
+
+# Configuration
+INCREMENTAL_ROUNDS = 10         # Boosting rounds added on top of the production model
+DRIFT_PSI_THRESHOLD = 0.25      # PSI above this on any feature means the population has shifted
+AUC_TOLERANCE = 0.005           # Incremental model may not lose more holdout ROC-AUC than this
+MAX_CHANGED_FRACTION = 0.5      # If more than half of the book changed, retrain from scratch
+MIN_DRIFT_ROWS = 500            # PSI on fewer new rows than this is too noisy to act on
+DELTA_HOLDOUT_FRACTION = 0.2
+
+# Production models that support continued training, in load_artifacts() priority order
+WARM_START_MODELS = [
+    ('XGBoost', 'xgboost_best.pkl', 'xgboost'),
+    ('LightGBM', 'lightgbm_best.pkl', 'lightgbm'),
+]
+
+
+def load_production_model():
+    """Load the current production booster (model name, model) or (None, None)"""
+    for model_name, file_name, module_name in WARM_START_MODELS:
+        model_path = os.path.join(train_model.MODELS_DIR, file_name)
+        if not os.path.exists(model_path):
+            continue
+        try:
+            __import__(module_name)
+        except (ImportError, FileNotFoundError, OSError) as import_error:
+            print(f"Warning: {model_name} not available ({import_error}). Skipping...")
+            continue
+        return model_name, joblib.load(model_path)
+    return None, None
+
+
+def load_raw_data():
+    """Load the raw dataset exactly as preprocess.py does (row hashes depend on it)"""
+    return pd.read_csv(preprocess.RAW_DATA_PATH)
+
+
+def find_changed_rows(raw_df):
+    """Boolean mask of rows that are new or changed since the last training run (None without a manifest)"""
+    if not os.path.exists(preprocess.TRAINING_MANIFEST_PATH):
+        return None
+    manifest = pd.read_csv(preprocess.TRAINING_MANIFEST_PATH, dtype={'Customer_ID': str, 'row_hash': 'uint64'})
+    current = pd.DataFrame({
+        'Customer_ID': raw_df['Customer_ID'].astype(str).values,
+        'row_hash': preprocess.row_hashes(raw_df).values
+    })
+    merged = current.merge(manifest.drop_duplicates(), on=['Customer_ID', 'row_hash'], how='left', indicator=True)
+    return (merged['_merge'] == 'left_only').to_numpy()
+
+
+def build_scaled_features(raw_df):
+    """Turn raw rows into scaled model features with the saved encoders and scaler"""
+    encoders = joblib.load(preprocess.ENCODER_PATH)
+    scaler = joblib.load(preprocess.SCALER_PATH)
+    customers = raw_df.rename(columns=lambda col: col.strip())
+    features = prepare_features_batch(customers, encoders)
+    return pd.DataFrame(scaler.transform(features), columns=FEATURE_COLS, index=raw_df.index)
+
+
+def population_stability_index(reference, current, bins=10):
+    """PSI between two samples of one feature, using reference quantile bins"""
+    # Round so discrete (encoded) values sitting on bin edges land in the same bin for both samples
+    reference, current = np.round(reference, 6), np.round(current, 6)
+    edges = np.unique(np.quantile(reference, np.linspace(0, 1, bins + 1)))
+    if len(edges) < 3:
+        return 0.0  # (Near-)constant feature
+    edges[0], edges[-1] = -np.inf, np.inf
+    reference_share = np.clip(np.histogram(reference, edges)[0] / len(reference), 1e-6, None)
+    current_share = np.clip(np.histogram(current, edges)[0] / len(current), 1e-6, None)
+    return float(np.sum((current_share - reference_share) * np.log(current_share / reference_share)))
+
+
+def feature_drift(X_reference, X_current):
+    """PSI per feature between the training data and the new rows"""
+    return {
+        col: population_stability_index(X_reference[col].to_numpy(), X_current[col].to_numpy())
+        for col in FEATURE_COLS
+    }
+
+
+def continue_training(model_name, model, X, y, rounds=INCREMENTAL_ROUNDS):
+    """Add boosting rounds to a copy of the production model using only the new rows"""
+    params = model.get_params()
+    params['n_estimators'] = rounds
+    if model_name == 'XGBoost':
+        from xgboost import XGBClassifier
+        incremental_model = XGBClassifier(**params)
+        incremental_model.fit(X, y, xgb_model=model.get_booster())
+    else:
+        from lightgbm import LGBMClassifier
+        incremental_model = LGBMClassifier(**params)
+        incremental_model.fit(X, y, init_model=model.booster_)
+    return incremental_model
+
+
+def holdout_metrics(model, X, y, model_name):
+    """Holdout metrics with the same keys as train_model.evaluate_model"""
+    y_pred = model.predict(X)
+    y_proba = model.predict_proba(X)[:, 1]
+    metrics = {
+        'model_name': model_name,
+        'test_accuracy': accuracy_score(y, y_pred),
+        'test_precision': precision_score(y, y_pred, average='binary', zero_division=0),
+        'test_recall': recall_score(y, y_pred, average='binary', zero_division=0),
+        'test_f1': f1_score(y, y_pred, average='binary', zero_division=0),
+    }
+    if len(np.unique(y)) > 1:
+        metrics['test_roc_auc'] = roc_auc_score(y, y_proba)
+    return metrics
+
+
+def run_full_retrain(reason):
+    """Preprocess and train from scratch (also rewrites the training manifest)"""
+    print(f"\nRunning full retrain: {reason}")
+    preprocess.preprocess_data()
+    train_model.main()
+    return 'full'
+
+
+def run_incremental(rounds=INCREMENTAL_ROUNDS):
+    """Incrementally retrain the production model, falling back to a full retrain when needed"""
+    print("="*60)
+    print("BK Pulse - Incremental Model Retraining")
+    print("="*60)
+
+    model_name, production_model = load_production_model()
+    if production_model is None:
+        return run_full_retrain("no XGBoost/LightGBM production model to continue from")
+
+    raw_df = load_raw_data()
+    changed = find_changed_rows(raw_df)
+    if changed is None:
+        return run_full_retrain("no training manifest found")
+
+    changed_fraction = changed.mean() if len(changed) else 0.0
+    print(f"Changed or new rows: {changed.sum():,} of {len(raw_df):,} ({changed_fraction:.1%})")
+    if not changed.any():
+        print("No new or changed rows - production model is up to date")
+        return 'skipped'
+    if changed_fraction > MAX_CHANGED_FRACTION:
+        return run_full_retrain(f"{changed_fraction:.0%} of rows changed")
+
+    delta = raw_df[changed]
+    X_delta = build_scaled_features(delta)
+    y_delta = delta['Churn_Flag'].astype(int)
+
+    # Drift check: new rows vs. the data the production model was trained on
+    X_train, X_test, y_train, y_test = train_model.load_processed_data()
+    drift = feature_drift(X_train, X_delta) if len(X_delta) >= MIN_DRIFT_ROWS else {}
+    drifted = {col: psi for col, psi in drift.items() if psi > DRIFT_PSI_THRESHOLD}
+    if drifted:
+        worst = max(drifted, key=drifted.get)
+        return run_full_retrain(f"population drift on {len(drifted)} feature(s), worst {worst} (PSI {drifted[worst]:.3f})")
+
+    # Keep part of the new rows as holdout so the comparison also covers recent data
+    stratify = y_delta if y_delta.nunique() > 1 and y_delta.value_counts().min() >= 2 else None
+    X_delta_train, X_delta_holdout, y_delta_train, y_delta_holdout = train_test_split(
+        X_delta, y_delta, test_size=DELTA_HOLDOUT_FRACTION, random_state=42, stratify=stratify
+    )
+    if y_delta_train.nunique() < 2:
+        return run_full_retrain("new rows contain a single class")
+
+    print(f"\nContinuing {model_name} for {rounds} rounds on {len(X_delta_train):,} rows...")
+    incremental_model = continue_training(model_name, production_model, X_delta_train, y_delta_train, rounds)
+
+    X_holdout = pd.concat([X_test, X_delta_holdout], ignore_index=True)
+    y_holdout = pd.concat([y_test, y_delta_holdout], ignore_index=True)
+    production_metrics = holdout_metrics(production_model, X_holdout, y_holdout, model_name)
+    incremental_metrics = holdout_metrics(incremental_model, X_holdout, y_holdout, model_name)
+
+    production_auc = production_metrics.get('test_roc_auc', production_metrics['test_f1'])
+    incremental_auc = incremental_metrics.get('test_roc_auc', incremental_metrics['test_f1'])
+    print(f"  Production holdout ROC-AUC:  {production_auc:.4f}")
+    print(f"  Incremental holdout ROC-AUC: {incremental_auc:.4f}")
+    if incremental_auc < production_auc - AUC_TOLERANCE:
+        return run_full_retrain("incremental model underperforms the production model on holdout")
+
+    incremental_metrics.update({
+        'training_mode': 'incremental',
+        'incremental_rounds': rounds,
+        'delta_rows': int(len(X_delta_train)),
+        'production_holdout_roc_auc': production_auc,
+        'max_feature_psi': max(drift.values()) if drift else 0.0,
+        'trained_at': datetime.now().isoformat(),
+    })
+    train_model.save_model(incremental_model, model_name, incremental_metrics, version='best', X_reference=X_holdout)
+    preprocess.save_training_manifest(raw_df)
+
+    print("\n" + "="*60)
+    print(f"Incremental {model_name} model promoted to production")
+    print("="*60)
+    return 'incremental'
+
+
+def main():
+    """Main incremental training function"""
+    parser = argparse.ArgumentParser(description='Warm-start retraining of the production model')
+    parser.add_argument('--full', action='store_true', help='Force a full retrain')
+    parser.add_argument('--rounds', type=int, default=INCREMENTAL_ROUNDS, help='Boosting rounds to add')
+    args = parser.parse_args()
+
+    if args.full:
+        run_full_retrain("requested with --full")
+    else:
+        run_incremental(rounds=args.rounds)
+
+
+if __name__ == '__main__':
+    main()
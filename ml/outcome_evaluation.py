@@ -0,0 +1,371 @@
+"""
+Realized-Outcome Evaluation for BK Pulse Churn Prediction
+Compares churn scores with the churn outcomes that actually happened, overall
+and per slice (risk level, segment, branch, model version).
+
+Every slice keeps two score histograms (churned / not churned customers) with
+SCORE_BINS_PER_POINT bins per churn-score point. The confusion matrix at the
+50-point decision threshold, precision / recall / F1, ROC-AUC and calibration
+curves all follow from these counts. A batch of outcomes becomes one bincount
+over (slice, outcome, score bin) for all slices at once.
+
+Updates are incremental: a compact columnar ledger remembers each evaluated
+customer's bin, outcome and slices, so a customer whose score or outcome
+changes is subtracted and re-added instead of recounting the history. The
+database job only reads outcome rows updated since its last run.
+
+Usage:
+    python outcome_evaluation.py update                         # new outcomes from the customers table
+    python outcome_evaluation.py update --full                  # rebuild from every outcome
+    python outcome_evaluation.py evaluate outcomes.csv -o outcome_evaluation.json
+"""
+
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = Path(__file__).parent
+EVALUATION_REPORT_PATH = BASE_DIR / '../data/monitoring/outcome_evaluation.json'
+EVALUATION_STATE_PATH = BASE_DIR / '../data/monitoring/outcome_evaluation_state.npz'
+
+SCORE_BINS_PER_POINT = 10       # 0.1 churn-score point resolution
+N_SCORE_BINS = 100 * SCORE_BINS_PER_POINT + 1
+DECISION_THRESHOLD = 50         # churn_score >= 50 counts as predicted churn (as in modelValidation.js)
+CALIBRATION_BINS = 10
+SCORE_RANGES = [(0, 20), (20, 40), (40, 60), (60, 80), (80, 100)]
+SLICE_DIMENSIONS = ['risk_level', 'segment', 'branch', 'model_version']
+OVERALL_SLICE = 'all'
+
+# Accepted spellings of the input columns
+SCORE_COLUMNS = ['churn_score', 'churn_probability']
+OUTCOME_COLUMNS = ['actual_churn_flag', 'churned', 'Churn_Flag']
+
+
+def score_bins(frame):
+    """Score bin of every row (churn_score in points, or churn_probability scaled to points)"""
+    if 'churn_score' in frame.columns:
+        scores = pd.to_numeric(frame['churn_score'], errors='coerce').to_numpy(dtype=float)
+    else:
+        scores = pd.to_numeric(frame['churn_probability'], errors='coerce').to_numpy(dtype=float) * 100
+    # Small epsilon so 49.9 stored as 49.8999... stays in its bin
+    return np.clip(np.floor(scores * SCORE_BINS_PER_POINT + 1e-6), 0, N_SCORE_BINS - 1), np.isfinite(scores)
+
+
+def outcome_labels(frame):
+    """Churned (1) / retained (0) outcome of every row, NaN where unknown"""
+    column = next(col for col in OUTCOME_COLUMNS if col in frame.columns)
+    values = frame[column]
+    if values.dtype == object or pd.api.types.is_string_dtype(values):
+        values = values.astype(str).str.strip().str.lower().map(
+            {'true': 1, 't': 1, '1': 1, 'yes': 1, 'false': 0, 'f': 0, '0': 0, 'no': 0})
+    return pd.to_numeric(values, errors='coerce').to_numpy(dtype=float)
+
+
+def customer_keys(frame):
+    """Stable 64-bit key per customer (row position when there is no customer_id)"""
+    if 'customer_id' not in frame.columns:
+        return np.arange(len(frame), dtype=np.uint64)
+    return pd.util.hash_array(frame['customer_id'].astype(str).to_numpy(dtype=object))
+
+
+class OutcomeEvaluator:
+    """Per-slice outcome/score histograms with a ledger for incremental updates"""
+
+    def __init__(self, slices=None):
+        self.slices = list(slices or [OVERALL_SLICE])
+        self._slice_codes = {name: code for code, name in enumerate(self.slices)}
+        self.counts = np.zeros((len(self.slices), 2, N_SCORE_BINS), dtype=np.int64)
+        self.keys = np.array([], dtype=np.uint64)
+        self.bins = np.array([], dtype=np.int16)
+        self.labels = np.array([], dtype=np.int8)
+        self.slice_ids = np.zeros((0, len(SLICE_DIMENSIONS)), dtype=np.int32)
+        self.watermark = None
+
+    def _codes(self, dimension, values):
+        """Slice code of every value of one dimension (-1 where missing), adding new slices"""
+        labels, uniques = pd.factorize(values)
+        mapping = []
+        for value in uniques:
+            name = f"{dimension}={value}"
+            if name not in self._slice_codes:
+                self._slice_codes[name] = len(self.slices)
+                self.slices.append(name)
+            mapping.append(self._slice_codes[name])
+        if len(self.slices) > self.counts.shape[0]:
+            grown = np.zeros((len(self.slices), 2, N_SCORE_BINS), dtype=np.int64)
+            grown[:self.counts.shape[0]] = self.counts
+            self.counts = grown
+        mapping = np.array(mapping + [-1], dtype=np.int32)
+        return mapping[labels]
+
+    def _add(self, bins, labels, slice_ids, sign=1):
+        """Add (or subtract) rows to every slice they belong to in one bincount"""
+        if len(bins) == 0:
+            return
+        cell = labels.astype(np.int64) * N_SCORE_BINS + bins
+        stride = 2 * N_SCORE_BINS
+        flat = [cell]   # the overall slice
+        for column in slice_ids.T:
+            present = column >= 0
+            flat.append(column[present].astype(np.int64) * stride + cell[present])
+        delta = np.bincount(np.concatenate(flat), minlength=self.counts.size)
+        self.counts += sign * delta.reshape(self.counts.shape)
+
+    def update(self, frame):
+        """Add a batch of outcome rows; customers seen before are replaced, not double counted"""
+        bins, scored = score_bins(frame)
+        labels = outcome_labels(frame)
+        valid = scored & np.isfinite(labels)
+        if not valid.any():
+            return 0
+        frame = frame[valid]
+        keys = customer_keys(frame)
+        bins, labels = bins[valid].astype(np.int16), labels[valid].astype(np.int8)
+        slice_ids = np.column_stack([
+            self._codes(dimension, frame[dimension].astype(str).where(frame[dimension].notna()).to_numpy(dtype=object))
+            if dimension in frame.columns else np.full(len(frame), -1, dtype=np.int32)
+            for dimension in SLICE_DIMENSIONS
+        ])
+
+        # Last row per customer within the batch
+        _, last = np.unique(keys[::-1], return_index=True)
+        last = len(keys) - 1 - last
+        keys, bins, labels, slice_ids = keys[last], bins[last], labels[last], slice_ids[last]
+
+        # Customers already in the ledger: take their previous contribution out
+        seen = np.isin(self.keys, keys)
+        if seen.any():
+            self._add(self.bins[seen], self.labels[seen], self.slice_ids[seen], sign=-1)
+            keep = ~seen
+            self.keys, self.bins = self.keys[keep], self.bins[keep]
+            self.labels, self.slice_ids = self.labels[keep], self.slice_ids[keep]
+
+        self._add(bins, labels, slice_ids)
+        self.keys = np.concatenate([self.keys, keys])
+        self.bins = np.concatenate([self.bins, bins])
+        self.labels = np.concatenate([self.labels, labels])
+        self.slice_ids = np.concatenate([self.slice_ids, slice_ids])
+        return len(keys)
+
+    def metrics(self):
+        """Metrics of every slice, computed from the histograms for all slices at once"""
+        negatives, positives = self.counts[:, 0, :], self.counts[:, 1, :]
+        threshold = DECISION_THRESHOLD * SCORE_BINS_PER_POINT
+        tp = positives[:, threshold:].sum(axis=1)
+        fn = positives[:, :threshold].sum(axis=1)
+        fp = negatives[:, threshold:].sum(axis=1)
+        tn = negatives[:, :threshold].sum(axis=1)
+        total = tp + fn + fp + tn
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = np.nan_to_num(tp / (tp + fp))
+            recall = np.nan_to_num(tp / (tp + fn))
+            f1 = np.nan_to_num(2 * precision * recall / (precision + recall))
+            accuracy = np.nan_to_num((tp + tn) / total)
+            # ROC-AUC: probability a churner outscores a retained customer (ties within a bin count half)
+            negatives_below = np.cumsum(negatives, axis=1) - negatives
+            pairs = positives.sum(axis=1) * negatives.sum(axis=1)
+            auc = ((positives * (negatives_below + 0.5 * negatives)).sum(axis=1) / pairs)
+
+        centers = (np.arange(N_SCORE_BINS) + 0.5) / SCORE_BINS_PER_POINT
+        centers[-1] = 100.0
+        calibration_bin = np.minimum((centers // (100 / CALIBRATION_BINS)).astype(int), CALIBRATION_BINS - 1)
+        both = negatives + positives
+        calibration_counts = np.stack([both[:, calibration_bin == b].sum(axis=1) for b in range(CALIBRATION_BINS)], 1)
+        calibration_scores = np.stack([(both[:, calibration_bin == b] * centers[calibration_bin == b]).sum(axis=1)
+                                       for b in range(CALIBRATION_BINS)], 1)
+        calibration_churned = np.stack([positives[:, calibration_bin == b].sum(axis=1)
+                                        for b in range(CALIBRATION_BINS)], 1)
+
+        results = {}
+        for code, name in enumerate(self.slices):
+            if total[code] == 0:
+                continue
+            results[name] = {
+                'total': int(total[code]),
+                'churned': int(tp[code] + fn[code]),
+                'accuracy': round(float(accuracy[code]), 6),
+                'precision': round(float(precision[code]), 6),
+                'recall': round(float(recall[code]), 6),
+                'f1_score': round(float(f1[code]), 6),
+                'roc_auc': round(float(auc[code]), 6) if pairs[code] else None,
+                'confusion_matrix': {'tp': int(tp[code]), 'tn': int(tn[code]),
+                                     'fp': int(fp[code]), 'fn': int(fn[code])},
+                'calibration': [
+                    {'bin': f"{b * 100 // CALIBRATION_BINS}-{(b + 1) * 100 // CALIBRATION_BINS}",
+                     'count': int(calibration_counts[code, b]),
+                     'mean_predicted': round(float(calibration_scores[code, b] / calibration_counts[code, b] / 100), 4),
+                     'observed_rate': round(float(calibration_churned[code, b] / calibration_counts[code, b]), 4)}
+                    for b in range(CALIBRATION_BINS) if calibration_counts[code, b]
+                ],
+            }
+        return results
+
+    def score_distribution(self, code=0):
+        """Outcome counts per churn-score range (same ranges as modelValidation.js)"""
+        distribution = []
+        for low, high in SCORE_RANGES:
+            stop = high * SCORE_BINS_PER_POINT + (1 if high == 100 else 0)
+            counts = self.counts[code, :, low * SCORE_BINS_PER_POINT:stop].sum(axis=1)
+            rows = int(counts.sum())
+            distribution.append({'range': f"{low}-{high}%", 'total': rows, 'churned': int(counts[1]),
+                                 'churn_rate': round(float(counts[1] / rows), 6) if rows else 0})
+        return distribution
+
+    def report(self, model_version=None):
+        """Validation report (the metrics object served by /api/model-validation/metrics)"""
+        slices = self.metrics()
+        overall = slices.get(OVERALL_SLICE)
+        metrics = {'total': 0, 'accuracy': 0, 'precision': 0, 'recall': 0, 'f1_score': 0, 'roc_auc': None,
+                   'confusion_matrix': {'true_positive': 0, 'true_negative': 0,
+                                        'false_positive': 0, 'false_negative': 0}}
+        if overall is not None:
+            matrix = overall['confusion_matrix']
+            metrics = {
+                'total': overall['total'],
+                # Percentages with 2 decimals, as the server always reported them
+                'accuracy': round(overall['accuracy'] * 100, 2),
+                'precision': round(overall['precision'] * 100, 2),
+                'recall': round(overall['recall'] * 100, 2),
+                'f1_score': round(overall['f1_score'] * 100, 2),
+                'roc_auc': overall['roc_auc'],
+                'confusion_matrix': {'true_positive': matrix['tp'], 'true_negative': matrix['tn'],
+                                     'false_positive': matrix['fp'], 'false_negative': matrix['fn']},
+                'calibration': overall['calibration'],
+            }
+        for dimension in SLICE_DIMENSIONS:
+            prefix = f"{dimension}="
+            metrics[f"by_{dimension}"] = {name[len(prefix):]: values for name, values in slices.items()
+                                          if name.startswith(prefix)}
+        metrics['score_distribution'] = self.score_distribution()
+        return {
+            'generated_at': datetime.now().isoformat(),
+            'model_version': model_version,
+            'decision_threshold': DECISION_THRESHOLD,
+            'watermark': self.watermark,
+            'metrics': metrics,
+        }
+
+    def write_report(self, path=EVALUATION_REPORT_PATH, model_version=None):
+        """Write the report as JSON"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        report = self.report(model_version)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        return report
+
+    def save(self, path=EVALUATION_STATE_PATH):
+        """Persist histograms and ledger (columnar .npz) for the next incremental update"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(
+            path, counts=self.counts, keys=self.keys, bins=self.bins, labels=self.labels,
+            slice_ids=self.slice_ids, meta=np.array(json.dumps({
+                'slices': self.slices, 'dimensions': SLICE_DIMENSIONS, 'bins': N_SCORE_BINS,
+                'watermark': self.watermark}))
+        )
+        return path
+
+    @classmethod
+    def load(cls, path=EVALUATION_STATE_PATH):
+        """Evaluator from a saved state, or a fresh one if there is none (or it has another layout)"""
+        path = Path(path)
+        if not path.exists():
+            return cls()
+        with np.load(path) as state:
+            meta = json.loads(str(state['meta']))
+            if meta['dimensions'] != SLICE_DIMENSIONS or meta['bins'] != N_SCORE_BINS:
+                return cls()
+            evaluator = cls(meta['slices'])
+            evaluator.counts = state['counts']
+            evaluator.keys, evaluator.bins, evaluator.labels = state['keys'], state['bins'], state['labels']
+            evaluator.slice_ids = state['slice_ids']
+            evaluator.watermark = meta['watermark']
+        return evaluator
+
+
+def stream_outcomes(conn, dialect, since=None, chunk_size=100000):
+    """Yield scored customers with a recorded outcome (only rows updated at or after `since`)"""
+    from score_database import get_table_columns
+    from risk_index import read_query
+    available = set(get_table_columns(conn))
+    wanted = ['customer_id', 'churn_score', 'actual_churn_flag', 'updated_at'] + SLICE_DIMENSIONS
+    columns = [col for col in wanted if col in available]
+    query = f"SELECT {', '.join(columns)} FROM customers WHERE churn_score IS NOT NULL AND actual_churn_flag IS NOT NULL"
+    params = []
+    if since is not None and 'updated_at' in available:
+        # >= so rows sharing the last timestamp are not missed (the ledger makes re-reads harmless)
+        query += " AND updated_at >= ?"
+        params.append(since)
+    if 'updated_at' in available:
+        # Oldest first, so the latest row of a duplicated customer is the one kept
+        query += " ORDER BY updated_at"
+    yield from read_query(conn, dialect, query, params, chunk_size=chunk_size, name='bk_pulse_outcomes')
+
+
+def update_from_database(dsn=None, full=False, state_path=EVALUATION_STATE_PATH,
+                         report_path=EVALUATION_REPORT_PATH):
+    """Add outcomes recorded since the last run and rewrite the report"""
+    from score_database import connect
+    from predict import get_model_version
+    evaluator = OutcomeEvaluator() if full else OutcomeEvaluator.load(state_path)
+    conn, dialect = connect(dsn)
+    start_time = time.time()
+    added = 0
+    try:
+        for chunk in stream_outcomes(conn, dialect, since=evaluator.watermark):
+            added += evaluator.update(chunk)
+            if 'updated_at' in chunk.columns and chunk['updated_at'].notna().any():
+                latest = str(chunk['updated_at'].dropna().max())
+                evaluator.watermark = max(evaluator.watermark or latest, latest)
+    finally:
+        conn.close()
+    evaluator.save(state_path)
+    try:
+        model_version = get_model_version()
+    except Exception:
+        model_version = None
+    report = evaluator.write_report(report_path, model_version)
+    print(f"Evaluated {added:,} new outcomes ({report['metrics']['total']:,} total) "
+          f"in {time.time() - start_time:.1f}s -> {report_path}", file=sys.stderr)
+    return report
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Evaluate churn scores against realized outcomes')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    update = subparsers.add_parser('update', help='Add new outcomes from the customers table')
+    update.add_argument('--dsn', default=None,
+                        help='PostgreSQL URL or sqlite:///path (default: DATABASE_URL or DB_* settings)')
+    update.add_argument('--full', action='store_true', help='Rebuild from every outcome')
+    update.add_argument('--state', default=str(EVALUATION_STATE_PATH))
+    update.add_argument('-o', '--output', default=str(EVALUATION_REPORT_PATH))
+
+    evaluate = subparsers.add_parser('evaluate', help='Evaluate a CSV of scores and outcomes')
+    evaluate.add_argument('input')
+    evaluate.add_argument('-o', '--output', default=str(EVALUATION_REPORT_PATH))
+    evaluate.add_argument('--chunk-size', type=int, default=100000)
+
+    args = parser.parse_args()
+    if args.command == 'update':
+        update_from_database(args.dsn, args.full, args.state, args.output)
+        return
+
+    evaluator = OutcomeEvaluator()
+    for chunk in pd.read_csv(args.input, chunksize=args.chunk_size):
+        evaluator.update(chunk)
+    report = evaluator.write_report(args.output)
+    print(json.dumps({key: report['metrics'][key] for key in ('total', 'accuracy', 'precision', 'recall',
+                                                              'f1_score', 'roc_auc')}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,396 @@
+"""
+Cached ML Pipeline Runner for BK Pulse Churn Prediction
+Runs the pipeline stages in-process as a small dependency graph:
+
+    clean -> preprocess -> train -> evaluate -> export
+          \\-> explore (EDA, runs in parallel with preprocess/train)
+
+Every stage run is keyed by a hash of its code, parameters and input file
+contents. A stage whose key was already run, and whose recorded outputs are
+unchanged on disk, is skipped. Train and evaluate write into content-addressed
+directories (data/pipeline_cache/<stage>/<key>/), so switching back to earlier
+training parameters reuses the earlier result. Stages whose dependencies are
+done run in parallel.
+
+clean and explore only run when requested.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import joblib
+import pandas as pd
+
+import clean_dataset
+import preprocess
+import train_model
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(train_model.BASE_DIR, 'data', 'pipeline_cache')
+STATE_FILE = 'state.json'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+DEFAULT_TARGETS = ['export']
+DEFAULT_PARAMS = {
+    'imbalance_strategy': train_model.DEFAULT_IMBALANCE_STRATEGY,
+    'out_of_core': False,
+    'sample_size': 200000,
+}
+
+
+# ---------------------------------------------------------------------------
+# Stage implementations
+# run(output_dir, params, dirs) returns the list of files the stage wrote;
+# dirs maps upstream stage names to their content-addressed output directory.
+# ---------------------------------------------------------------------------
+
+def processed_file(name):
+    """Path of a file written by preprocess.py"""
+    return os.path.join(train_model.PROCESSED_DATA_DIR, name)
+
+
+PROCESSED_OUTPUTS = ['X_train.csv', 'X_test.csv', 'y_train.csv', 'y_test.csv', 'scaler.pkl', 'encoders.pkl',
+                     'reference_histograms.json']
+
+
+def run_clean(output_dir, params, dirs):
+    """Keep only the feature columns of the raw dataset (in place, with a backup)"""
+    if not clean_dataset.clean_dataset():
+        raise RuntimeError("Dataset cleaning failed")
+    return [str(clean_dataset.RAW_DATA_PATH)]
+
+
+def run_preprocess(output_dir, params, dirs):
+    """Clean, encode, split and scale the raw dataset"""
+    preprocess.preprocess_data()
+    return [processed_file(name) for name in PROCESSED_OUTPUTS]
+
+
+def run_explore(output_dir, params, dirs):
+    """Exploratory data analysis report and plots"""
+    import matplotlib
+    matplotlib.use('Agg')  # Plots are rendered off the main thread
+    import explore_data
+    explore_data.main()
+    eda_dir = os.path.join(ML_DIR, explore_data.OUTPUT_DIR)
+    return [os.path.join(eda_dir, name) for name in sorted(os.listdir(eda_dir))]
+
+
+def run_train(output_dir, params, dirs):
+    """Train the candidate models and keep them (with their metrics) in the stage cache"""
+    if params['out_of_core']:
+        import train_out_of_core
+        results, trained_models, best_model_name, _, _ = train_out_of_core.train_models_out_of_core(
+            sample_size=params['sample_size']
+        )
+    else:
+        X_train, X_test, y_train, y_test = train_model.load_processed_data()
+        results, trained_models, best_model_name, _ = train_model.train_with_imbalance_strategy(
+            X_train, X_test, y_train, y_test, params['imbalance_strategy']
+        )
+    trained_path = os.path.join(output_dir, 'trained.joblib')
+    joblib.dump({
+        'results': results,
+        'trained_models': trained_models,
+        'best_model_name': best_model_name,
+    }, trained_path)
+    return [trained_path]
+
+
+def run_evaluate(output_dir, params, dirs):
+    """Model comparison and explanation artifacts for the best model on the test set"""
+    trained = joblib.load(os.path.join(dirs['train'], 'trained.joblib'))
+    best_model_name = trained['best_model_name']
+    X_test = pd.read_csv(processed_file('X_test.csv'))
+
+    explanations = train_model.compute_explanation_artifacts(
+        trained['trained_models'][best_model_name], best_model_name, X_test, 'best'
+    )
+    explanations_path = os.path.join(output_dir, 'explanations.json')
+    with open(explanations_path, 'w') as f:
+        json.dump(explanations, f, indent=2)
+
+    comparison_path = os.path.join(output_dir, 'model_comparison.json')
+    with open(comparison_path, 'w') as f:
+        json.dump(trained['results'], f, indent=2)
+    return [explanations_path, comparison_path]
+
+
+def run_export(output_dir, params, dirs):
+    """Publish the best model, its metrics and explanations to data/models"""
+    trained = joblib.load(os.path.join(dirs['train'], 'trained.joblib'))
+    best_model_name = trained['best_model_name']
+    best_metrics = next(r for r in trained['results'] if r['model_name'] == best_model_name)
+
+    model_path, metrics_path = train_model.save_model(
+        trained['trained_models'][best_model_name], best_model_name, best_metrics, version='best'
+    )
+    file_stem = best_model_name.lower().replace(" ", "_")
+    latest_path = os.path.join(train_model.MODELS_DIR, f'latest_{file_stem}.pkl')
+
+    os.makedirs(train_model.EXPLANATIONS_DIR, exist_ok=True)
+    explanations_path = os.path.join(train_model.EXPLANATIONS_DIR, f'{file_stem}_best.json')
+    shutil.copyfile(os.path.join(dirs['evaluate'], 'explanations.json'), explanations_path)
+    print(f"Explanations saved to: {explanations_path}")
+
+    train_model.save_comparison_report(trained['results'])
+    return [model_path, metrics_path, latest_path, explanations_path]
+
+
+# Stage graph. 'code' lists the modules whose source is part of the stage key,
+# 'params' the run parameters it depends on, 'inputs' the files it reads and
+# 'cached' whether its outputs live in a content-addressed cache directory.
+PIPELINE_STAGES = [
+    {
+        'name': 'clean',
+        'after': [],
+        'optional': True,
+        'code': ['clean_dataset.py'],
+        'params': [],
+        'inputs': lambda dirs: [str(clean_dataset.RAW_DATA_PATH)],
+        'cached': False,
+        'run': run_clean,
+    },
+    {
+        'name': 'explore',
+        'after': ['clean'],
+        'optional': True,
+        'code': ['explore_data.py'],
+        'params': [],
+        'inputs': lambda dirs: [os.path.normpath(preprocess.RAW_DATA_PATH)],
+        'cached': False,
+        'run': run_explore,
+    },
+    {
+        'name': 'preprocess',
+        'after': ['clean'],
+        'optional': False,
+        'code': ['preprocess.py'],
+        'params': [],
+        'inputs': lambda dirs: [os.path.normpath(preprocess.RAW_DATA_PATH)],
+        'cached': False,
+        'run': run_preprocess,
+    },
+    {
+        'name': 'train',
+        'after': ['preprocess'],
+        'optional': False,
+        'code': ['train_model.py', 'train_out_of_core.py'],
+        'params': ['imbalance_strategy', 'out_of_core', 'sample_size'],
+        'inputs': lambda dirs: [processed_file(name) for name in ['X_train.csv', 'X_test.csv', 'y_train.csv', 'y_test.csv']],
+        'cached': True,
+        'run': run_train,
+    },
+    {
+        'name': 'evaluate',
+        'after': ['train'],
+        'optional': False,
+        'code': ['train_model.py'],
+        'params': [],
+        'inputs': lambda dirs: [os.path.join(dirs['train'], 'trained.joblib'), processed_file('X_test.csv')],
+        'cached': True,
+        'run': run_evaluate,
+    },
+    {
+        'name': 'export',
+        'after': ['train', 'evaluate'],
+        'optional': False,
+        'code': ['train_model.py'],
+        'params': [],
+        'inputs': lambda dirs: [os.path.join(dirs['train'], 'trained.joblib'),
+                                os.path.join(dirs['evaluate'], 'explanations.json')],
+        'cached': False,
+        'run': run_export,
+    },
+]
+
+STAGES_BY_NAME = {stage['name']: stage for stage in PIPELINE_STAGES}
+
+
+# ---------------------------------------------------------------------------
+# Content hashing and run state
+# ---------------------------------------------------------------------------
+
+def load_state(cache_dir=CACHE_DIR):
+    """Recorded stage runs, the most recent key per stage and the file hash cache"""
+    state_path = os.path.join(cache_dir, STATE_FILE)
+    if os.path.exists(state_path):
+        with open(state_path, 'r') as f:
+            return json.load(f)
+    return {'stages': {}, 'last': {}, 'files': {}}
+
+
+def save_state(state, cache_dir=CACHE_DIR):
+    """Write the run state atomically"""
+    os.makedirs(cache_dir, exist_ok=True)
+    state_path = os.path.join(cache_dir, STATE_FILE)
+    with open(state_path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(state_path + '.tmp', state_path)
+
+
+def file_hash(path, state):
+    """SHA-256 of a file's contents (reused while its size and mtime are unchanged)"""
+    path = os.path.abspath(path)
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    cached = state['files'].get(path)
+    if cached and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+        return cached['sha256']
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(block)
+    state['files'][path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+    return digest.hexdigest()
+
+
+def stage_key(stage, params, dirs, state):
+    """Hash of the stage's code, parameters and input file contents"""
+    description = {
+        'stage': stage['name'],
+        'code': {name: file_hash(os.path.join(ML_DIR, name), state) for name in stage['code']},
+        'params': {name: params[name] for name in stage['params']},
+        'inputs': {os.path.basename(path): file_hash(path, state) for path in stage['inputs'](dirs)},
+    }
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def outputs_unchanged(record, state):
+    """True if every output recorded for a stage run still has the recorded contents"""
+    return all(file_hash(path, state) == digest for path, digest in record['outputs'].items())
+
+
+def plan_stages(targets):
+    """Stages needed for the targets, in declaration order (optional stages only when requested)"""
+    needed = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name in needed:
+            continue
+        if name not in STAGES_BY_NAME:
+            raise ValueError(f"Unknown pipeline stage: {name}")
+        needed.add(name)
+        pending.extend(dep for dep in STAGES_BY_NAME[name]['after']
+                       if dep in targets or not STAGES_BY_NAME[dep]['optional'])
+    return [stage for stage in PIPELINE_STAGES if stage['name'] in needed]
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+def run_pipeline(targets=DEFAULT_TARGETS, params=None, force=False, max_workers=2, cache_dir=CACHE_DIR):
+    """Run the stages needed for targets, skipping stages whose inputs are unchanged
+
+    Returns {stage name: 'ran' | 'cached'}; raises the first stage error.
+    """
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    stages = plan_stages(targets)
+    state = load_state(cache_dir)
+    state_lock = threading.Lock()
+    dirs = {}
+    status = {}
+
+    def execute(stage, key):
+        """Run one stage and return the hashes of the files it wrote"""
+        output_dir = os.path.join(cache_dir, stage['name'], key) if stage['cached'] else None
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        start_time = time.time()
+        outputs = stage['run'](output_dir, params, dict(dirs))
+        with state_lock:
+            return {
+                'outputs': {os.path.abspath(path): file_hash(path, state) for path in outputs},
+                'seconds': round(time.time() - start_time, 2),
+                'finished_at': datetime.now().isoformat(),
+            }
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        remaining = list(stages)
+        while remaining or running:
+            # Start every stage whose dependencies are done
+            for stage in list(remaining):
+                deps = [dep for dep in stage['after'] if any(s['name'] == dep for s in stages)]
+                if any(dep not in status for dep in deps):
+                    continue
+                remaining.remove(stage)
+                with state_lock:
+                    key = stage_key(stage, params, dirs, state)
+                    record = state['stages'].get(stage['name'], {}).get(key)
+                    # Stages writing to shared locations must also match their most recent run
+                    current = stage['cached'] or state['last'].get(stage['name']) == key
+                    cached = not force and record is not None and current and outputs_unchanged(record, state)
+                if stage['cached']:
+                    dirs[stage['name']] = os.path.join(cache_dir, stage['name'], key)
+                if cached:
+                    print(f"\n✓ {stage['name']}: unchanged, skipped (key {key})")
+                    status[stage['name']] = 'cached'
+                    continue
+                print(f"\n{'='*60}")
+                print(f"Running stage: {stage['name']} (key {key})")
+                print('='*60)
+                running[executor.submit(execute, stage, key)] = (stage, key)
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, key = running.pop(future)
+                record = future.result()  # Re-raises a failed stage's error
+                with state_lock:
+                    runs = state['stages'].setdefault(stage['name'], {})
+                    runs[key] = record
+                    state['last'][stage['name']] = key
+                    # In-place stages (clean) also record the key of their own output,
+                    # so an unchanged second run is recognised as done
+                    if set(record['outputs']) & {os.path.abspath(p) for p in stage['inputs'](dirs)}:
+                        state['last'][stage['name']] = stage_key(stage, params, dirs, state)
+                        runs[state['last'][stage['name']]] = record
+                    save_state(state, cache_dir)
+                status[stage['name']] = 'ran'
+                print(f"\n✓ {stage['name']} completed in {record['seconds']:.1f}s")
+
+    return status
+
+
+def main(argv=None):
+    """Command line entry point"""
+    import argparse
+    parser = argparse.ArgumentParser(description='Run the cached BK Pulse ML pipeline')
+    parser.add_argument('stages', nargs='*', default=DEFAULT_TARGETS,
+                        help=f"Target stages (default: export). Choices: {', '.join(STAGES_BY_NAME)}")
+    parser.add_argument('--force', action='store_true', help='Re-run every stage even if unchanged')
+    parser.add_argument('--imbalance-strategy', choices=train_model.IMBALANCE_STRATEGIES,
+                        default=DEFAULT_PARAMS['imbalance_strategy'])
+    parser.add_argument('--out-of-core', action='store_true', help='Train from shards (train_out_of_core.py)')
+    parser.add_argument('--sample-size', type=int, default=DEFAULT_PARAMS['sample_size'])
+    parser.add_argument('--jobs', type=int, default=2, help='Stages run in parallel (default: 2)')
+    args = parser.parse_args(argv)
+
+    status = run_pipeline(
+        targets=args.stages,
+        params={
+            'imbalance_strategy': args.imbalance_strategy,
+            'out_of_core': args.out_of_core,
+            'sample_size': args.sample_size,
+        },
+        force=args.force,
+        max_workers=args.jobs,
+    )
+    print("\nStage summary: " + ", ".join(f"{name}={result}" for name, result in status.items()))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
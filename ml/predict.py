@@ -5,10 +5,26 @@ Can be called from command line or imported as a module
 
 import sys
 import json
+import time
+
+# Thread limits have to be in place before numpy starts its BLAS thread pool
+from resource_governor import govern, configure_estimator
+if __name__ == '__main__':
+    govern(role='predict.py')
+
+import numpy as np
 import pandas as pd
 import joblib
+import hashlib
 import os
+import threading
 from pathlib import Path
+from functools import lru_cache
+
+from business_rules import RULES_BY_NAME, evaluate_business_rules, rule_outcomes
+from prediction_cache import cache_key, get_prediction_cache
+from scoring_metrics import METRICS, backend_name
+from scoring_profiler import profiled_call, profile_stage, in_scoring_call
 
 # Paths
 BASE_DIR = Path(__file__).parent
@@ -19,10 +35,78 @@ GRADIENT_BOOSTING_MODEL_PATH = BASE_DIR / '../data/models/gradient_boosting_best
 RANDOM_FOREST_MODEL_PATH = BASE_DIR / '../data/models/random_forest_best.pkl'
 SCALER_PATH = BASE_DIR / '../data/processed/scaler.pkl'
 ENCODER_PATH = BASE_DIR / '../data/processed/encoders.pkl'
+EXPLANATIONS_DIR = BASE_DIR / '../data/models/explanations'
+# Recent SHAP run times per model version, used to skip SHAP that would not fit a latency budget
+SHAP_LATENCY_PATH = BASE_DIR / '../data/cache/shap_latency.json'
+SHAP_LATENCY_SMOOTHING = 0.3          # Weight of the newest run in the moving average
+SHAP_LATENCY_MAX_AGE = 60 * 60        # Seconds; older estimates are ignored so SHAP is tried again
+
+# Name and path of the model most recently returned by load_artifacts()
+LOADED_MODEL = {'name': None, 'path': None}
+
+# Feature columns (must match training - Account_Status_encoded removed to prevent data leakage)
+FEATURE_COLS = [
+    'Customer_Segment_encoded', 'Gender_encoded', 'Age', 'Nationality_encoded',
+    'Account_Type_encoded', 'Branch_encoded', 'Currency_encoded',
+    'Balance', 'Tenure_Months', 'Num_Products', 'Has_Credit_Card',
+    'Transaction_Frequency', 'Average_Transaction_Value',
+    'Mobile_Banking_Usage', 'Branch_Visits', 'Complaint_History',
+    'Account_Age_Months', 'Days_Since_Last_Transaction',
+    'Account_Open_Month', 'Account_Open_Year', 'Last_Transaction_Month', 'Last_Transaction_Year'
+]
+
+# Encode categorical variables
+# NOTE: Account_Status removed to prevent data leakage (it's derived from Days_Since_Last_Transaction)
+CATEGORICAL_COLS = {
+    'Customer_Segment': 'Customer_Segment',
+    'Gender': 'Gender',
+    'Nationality': 'Nationality',
+    'Account_Type': 'Account_Type',
+    'Branch': 'Branch',
+    'Currency': 'Currency',
+    # 'Account_Status': 'Account_Status'  # REMOVED: Data leakage
+}
+
+# Map column names (handle both camelCase and snake_case)
+COLUMN_MAPPING = {
+    'age': 'Age',
+    'tenure_months': 'Tenure_Months',
+    'tenureMonths': 'Tenure_Months',
+    'num_products': 'Num_Products',
+    'numProducts': 'Num_Products',
+    'has_credit_card': 'Has_Credit_Card',
+    'hasCreditCard': 'Has_Credit_Card',
+    'transaction_frequency': 'Transaction_Frequency',
+    'transactionFrequency': 'Transaction_Frequency',
+    'mobile_banking_usage': 'Mobile_Banking_Usage',
+    'mobileBankingUsage': 'Mobile_Banking_Usage',
+    'branch_visits': 'Branch_Visits',
+    'branchVisits': 'Branch_Visits',
+    'complaint_history': 'Complaint_History',
+    'complaintHistory': 'Complaint_History',
+    'account_age_months': 'Account_Age_Months',
+    'accountAgeMonths': 'Account_Age_Months',
+    'days_since_last_transaction': 'Days_Since_Last_Transaction',
+    'daysSinceLastTransaction': 'Days_Since_Last_Transaction'
+}
+
+DATE_FORMATS = ['%d/%m/%Y', '%m/%d/%Y', '%Y-%m-%d', '%d-%m-%Y', '%Y/%m/%d']
+
+
+def _loaded(model, started):
+    """Apply the thread allocation to a freshly loaded model and record the load"""
+    backend = backend_name(model)
+    METRICS.artifact_loads.inc(backend)
+    METRICS.artifact_load_seconds.observe(time.perf_counter() - started, backend)
+    return configure_estimator(model)
 
 
 def load_artifacts():
-    """Load model, scaler, and encoders with fallback if LightGBM fails"""
+    """Load model, scaler, and encoders with fallback if LightGBM fails
+
+    The model's n_jobs is set to this process's thread allocation (resource_governor.py).
+    """
+    started = time.perf_counter()
     # Resolve paths to absolute paths for better error messages
     scaler_path = SCALER_PATH.resolve()
     encoder_path = ENCODER_PATH.resolve()
@@ -54,7 +138,8 @@ def load_artifacts():
                 model = joblib.load(xgboost_path)
                 model_name = "XGBoost"
                 if hasattr(model, 'predict_proba'):
-                    return model, scaler, encoders
+                    LOADED_MODEL.update(name=model_name, path=xgboost_path)
+                    return _loaded(model, started), scaler, encoders
         except Exception as e:
             last_error = e
             print(f"Warning: Could not load XGBoost model: {e}", file=sys.stderr)
@@ -78,7 +163,8 @@ def load_artifacts():
                     model_name = "LightGBM"
                     # Test if model actually works by checking if it has the required attributes
                     if hasattr(model, 'predict_proba'):
-                        return model, scaler, encoders
+                        LOADED_MODEL.update(name=model_name, path=lightgbm_path)
+                        return _loaded(model, started), scaler, encoders
                 except Exception as e:
                     last_error = e
                     print(f"Warning: Could not load LightGBM model: {e}", file=sys.stderr)
@@ -97,7 +183,8 @@ def load_artifacts():
             model = joblib.load(gradient_boosting_path)
             model_name = "Gradient Boosting"
             if hasattr(model, 'predict_proba'):
-                return model, scaler, encoders
+                LOADED_MODEL.update(name=model_name, path=gradient_boosting_path)
+                return _loaded(model, started), scaler, encoders
         except Exception as e:
             last_error = e
             print(f"Warning: Could not load Gradient Boosting model: {e}", file=sys.stderr)
@@ -110,7 +197,8 @@ def load_artifacts():
             model = joblib.load(random_forest_path)
             model_name = "Random Forest"
             if hasattr(model, 'predict_proba'):
-                return model, scaler, encoders
+                LOADED_MODEL.update(name=model_name, path=random_forest_path)
+                return _loaded(model, started), scaler, encoders
         except Exception as e:
             last_error = e
             print(f"Warning: Could not load Random Forest model: {e}", file=sys.stderr)
@@ -121,9 +209,54 @@ def load_artifacts():
         error_msg = f"Could not load any model. Tried XGBoost, LightGBM, Gradient Boosting, and Random Forest."
         if last_error:
             error_msg += f" Last error: {last_error}"
+        METRICS.errors.inc('unknown', 'artifact_load')
         raise FileNotFoundError(error_msg)
     
-    return model, scaler, encoders
+    return _loaded(model, started), scaler, encoders
+
+
+@lru_cache(maxsize=8)
+def _file_digest(path, size, mtime):
+    """Content hash of a model file (cached per size/mtime)"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def loaded_model():
+    """Name and path of the production model, loading the artifacts on first use"""
+    if LOADED_MODEL['path'] is None:
+        load_artifacts()
+    return LOADED_MODEL
+
+
+def get_model_version(model_path=None):
+    """Version tag of a model artifact: file stem plus a short content hash
+
+    Defaults to the production model (the one load_artifacts() returns, loaded if needed).
+    """
+    model_path = Path(model_path or loaded_model()['path'])
+    stat = model_path.stat()
+    return f"{model_path.stem}:{_file_digest(str(model_path), stat.st_size, stat.st_mtime)}"
+
+
+def loaded_model_version():
+    """Version of the production model if it is already loaded (None otherwise; never loads)"""
+    return get_model_version(LOADED_MODEL['path']) if LOADED_MODEL['path'] is not None else None
+
+
+@lru_cache(maxsize=8)
+def load_explanations(model_path):
+    """Load the explanation artifacts saved by train_model.py for a model file (None if missing)"""
+    if model_path is None:
+        return None
+    explanations_path = (EXPLANATIONS_DIR / f"{Path(model_path).stem}.json").resolve()
+    if not explanations_path.exists():
+        return None
+    with open(explanations_path, 'r') as f:
+        return json.load(f)
 
 
 def clean_balance(value):
@@ -157,7 +290,7 @@ def parse_date(date_str):
     if pd.isna(date_str) or date_str == '' or date_str is None:
         return None
     try:
-        for fmt in ['%d/%m/%Y', '%m/%d/%Y', '%Y-%m-%d', '%d-%m-%Y', '%Y/%m/%d']:
+        for fmt in DATE_FORMATS:
             try:
                 return pd.to_datetime(date_str, format=fmt)
             except:
@@ -205,18 +338,7 @@ def prepare_features(customer_data, encoders):
         df['Last_Transaction_Year'] = 0
     
     # Encode categorical variables
-    # NOTE: Account_Status removed to prevent data leakage (it's derived from Days_Since_Last_Transaction)
-    categorical_cols = {
-        'Customer_Segment': 'Customer_Segment',
-        'Gender': 'Gender',
-        'Nationality': 'Nationality',
-        'Account_Type': 'Account_Type',
-        'Branch': 'Branch',
-        'Currency': 'Currency',
-        # 'Account_Status': 'Account_Status'  # REMOVED: Data leakage
-    }
-    
-    for col_name, col_key in categorical_cols.items():
+    for col_name, col_key in CATEGORICAL_COLS.items():
         if col_key in df.columns or col_key.lower() in df.columns:
             key = col_key if col_key in df.columns else col_key.lower()
             if col_name in encoders:
@@ -229,39 +351,8 @@ def prepare_features(customer_data, encoders):
             else:
                 df[col_name + '_encoded'] = 0
     
-    # Feature columns (must match training - Account_Status_encoded removed to prevent data leakage)
-    feature_cols = [
-        'Customer_Segment_encoded', 'Gender_encoded', 'Age', 'Nationality_encoded',
-        'Account_Type_encoded', 'Branch_encoded', 'Currency_encoded',
-        'Balance', 'Tenure_Months', 'Num_Products', 'Has_Credit_Card',
-        'Transaction_Frequency', 'Average_Transaction_Value',
-        'Mobile_Banking_Usage', 'Branch_Visits', 'Complaint_History',
-        'Account_Age_Months', 'Days_Since_Last_Transaction',
-        'Account_Open_Month', 'Account_Open_Year', 'Last_Transaction_Month', 'Last_Transaction_Year'
-    ]
-    
-    # Map column names (handle both camelCase and snake_case)
-    column_mapping = {
-        'age': 'Age',
-        'tenure_months': 'Tenure_Months',
-        'tenureMonths': 'Tenure_Months',
-        'num_products': 'Num_Products',
-        'numProducts': 'Num_Products',
-        'has_credit_card': 'Has_Credit_Card',
-        'hasCreditCard': 'Has_Credit_Card',
-        'transaction_frequency': 'Transaction_Frequency',
-        'transactionFrequency': 'Transaction_Frequency',
-        'mobile_banking_usage': 'Mobile_Banking_Usage',
-        'mobileBankingUsage': 'Mobile_Banking_Usage',
-        'branch_visits': 'Branch_Visits',
-        'branchVisits': 'Branch_Visits',
-        'complaint_history': 'Complaint_History',
-        'complaintHistory': 'Complaint_History',
-        'account_age_months': 'Account_Age_Months',
-        'accountAgeMonths': 'Account_Age_Months',
-        'days_since_last_transaction': 'Days_Since_Last_Transaction',
-        'daysSinceLastTransaction': 'Days_Since_Last_Transaction'
-    }
+    feature_cols = FEATURE_COLS
+    column_mapping = COLUMN_MAPPING
     
     # Normalize column names
     df_normalized = df.copy()
@@ -300,21 +391,360 @@ def prepare_features(customer_data, encoders):
     return feature_df
 
 
-def predict_churn(customer_data, include_shap=False):
-    """Predict churn probability for a customer"""
+def clean_numeric_series(series):
+    """Vectorized equivalent of clean_balance / clean_transaction_value"""
+    if not pd.api.types.is_numeric_dtype(series):
+        series = (series.astype(str)
+                  .str.replace(r'[\s,]|RWF|USD|EUR', '', regex=True))
+    return pd.to_numeric(series, errors='coerce').fillna(0.0).astype(float)
+
+
+def parse_date_series(series):
+    """Vectorized equivalent of parse_date (first matching format wins)"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.dt.tz_localize(None) if series.dt.tz is not None else series
+    series = series.where(series.astype(str).str.strip() != '')
+    parsed = pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+    for fmt in DATE_FORMATS:
+        missing = parsed.isna() & series.notna()
+        if not missing.any():
+            break
+        parsed[missing] = pd.to_datetime(series[missing], format=fmt, errors='coerce')
+    missing = parsed.isna() & series.notna()
+    if missing.any():
+        fallback = pd.to_datetime(series[missing], format='mixed', errors='coerce', utc=True)
+        parsed[missing] = fallback.dt.tz_localize(None)
+    return parsed
+
+
+def normalize_customer_columns(df):
+    """Resolve snake_case / camelCase aliases to the training column names"""
+    aliases = dict(COLUMN_MAPPING)
+    for col_name in list(CATEGORICAL_COLS) + ['Balance', 'Average_Transaction_Value']:
+        aliases[col_name.lower()] = col_name
+    
+    present = [(old, new) for old, new in aliases.items() if old in df.columns]
+    if not present:
+        return df
+    df = df.copy()
+    for old_name, new_name in present:
+        # Records in one batch may use different spellings, so coalesce rather than rename
+        if new_name in df.columns:
+            df[new_name] = df[new_name].where(df[new_name].notna(), df[old_name])
+        else:
+            df[new_name] = df[old_name]
+    return df
+
+
+def prepare_features_batch(customers_df, encoders):
+    """Transform a DataFrame of customers into model features in one vectorized pass
+
+    Produces the same feature matrix as calling prepare_features() row by row,
+    without building a DataFrame per customer. Also accepts a customer_batch.CustomerBatch.
+    """
+    from customer_batch import CustomerBatch
+    if isinstance(customers_df, CustomerBatch):
+        return customers_df.features(encoders)
+    
+    df = normalize_customer_columns(customers_df)
+    features = pd.DataFrame(index=df.index)
+    
+    # Encode categorical variables (unknown categories map to 0, as in prepare_features)
+    for col_name, col_key in CATEGORICAL_COLS.items():
+        if col_key in df.columns and col_name in encoders:
+            lookup = {cls: idx for idx, cls in enumerate(encoders[col_name].classes_)}
+            features[col_name + '_encoded'] = df[col_key].astype(str).map(lookup)
+    
+    # Clean balance and transaction values
+    for col in ['Balance', 'Average_Transaction_Value']:
+        if col in df.columns:
+            features[col] = clean_numeric_series(df[col])
+    
+    # Extract date features
+    for prefix in ['Account_Open', 'Last_Transaction']:
+        date_col = prefix + '_Date'
+        if date_col in df.columns:
+            dates = parse_date_series(df[date_col])
+            features[prefix + '_Month'] = dates.dt.month
+            features[prefix + '_Year'] = dates.dt.year
+    
+    # Remaining numeric features, with the same defaults as prepare_features
+    for col in FEATURE_COLS:
+        if col in features.columns:
+            continue
+        if col in df.columns:
+            features[col] = pd.to_numeric(df[col], errors='coerce')
+        else:
+            features[col] = 50 if col == 'Age' else 0
+    
+    return features[FEATURE_COLS].fillna(0)
+
+
+def risk_levels(churn_probabilities):
+    """Map churn probabilities to risk levels (same thresholds as predict_churn)"""
+    return np.select(
+        [churn_probabilities > 0.7, churn_probabilities > 0.4],
+        ['high', 'medium'],
+        default='low'
+    )
+
+
+@profiled_call(loaded_model_version)
+def predict_frame(customers_df, model, scaler, encoders, apply_rules=True, monitor=None, shadow=None):
+    """Score a DataFrame (or customer_batch.CustomerBatch) of customers with already loaded artifacts
+
+    Returns a DataFrame (same index as the input) with churn_probability,
+    churn_prediction, churn_score, risk_level and rule columns. Rows decided by
+    a BK/BNR business rule skip feature building and the model entirely and
+    carry the deciding rule's name in `rule` (None for model-scored rows).
+    If a drift_monitor.DriftMonitor is given, the model features are added to it.
+    If a shadow_scoring.ShadowScorer is given, the scaled features and production
+    probabilities are handed to it for challenger models (scored in the background).
+    """
+    started = time.perf_counter()
+    n_rows = len(customers_df)
+    churn_probability = np.zeros(n_rows, dtype=float)
+    churn_prediction = np.zeros(n_rows, dtype=int)
+    risk_level = np.empty(n_rows, dtype=object)
+    
+    if apply_rules:
+        from customer_batch import CustomerBatch
+        rules_input = customers_df.rule_frame() if isinstance(customers_df, CustomerBatch) else customers_df
+        rule = evaluate_business_rules(rules_input).to_numpy()
+    else:
+        rule = np.full(n_rows, None, dtype=object)
+    decided = pd.notna(rule)
+    
+    if decided.any():
+        churn_probability[decided], churn_prediction[decided], risk_level[decided] = rule_outcomes(rule[decided])
+    
+    if not decided.all():
+        model_customers = customers_df[~decided]
+        with profile_stage('features'):
+            features = prepare_features_batch(model_customers, encoders)
+        if monitor is not None:
+            monitor.update(features)
+        with profile_stage('scaling'):
+            features_scaled = scaler.transform(features)
+        with profile_stage('predict_proba'):
+            model_probability = model.predict_proba(features_scaled)[:, 1]
+        if shadow is not None:
+            shadow.submit(features_scaled, model_probability, model_customers)
+        churn_probability[~decided] = model_probability
+        # Equivalent to model.predict() for binary classifiers, without a second pass
+        churn_prediction[~decided] = (model_probability > 0.5).astype(int)
+        risk_level[~decided] = risk_levels(model_probability)
+    
+    rule_rows = int(decided.sum())
+    METRICS.record_request('predict_frame', backend_name(model), started,
+                           model_rows=n_rows - rule_rows, rule_rows=rule_rows)
+    return pd.DataFrame({
+        'churn_probability': churn_probability,
+        'churn_prediction': churn_prediction,
+        'churn_score': np.round(churn_probability * 100, 1),
+        'risk_level': risk_level,
+        'rule': rule
+    }, index=customers_df.index)
+
+
+def format_shap_values(feature_cols, shap_values, top_k=10):
+    """Format SHAP values as the top-k features by absolute impact (API response format)"""
+    shap_dict = {}
+    for i, col in enumerate(feature_cols):
+        if i < len(shap_values):
+            # Clean feature name for display
+            display_name = col.replace('_encoded', '').replace('_', ' ').title()
+            shap_dict[display_name] = float(shap_values[i])
+    
+    # Sort by absolute value and get top features
+    sorted_shap = sorted(shap_dict.items(), key=lambda x: abs(x[1]), reverse=True)
+    return [
+        {
+            'feature': name,
+            'impact': round(abs(value) * 100, 1),  # Convert to percentage impact
+            'direction': 'increases' if value > 0 else 'decreases',
+            'value': round(float(value), 4)
+        }
+        for name, value in sorted_shap[:top_k]
+    ]
+
+
+def lookup_stored_explanation(customer_data, features):
+    """Return the precomputed explanation for this customer if it is still valid (else None)"""
+    customer_id = get_customer_id(customer_data)
+    if not customer_id:
+        return None
+    try:
+        from explanation_store import feature_hashes, lookup_explanation
+        return lookup_explanation(
+            customer_id,
+            model_version=get_model_version(),
+            feature_hash=feature_hashes(features)[0]
+        )
+    except Exception as e:
+        METRICS.errors.inc('unknown', 'explanation_store')
+        print(f"Warning: Could not read explanation store: {e}", file=sys.stderr)
+        return None
+
+
+def global_importance_values(model, feature_cols):
+    """Top-10 global importances in the SHAP response format (None if the model has none)"""
+    # Global importances precomputed at training time
+    explanations = load_explanations(LOADED_MODEL['path'])
+    if explanations:
+        return [
+            {
+                'feature': feature['display_name'],
+                'impact': round(float(feature['importance']) * 100, 1),
+                'direction': 'increases',  # Can't determine direction from importance alone
+                'value': round(float(feature['importance']), 4)
+            }
+            for feature in explanations['features'][:10]
+        ]
+    # Older models without explanation artifacts: rank the model's own importances
+    if hasattr(model, 'feature_importances_'):
+        importances = model.feature_importances_
+        feature_importance = dict(zip(feature_cols, importances))
+        sorted_importance = sorted(feature_importance.items(), key=lambda x: x[1], reverse=True)
+        return [
+            {
+                'feature': name.replace('_encoded', '').replace('_', ' ').title(),
+                'impact': round(float(value) * 100, 1),
+                'direction': 'increases',  # Can't determine direction from importance alone
+                'value': round(float(value), 4)
+            }
+            for name, value in sorted_importance[:10]
+        ]
+    return None
+
+
+def _read_shap_latency():
+    """All SHAP run-time estimates ({model_version: {'seconds', 'updated_at'}})"""
+    try:
+        with open(SHAP_LATENCY_PATH, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def shap_latency_estimate(model_version):
+    """Expected SHAP run time in seconds for a model version (None if unknown or stale)"""
+    entry = _read_shap_latency().get(str(model_version))
+    if not entry or time.time() - entry['updated_at'] > SHAP_LATENCY_MAX_AGE:
+        return None
+    return entry['seconds']
+
+
+def record_shap_latency(model_version, seconds, lower_bound=False):
+    """Fold a SHAP run time into the moving average (lower_bound: the run was cut off after `seconds`)"""
+    estimates = _read_shap_latency()
+    previous = shap_latency_estimate(model_version)
+    if previous is None:
+        estimate = seconds
+    elif lower_bound:
+        estimate = max(previous, seconds)
+    else:
+        estimate = SHAP_LATENCY_SMOOTHING * seconds + (1 - SHAP_LATENCY_SMOOTHING) * previous
+    estimates[str(model_version)] = {'seconds': round(estimate, 4), 'updated_at': time.time()}
+    try:
+        SHAP_LATENCY_PATH.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = SHAP_LATENCY_PATH.with_name(f"{SHAP_LATENCY_PATH.name}.{os.getpid()}.tmp")
+        with open(temp_path, 'w') as f:
+            json.dump(estimates, f)
+        os.replace(temp_path, SHAP_LATENCY_PATH)
+    except OSError as e:
+        print(f"Warning: Could not save SHAP latency estimate: {e}", file=sys.stderr)
+
+
+def compute_shap_values(model, features_scaled, feature_cols, model_version=None):
+    """SHAP values of one scaled customer row, top 10 features (API response format)"""
+    shap_started = time.perf_counter()
+    # Timed from the import: one-shot predict.py processes pay for it on every request
+    import shap
+    # Create SHAP explainer (TreeExplainer for gradient boosting)
+    with profile_stage('shap'):
+        explainer = shap.TreeExplainer(model)
+        shap_values = explainer.shap_values(features_scaled[0])
+    record_shap_latency(model_version, time.perf_counter() - shap_started)
+    METRICS.shap_seconds.observe(time.perf_counter() - shap_started, backend_name(model))
+    
+    # Handle binary classification (SHAP returns values for both classes)
+    if isinstance(shap_values, list):
+        shap_values = shap_values[1]  # Use positive class (churn=1)
+    
+    # Map SHAP values to feature names and keep the top 10 features
+    return format_shap_values(feature_cols, shap_values)
+
+
+def compute_shap_values_before(deadline, model, features_scaled, feature_cols, model_version=None):
+    """compute_shap_values() in a worker thread; None if it has not finished by the deadline
+
+    The deadline is a time.perf_counter() value. A run that misses it keeps going
+    in the background (its time still updates the estimate) but is not waited for.
+    """
+    outcome = {}
+    
+    def run():
+        try:
+            outcome['values'] = compute_shap_values(model, features_scaled, feature_cols, model_version)
+        except BaseException as e:
+            outcome['error'] = e
+    
+    started = time.perf_counter()
+    # Profiled as part of this call, so the SHAP stage shows up under a latency budget too
+    worker = threading.Thread(target=in_scoring_call(run), name='shap', daemon=True)
+    worker.start()
+    worker.join(max(0.0, deadline - time.perf_counter()))
+    if worker.is_alive():
+        record_shap_latency(model_version, time.perf_counter() - started, lower_bound=True)
+        return None
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['values']
+
+
+@profiled_call(loaded_model_version, batch_size=1)
+def predict_churn(customer_data, include_shap=False, latency_budget_ms=None):
+    """Predict churn probability for a customer
+
+    With a latency budget (milliseconds from the start of the call), the
+    prediction is always returned: SHAP only runs when its expected time fits
+    in what is left of the budget, and is abandoned if it overruns. Otherwise
+    the explanation falls back to global importances. `explanation_source`
+    tells which explanation was returned: store, computed, global_importance
+    or none; results served from the prediction cache also carry cached=True.
+    """
+    started = time.perf_counter()
+    deadline = started + latency_budget_ms / 1000 if latency_budget_ms is not None else None
     # Load artifacts
     model, scaler, encoders = load_artifacts()
+    backend = backend_name(model)
+    model_version = get_model_version()
     
     # Prepare features
-    features = prepare_features(customer_data, encoders)
+    with profile_stage('features'):
+        features = prepare_features(customer_data, encoders)
     feature_cols = list(features.columns)
     
+    # Unchanged customer scored by the same model: reuse the cached result
+    cache = get_prediction_cache()
+    if cache is not None:
+        key = cache_key(features.to_numpy()[0], include_shap, model_version)
+        cached = cache.get(key, model_version)
+        METRICS.cache_requests.inc('miss' if cached is None else 'hit')
+        if cached is not None:
+            METRICS.record_request('predict_churn', backend, started)
+            # Keeps its explanation_source: only store and computed explanations are cached
+            return dict(cached, cached=True)
+    
     # Scale features
-    features_scaled = scaler.transform(features)
+    with profile_stage('scaling'):
+        features_scaled = scaler.transform(features)
     
     # Predict
-    churn_probability = model.predict_proba(features_scaled)[0][1]
-    churn_prediction = model.predict(features_scaled)[0]
+    with profile_stage('predict_proba'):
+        churn_probability = model.predict_proba(features_scaled)[0][1]
+        churn_prediction = model.predict(features_scaled)[0]
     
     # Calculate churn score as percentage (0-100)
     # Use round() instead of int() to preserve one decimal place for better precision
@@ -327,70 +757,124 @@ def predict_churn(customer_data, include_shap=False):
         'risk_level': 'high' if churn_probability > 0.7 else ('medium' if churn_probability > 0.4 else 'low')
     }
     
-    # Add SHAP values if requested
-    if include_shap:
+    # Add SHAP values if requested (served from the offline explanation store when possible)
+    stored_shap = lookup_stored_explanation(customer_data, features) if include_shap else None
+    if stored_shap is not None:
+        result['shap_values'] = stored_shap
+        result['explanation_source'] = 'store'
+        METRICS.shap_calls.inc(backend, 'store')
+    elif include_shap:
         try:
-            import shap
-            # Create SHAP explainer (TreeExplainer for gradient boosting)
-            explainer = shap.TreeExplainer(model)
-            shap_values = explainer.shap_values(features_scaled[0])
-            
-            # Handle binary classification (SHAP returns values for both classes)
-            if isinstance(shap_values, list):
-                shap_values = shap_values[1]  # Use positive class (churn=1)
-            
-            # Map SHAP values to feature names
-            shap_dict = {}
-            for i, col in enumerate(feature_cols):
-                if i < len(shap_values):
-                    # Clean feature name for display
-                    display_name = col.replace('_encoded', '').replace('_', ' ').title()
-                    shap_dict[display_name] = float(shap_values[i])
-            
-            # Sort by absolute value and get top features
-            sorted_shap = sorted(shap_dict.items(), key=lambda x: abs(x[1]), reverse=True)
-            result['shap_values'] = [
-                {
-                    'feature': name,
-                    'impact': round(abs(value) * 100, 1),  # Convert to percentage impact
-                    'direction': 'increases' if value > 0 else 'decreases',
-                    'value': round(float(value), 4)
-                }
-                for name, value in sorted_shap[:10]  # Top 10 features
-            ]
+            if deadline is None:
+                shap_values = compute_shap_values(model, features_scaled, feature_cols, model_version)
+            else:
+                estimate = shap_latency_estimate(model_version) or 0.0
+                if time.perf_counter() + estimate < deadline:
+                    shap_values = compute_shap_values_before(deadline, model, features_scaled, feature_cols,
+                                                             model_version)
+                else:
+                    shap_values = None
+                if shap_values is None:
+                    METRICS.shap_deadline_misses.inc(backend)
+            if shap_values is not None:
+                result['shap_values'] = shap_values
+                result['explanation_source'] = 'computed'
+                METRICS.shap_calls.inc(backend, 'computed')
         except ImportError:
-            # SHAP not installed, use feature importance as fallback
-            if hasattr(model, 'feature_importances_'):
-                importances = model.feature_importances_
-                feature_importance = dict(zip(feature_cols, importances))
-                sorted_importance = sorted(feature_importance.items(), key=lambda x: x[1], reverse=True)
-                result['shap_values'] = [
-                    {
-                        'feature': name.replace('_encoded', '').replace('_', ' ').title(),
-                        'impact': round(value * 100, 1),
-                        'direction': 'increases',  # Can't determine direction from importance alone
-                        'value': round(float(value), 4)
-                    }
-                    for name, value in sorted_importance[:10]
-                ]
+            # SHAP not installed: fall back to global importances below
+            pass
         except Exception as e:
-            # If SHAP calculation fails, just skip it
+            METRICS.errors.inc(backend, 'shap')
             print(f"Warning: Could not calculate SHAP values: {e}", file=sys.stderr)
+        
+        if 'shap_values' not in result:
+            try:
+                fallback = global_importance_values(model, feature_cols)
+            except Exception as e:
+                # The prediction is returned even when no explanation can be produced
+                METRICS.errors.inc(backend, 'global_importance')
+                print(f"Warning: Could not read global importances: {e}", file=sys.stderr)
+                fallback = None
+            if fallback:
+                result['shap_values'] = fallback
+                result['explanation_source'] = 'global_importance'
+                METRICS.shap_calls.inc(backend, 'global_importance')
+            else:
+                result['explanation_source'] = 'none'
+    
+    # Only real SHAP values are cached with include_shap: fallbacks (global importances after a
+    # SHAP error or a missed deadline, or none) are retried by the next request
+    if cache is not None and (not include_shap or result['explanation_source'] in ('store', 'computed')):
+        cache.put(key, dict(result), model_version)
     
+    METRICS.record_request('predict_churn', backend, started, model_rows=1)
     return result
 
 
+def get_customer_id(customer_data):
+    """Resolve the customer identifier from any of the supported key spellings"""
+    return customer_data.get('customer_id') or customer_data.get('Customer_ID') or customer_data.get('id')
+
+
 def predict_batch(customers_data):
     """Predict churn for multiple customers"""
+    if not customers_data:
+        return []
+    
+    # Load artifacts once and score every customer in one vectorized pass
+    try:
+        model, scaler, encoders = load_artifacts()
+        from customer_batch import CustomerBatch
+        predictions = predict_frame(CustomerBatch.from_records(customers_data), model, scaler, encoders)
+    except Exception as e:
+        METRICS.errors.inc('unknown', 'predict_batch')
+        print(f"Warning: Batch scoring failed ({e}). Scoring customers one by one...", file=sys.stderr)
+        predictions = None
+        # The rules still decide their customers, as they would in the vectorized pass
+        try:
+            rules = evaluate_business_rules(pd.DataFrame(list(customers_data))).to_numpy()
+        except Exception as e:
+            print(f"Warning: Could not evaluate business rules: {e}", file=sys.stderr)
+            rules = np.full(len(customers_data), None, dtype=object)
+    
     results = []
-    for customer_data in customers_data:
+    for position, customer_data in enumerate(customers_data):
+        customer_id = get_customer_id(customer_data)
+        if predictions is not None:
+            prediction = {
+                'churn_probability': float(predictions['churn_probability'].iat[position]),
+                'churn_prediction': int(predictions['churn_prediction'].iat[position]),
+                'churn_score': float(predictions['churn_score'].iat[position]),
+                'risk_level': str(predictions['risk_level'].iat[position]),
+                'customer_id': customer_id
+            }
+            rule = predictions['rule'].iat[position]
+            if pd.notna(rule):
+                prediction['rule'] = rule
+                prediction['note'] = RULES_BY_NAME[rule]['note']
+            results.append(prediction)
+            continue
+        if pd.notna(rules[position]):
+            rule = rules[position]
+            churn_probability, churn_prediction, risk_level = rule_outcomes([rule])
+            results.append({
+                'churn_probability': float(churn_probability[0]),
+                'churn_prediction': int(churn_prediction[0]),
+                'churn_score': round(float(churn_probability[0]) * 100, 1),
+                'risk_level': str(risk_level[0]),
+                'customer_id': customer_id,
+                'rule': rule,
+                'note': RULES_BY_NAME[rule]['note']
+            })
+            continue
         try:
             prediction = predict_churn(customer_data)
-            prediction['customer_id'] = customer_data.get('customer_id') or customer_data.get('Customer_ID') or customer_data.get('id')
+            prediction['customer_id'] = customer_id
             results.append(prediction)
         except Exception as e:
+            METRICS.errors.inc('unknown', 'predict_churn')
             results.append({
-                'customer_id': customer_data.get('customer_id') or customer_data.get('Customer_ID') or customer_data.get('id'),
+                'customer_id': customer_id,
                 'error': str(e)
             })
     return results
@@ -425,9 +909,16 @@ if __name__ == '__main__':
         input_data = json.loads(json_input)
         customer_data = input_data.get('customer_data', input_data) if isinstance(input_data, dict) else input_data
         include_shap = input_data.get('include_shap', False) if isinstance(input_data, dict) else False
+        include_what_if = input_data.get('include_what_if', False) if isinstance(input_data, dict) else False
+        latency_budget_ms = input_data.get('latency_budget_ms') if isinstance(input_data, dict) else None
         
         # Predict
-        result = predict_churn(customer_data, include_shap=include_shap)
+        result = predict_churn(customer_data, include_shap=include_shap, latency_budget_ms=latency_budget_ms)
+        
+        # Model-estimated effect of retention actions (see what_if.py)
+        if include_what_if:
+            from what_if import simulate_customer
+            result['what_if'] = simulate_customer(customer_data)
         
         # Output as JSON
         print(json.dumps(result))
@@ -0,0 +1,189 @@
+"""
+Prediction Result Cache for BK Pulse Churn Prediction
+Caches predict_churn() results keyed by a hash of the customer's model feature
+vector, the SHAP flag and the model version, so re-scoring an unchanged
+customer does not run the model (or SHAP) again.
+
+Two tiers:
+  - an in-process LRU (OrderedDict) with a TTL - a hit costs microseconds
+  - an optional SQLite file shared by every predict.py process, so warm entries
+    survive restarts (the API server spawns a new process per prediction)
+
+A retrained model gets a new version tag, so its predictions never match old
+entries; entries of other model versions are dropped when the file is opened.
+
+Configuration (environment):
+    BK_PULSE_PREDICTION_CACHE      off | memory | path to a SQLite file
+                                   (default: data/cache/prediction_cache.sqlite)
+    BK_PULSE_PREDICTION_CACHE_TTL  seconds an entry stays valid (default: 21600)
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+from pathlib import Path
+from collections import OrderedDict
+
+import numpy as np
+
+BASE_DIR = Path(__file__).parent
+DEFAULT_CACHE_PATH = BASE_DIR / '../data/cache/prediction_cache.sqlite'
+DEFAULT_MAX_ENTRIES = 10000         # In-process LRU size
+DEFAULT_MAX_DISK_ENTRIES = 500000   # Oldest SQLite rows beyond this are pruned
+DEFAULT_TTL_SECONDS = 6 * 60 * 60
+
+
+def cache_key(features, include_shap, model_version):
+    """Hash of the model feature vector (float64), SHAP flag and model version"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(np.asarray(features, dtype=np.float64)).tobytes())
+    digest.update(b'\x01' if include_shap else b'\x00')
+    digest.update(str(model_version).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    """Bounded LRU of prediction results with TTL, hit/miss counters and optional SQLite persistence"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 path=None, max_disk_entries=DEFAULT_MAX_DISK_ENTRIES):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        self.path = Path(path) if path else None
+        self._entries = OrderedDict()   # key -> (expires_at, result)
+        self._conn = None
+        self._model_version = None
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'writes': 0}
+
+    def _connect(self, model_version):
+        """Open the SQLite file (once) and drop entries of other model versions"""
+        if self.path is None:
+            return None
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), timeout=1.0, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS predictions ('
+                'key TEXT PRIMARY KEY, model_version TEXT NOT NULL, '
+                'expires_at REAL NOT NULL, result TEXT NOT NULL)'
+            )
+        if model_version != self._model_version:
+            self._model_version = model_version
+            self._conn.execute('DELETE FROM predictions WHERE model_version != ?', (str(model_version),))
+        return self._conn
+
+    def get(self, key, model_version=None):
+        """Cached result for a key, or None (counts a hit or a miss)"""
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[1]
+            del self._entries[key]
+            self.stats['expired'] += 1
+
+        conn = self._connect_safely(model_version)
+        if conn is not None:
+            try:
+                row = conn.execute('SELECT expires_at, result FROM predictions WHERE key = ?', (key,)).fetchone()
+                result = json.loads(row[1]) if row is not None and row[0] > now else None
+            except (sqlite3.Error, ValueError) as e:
+                # A locked or corrupt cache file is a miss, never a failed prediction
+                print(f"Warning: Could not read prediction cache: {e}", file=sys.stderr)
+                row = result = None
+            if result is not None:
+                self._remember(key, row[0], result)
+                self.stats['hits'] += 1
+                self.stats['disk_hits'] += 1
+                return result
+            if row is not None:
+                self.stats['expired'] += 1
+
+        self.stats['misses'] += 1
+        return None
+
+    def put(self, key, result, model_version=None):
+        """Store a result in memory and, if configured, on disk"""
+        expires_at = time.time() + self.ttl_seconds
+        self._remember(key, expires_at, result)
+        self.stats['writes'] += 1
+
+        conn = self._connect_safely(model_version)
+        if conn is not None:
+            try:
+                conn.execute('INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?)',
+                             (key, str(model_version), expires_at, json.dumps(result)))
+                # Cheap amortized pruning: roughly once per 1000 writes
+                if self.stats['writes'] % 1000 == 0:
+                    self.prune()
+            except sqlite3.Error as e:
+                print(f"Warning: Could not write prediction cache: {e}", file=sys.stderr)
+
+    def _remember(self, key, expires_at, result):
+        """Insert into the in-process LRU, evicting the least recently used entries"""
+        self._entries[key] = (expires_at, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def _connect_safely(self, model_version):
+        """SQLite connection, or None if persistence is off or unavailable (the cache never fails a prediction)"""
+        if self.path is None:
+            return None
+        try:
+            return self._connect(model_version)
+        except sqlite3.Error as e:
+            print(f"Warning: Prediction cache disabled on disk: {e}", file=sys.stderr)
+            self.path = None
+            return None
+
+    def prune(self):
+        """Delete expired SQLite rows and the oldest rows beyond max_disk_entries"""
+        if self._conn is None:
+            return
+        self._conn.execute('DELETE FROM predictions WHERE expires_at <= ?', (time.time(),))
+        self._conn.execute(
+            'DELETE FROM predictions WHERE key IN ('
+            'SELECT key FROM predictions ORDER BY expires_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_disk_entries,)
+        )
+
+    def clear(self):
+        """Drop every cached result (memory and disk)"""
+        self._entries.clear()
+        conn = self._connect_safely(self._model_version)
+        if conn is not None:
+            conn.execute('DELETE FROM predictions')
+
+    def info(self):
+        """Counters plus current size and hit rate"""
+        lookups = self.stats['hits'] + self.stats['misses']
+        return dict(self.stats, size=len(self._entries),
+                    hit_rate=round(self.stats['hits'] / lookups, 4) if lookups else 0.0)
+
+
+_CACHE = {}
+
+
+def get_prediction_cache():
+    """Process-wide cache configured from the environment (None when disabled)"""
+    if 'cache' not in _CACHE:
+        setting = os.environ.get('BK_PULSE_PREDICTION_CACHE', str(DEFAULT_CACHE_PATH))
+        ttl = float(os.environ.get('BK_PULSE_PREDICTION_CACHE_TTL', DEFAULT_TTL_SECONDS))
+        if setting.lower() in ('off', '0', 'false', 'none', ''):
+            _CACHE['cache'] = None
+        else:
+            _CACHE['cache'] = PredictionCache(
+                ttl_seconds=ttl,
+                path=None if setting.lower() == 'memory' else setting
+            )
+    return _CACHE['cache']
@@ -11,6 +11,9 @@ import joblib
 import os
 from datetime import datetime
 
+from business_rules import evaluate_business_rules
+from drift_monitor import save_reference
+
 # Configuration
 # Using the fixed dataset that follows BK business rules
 # Path is relative to the script location (ml/ directory)
@@ -20,6 +23,8 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 PROCESSED_DATA_PATH = os.path.join(BASE_DIR, 'data', 'processed', 'processed_data.csv')
 SCALER_PATH = os.path.join(BASE_DIR, 'data', 'processed', 'scaler.pkl')
 ENCODER_PATH = os.path.join(BASE_DIR, 'data', 'processed', 'encoders.pkl')
+TRAINING_MANIFEST_PATH = os.path.join(BASE_DIR, 'data', 'processed', 'training_manifest.csv')
+REFERENCE_HISTOGRAMS_PATH = os.path.join(BASE_DIR, 'data', 'processed', 'reference_histograms.json')
 
 
 def clean_balance(value):
@@ -65,6 +70,22 @@ def parse_date(date_str):
         return None
 
 
+def row_hashes(df):
+    """Hash each raw row so later runs can detect new or changed customers"""
+    return pd.util.hash_pandas_object(df, index=False).astype('uint64')
+
+
+def save_training_manifest(df):
+    """Record which raw rows (Customer_ID + row hash) the current model was trained on"""
+    manifest = pd.DataFrame({
+        'Customer_ID': df['Customer_ID'].astype(str).values,
+        'row_hash': row_hashes(df).values
+    })
+    os.makedirs(os.path.dirname(TRAINING_MANIFEST_PATH), exist_ok=True)
+    manifest.to_csv(TRAINING_MANIFEST_PATH, index=False)
+    return TRAINING_MANIFEST_PATH
+
+
 def preprocess_data():
     """Main preprocessing function"""
     print("Loading raw data...")
@@ -167,6 +188,12 @@ def preprocess_data():
         X, y, test_size=0.2, random_state=42, stratify=y
     )
     
+    # Save reference histograms of the unscaled training features (used by drift_monitor.py).
+    # Only rows that reach the model are monitored while scoring, so leave out rule-decided rows here too.
+    print("Saving reference histograms...")
+    model_scored = evaluate_business_rules(df.loc[X_train.index]).isna().to_numpy()
+    save_reference(X_train[model_scored] if model_scored.any() else X_train, encoders, REFERENCE_HISTOGRAMS_PATH)
+    
     # Scale features
     print("Scaling features...")
     scaler = StandardScaler()
@@ -209,6 +236,10 @@ def preprocess_data():
     df_processed['Churn_Flag'] = y
     df_processed.to_csv(PROCESSED_DATA_PATH, index=False)
     
+    # Save training manifest (used by incremental_train.py to find new/changed rows)
+    if 'Customer_ID' in df.columns:
+        save_training_manifest(df)
+    
     print(f"\nPreprocessing complete!")
     print(f"Training set: {len(X_train_scaled)} samples")
     print(f"Test set: {len(X_test_scaled)} samples")
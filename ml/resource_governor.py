@@ -0,0 +1,154 @@
+"""
+CPU/Thread Governor for BK Pulse Training and Scoring
+Keeps every layer of parallelism inside one CPU budget so concurrent processes
+do not oversubscribe the host.
+
+The budget (BK_PULSE_CPU_BUDGET cores, default: the cores this process may use,
+including container CPU quotas) is split evenly between BK_PULSE_WORKERS
+concurrent processes (default 1; the API server sets it to the number of
+predict.py processes it runs at once). Each process then gets the same thread
+count for:
+  - OpenMP / MKL / OpenBLAS / NumExpr pools (environment variables, plus
+    threadpoolctl for libraries that are already loaded)
+  - estimator n_jobs (scikit-learn, XGBoost, LightGBM)
+Training splits the threads between cross-validation folds and estimator
+threads so folds x threads never exceeds the allocation.
+
+This module only imports the standard library at the top, so it can run
+before numpy starts its thread pools.
+
+Usage:
+    BK_PULSE_CPU_BUDGET=8 BK_PULSE_WORKERS=4 python ml/predict.py < customer.json
+    python ml/resource_governor.py                 # show the allocation
+    BK_PULSE_GOVERNOR_VERBOSE=1 python ml/batch_scoring.py customers.csv scores.csv   # log it on every run
+"""
+
+import os
+import sys
+import math
+from pathlib import Path
+
+CPU_BUDGET_ENV = 'BK_PULSE_CPU_BUDGET'
+WORKERS_ENV = 'BK_PULSE_WORKERS'
+VERBOSE_ENV = 'BK_PULSE_GOVERNOR_VERBOSE'     # Log the allocation of every process, not only parallel jobs
+THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                   'NUMEXPR_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS']
+CGROUP_CPU_MAX = Path('/sys/fs/cgroup/cpu.max')   # cgroup v2 quota ("max 100000" when unlimited)
+
+_allocation = None
+
+
+def available_cores():
+    """Cores this process may run on (CPU affinity and container quota)"""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    try:
+        quota, period = CGROUP_CPU_MAX.read_text().split()[:2]
+        if quota != 'max':
+            cores = min(cores, max(1, math.floor(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cores
+
+
+def _env_int(name):
+    """Positive integer from the environment, or None"""
+    try:
+        value = int(os.environ.get(name, ''))
+    except ValueError:
+        return None
+    return value if value > 0 else None
+
+
+def compute_allocation(budget=None, workers=None):
+    """Threads per process for a CPU budget shared by a number of concurrent worker processes"""
+    cores = available_cores()
+    budget = budget or _env_int(CPU_BUDGET_ENV) or cores
+    budget = max(1, min(budget, cores))
+    workers = max(1, workers or _env_int(WORKERS_ENV) or 1)
+    return {
+        'cores': cores,
+        'budget': budget,
+        'workers': workers,
+        # Never below one thread, even with more workers than cores
+        'threads': max(1, budget // workers),
+    }
+
+
+def apply_thread_limits(threads):
+    """Limit native thread pools: env vars for libraries loaded later, threadpoolctl for loaded ones"""
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return
+    threadpool_limits(limits=threads)
+
+
+def govern(budget=None, workers=None, role='process', quiet=None):
+    """Compute this process's allocation, apply the thread limits and log it once
+
+    quiet=None logs only when BK_PULSE_GOVERNOR_VERBOSE is set, so per-request
+    processes (predict.py spawned by the API) stay silent; parallel jobs pass quiet=False.
+    """
+    global _allocation
+    allocation = compute_allocation(budget, workers)
+    if quiet is None:
+        quiet = os.environ.get(VERBOSE_ENV, '') in ('', '0')
+    if allocation != _allocation:
+        apply_thread_limits(allocation['threads'])
+        if not quiet:
+            print(f"CPU governor ({role}): {allocation['budget']} of {allocation['cores']} cores "
+                  f"for {allocation['workers']} worker(s) -> {allocation['threads']} thread(s) each "
+                  f"(OpenMP/MKL/OpenBLAS and estimator n_jobs)", file=sys.stderr)
+    _allocation = allocation
+    return allocation
+
+
+def current_threads():
+    """Thread count of this process (governing with the defaults on first use)"""
+    return (_allocation or govern(quiet=True))['threads']
+
+
+def resolve_jobs(n_jobs=None):
+    """joblib-style n_jobs (-1 / None = all) bounded by this process's allocation"""
+    threads = current_threads()
+    if n_jobs is None or n_jobs < 0:
+        return threads
+    return max(1, min(n_jobs, threads))
+
+
+def split_threads(outer_tasks, threads=None):
+    """Split threads into (parallel outer tasks, threads per task), e.g. CV folds x estimator threads"""
+    threads = threads or current_threads()
+    outer = max(1, min(outer_tasks, threads))
+    return outer, max(1, threads // outer)
+
+
+def configure_estimator(model, threads=None):
+    """Set n_jobs on an estimator (and any nested estimators) that has it; returns the model"""
+    threads = threads or current_threads()
+    if not hasattr(model, 'get_params') or not hasattr(model, 'set_params'):
+        return model
+    try:
+        names = [name for name in model.get_params(deep=True) if name == 'n_jobs' or name.endswith('__n_jobs')]
+        if names:
+            model.set_params(**{name: threads for name in names})
+    except Exception as e:
+        print(f"Warning: Could not set estimator threads: {e}", file=sys.stderr)
+    return model
+
+
+def main():
+    """Command line entry point"""
+    allocation = govern(role='check', quiet=False)
+    for name in THREAD_ENV_VARS:
+        print(f"{name}={os.environ[name]}")
+    print(f"n_jobs={allocation['threads']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+"""
+Materialized Top-K At-Risk Index for BK Pulse
+Keeps the highest-risk customers per branch, segment, retention officer and
+churn band in a small table (customer_risk_index) so dashboard and team views
+read a precomputed list instead of sorting the customers table.
+
+Every group (scope, scope_value, churn_band) keeps the top INDEX_DEPTH
+customers by churn score, while views read at most DEFAULT_TOP_K of them. The
+spare depth makes incremental refreshes exact without rescanning: after
+score_database.py rescores some customers, their old entries are dropped and
+their new scores merged in. Customers outside the index scored at most the
+group's old cutoff, so entries above that cutoff are still exact. Groups left
+with fewer than DEFAULT_TOP_K exact entries are reloaded together in one pass
+over the table.
+
+Usage:
+    python risk_index.py build                                  # full rebuild from the customers table
+    python risk_index.py build --dsn sqlite:///path/to/bk_pulse.db --output top_risk_index.json
+    python risk_index.py show --scope branch --value Remera --band high
+"""
+
+import io
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+
+import pandas as pd
+
+from batch_scoring import DEFAULT_CHUNK_SIZE
+from score_database import connect, get_table_columns, STAGING_TABLE
+
+INDEX_TABLE = 'customer_risk_index'
+DEFAULT_TOP_K = 50              # Entries served per group
+INDEX_DEPTH = 100               # Entries kept per group (slack for incremental refreshes)
+CURSOR_NAME = 'bk_pulse_risk_index'
+
+# Index scope -> customers column ('all' covers the whole book)
+SCOPES = {'all': None, 'branch': 'branch', 'segment': 'segment', 'officer': 'assigned_officer_id'}
+ALL_BANDS = 'all'
+GROUP_KEYS = ['scope', 'scope_value', 'churn_band']
+SOURCE_COLUMNS = ['customer_id', 'churn_score', 'risk_level', 'branch', 'segment', 'assigned_officer_id']
+INDEX_COLUMNS = GROUP_KEYS + ['rank', 'customer_id', 'churn_score', 'risk_level', 'indexed_at']
+
+
+def latest_customers_query(conn, where='', source_columns=SOURCE_COLUMNS):
+    """Latest scored row per customer_id (same precedence as the customers list endpoint)"""
+    available = set(get_table_columns(conn))
+    columns = ', '.join(col if col in available else f'NULL AS {col}' for col in source_columns)
+    updated_at = 'updated_at' if 'updated_at' in available else 'NULL'
+    return (
+        f"SELECT {', '.join(source_columns)} FROM ("
+        f"SELECT {columns}, ROW_NUMBER() OVER (PARTITION BY customer_id "
+        f"ORDER BY {updated_at} DESC, id DESC) AS row_number "
+        f"FROM customers WHERE churn_score IS NOT NULL{where}) latest "
+        f"WHERE row_number = 1"
+    )
+
+
+def read_query(conn, dialect, query, params=(), chunk_size=DEFAULT_CHUNK_SIZE, name=None):
+    """Yield the rows of a query as DataFrames (server-side cursor on PostgreSQL when named)"""
+    if dialect == 'postgresql':
+        query = query.replace('?', '%s')
+        cursor = conn.cursor(name=name) if name else conn.cursor()
+        if name:
+            cursor.itersize = chunk_size
+    else:
+        cursor = conn.cursor()
+    cursor.execute(query, params)
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield pd.DataFrame(rows, columns=[desc[0] for desc in cursor.description])
+    finally:
+        cursor.close()
+
+
+def expand_groups(customers):
+    """One entry per customer and index group it belongs to (scope x own band and 'all' bands)"""
+    customers = customers.assign(
+        customer_id=customers['customer_id'].astype(str),
+        churn_score=pd.to_numeric(customers['churn_score'], errors='coerce'),
+    )
+    customers = customers[customers['churn_score'].notna()]
+    entries = []
+    for scope, column in SCOPES.items():
+        values = pd.Series('all', index=customers.index) if column is None else customers[column]
+        present = values.notna().to_numpy()
+        if not present.any():
+            continue
+        base = pd.DataFrame({
+            'scope': scope,
+            'scope_value': values[present].astype(str).str.replace(r'\.0$', '', regex=True).to_numpy(),
+            'customer_id': customers['customer_id'].to_numpy()[present],
+            'churn_score': customers['churn_score'].to_numpy(dtype=float)[present],
+            'risk_level': customers['risk_level'].to_numpy(dtype=object)[present],
+        })
+        entries.append(base.assign(churn_band=ALL_BANDS))
+        banded = base[base['risk_level'].notna()]
+        entries.append(banded.assign(churn_band=banded['risk_level'].astype(str)))
+    if not entries:
+        return pd.DataFrame(columns=GROUP_KEYS + ['customer_id', 'churn_score', 'risk_level'])
+    return pd.concat(entries, ignore_index=True)
+
+
+def top_entries(entries, depth=INDEX_DEPTH):
+    """Keep the top `depth` entries of every group, ranked by churn score (ties by customer_id)"""
+    entries = entries.drop_duplicates(GROUP_KEYS + ['customer_id'], keep='last')
+    entries = entries.sort_values(GROUP_KEYS + ['churn_score', 'customer_id'],
+                                  ascending=[True, True, True, False, True], kind='stable')
+    rank = entries.groupby(GROUP_KEYS, sort=False).cumcount().to_numpy() + 1
+    keep = rank <= depth
+    return entries[keep].assign(rank=rank[keep]).reset_index(drop=True)
+
+
+def build_index(chunks, depth=INDEX_DEPTH):
+    """Top entries of every group from a stream of customer chunks (at most groups x depth rows in memory)"""
+    index = None
+    for chunk in chunks:
+        entries = expand_groups(chunk)
+        index = top_entries(entries if index is None else pd.concat([index, entries], ignore_index=True), depth)
+    return index if index is not None else top_entries(expand_groups(pd.DataFrame(columns=SOURCE_COLUMNS)))
+
+
+def merge_rescored(index, rescored, rescored_ids, depth=INDEX_DEPTH, top_k=DEFAULT_TOP_K):
+    """Merge rescored customers into an existing index
+
+    Returns (index, refill): the updated index and the groups (as tuples) that
+    kept fewer than top_k exact entries and must be reloaded from the table.
+    """
+    # Only full groups can have customers outside the index; their old last entry bounds those customers
+    last = index[index['rank'] >= depth].set_index(GROUP_KEYS)[['churn_score', 'customer_id']]
+    cutoffs = last.rename(columns={'churn_score': 'cutoff_score', 'customer_id': 'cutoff_id'})
+
+    rescored_ids = pd.Index(rescored_ids, dtype=object).astype(str)
+    kept = index[~index['customer_id'].astype(str).isin(rescored_ids)]
+    merged = top_entries(pd.concat([kept.drop(columns=['rank']), expand_groups(rescored)], ignore_index=True), depth)
+    merged = merged.join(cutoffs, on=GROUP_KEYS)
+    # Exact if it ranks at or above the old last entry (score, then customer_id as in top_entries)
+    exact = (merged['cutoff_score'].isna() | (merged['churn_score'] > merged['cutoff_score'])
+             | ((merged['churn_score'] == merged['cutoff_score']) & (merged['customer_id'] <= merged['cutoff_id'])))
+    merged = merged[exact].drop(columns=['cutoff_score', 'cutoff_id'])
+
+    counts = merged.groupby(GROUP_KEYS).size().reindex(cutoffs.index, fill_value=0)
+    refill = list(counts.index[counts < top_k])
+    return merged.reset_index(drop=True), refill
+
+
+def reload_groups(conn, dialect, groups, depth=INDEX_DEPTH, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Top entries of the given groups straight from the customers table (one streaming pass)"""
+    wanted = pd.MultiIndex.from_tuples(groups, names=GROUP_KEYS)
+    chunks = read_query(conn, dialect, latest_customers_query(conn), chunk_size=chunk_size, name=CURSOR_NAME)
+    index = None
+    for chunk in chunks:
+        entries = expand_groups(chunk)
+        entries = entries[entries.set_index(GROUP_KEYS).index.isin(wanted)]
+        index = top_entries(entries if index is None else pd.concat([index, entries], ignore_index=True), depth)
+    return index.drop(columns=['rank']) if index is not None else expand_groups(pd.DataFrame(columns=SOURCE_COLUMNS))
+
+
+def index_exists(conn, dialect, table=INDEX_TABLE):
+    """Whether the index table has been created (catalog lookup, safe inside a transaction)"""
+    cursor = conn.cursor()
+    if dialect == 'postgresql':
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+    else:
+        cursor.execute("SELECT COUNT(*) > 0 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    exists = bool(cursor.fetchone()[0])
+    cursor.close()
+    return exists
+
+
+def read_index(conn, dialect):
+    """The stored index as a DataFrame, or None when it has not been built"""
+    if not index_exists(conn, dialect):
+        return None
+    frames = list(read_query(conn, dialect, f"SELECT {', '.join(INDEX_COLUMNS[:-1])} FROM {INDEX_TABLE}"))
+    if not frames:
+        return pd.DataFrame(columns=INDEX_COLUMNS[:-1])
+    index = pd.concat(frames, ignore_index=True)
+    index['churn_score'] = pd.to_numeric(index['churn_score'], errors='coerce')
+    index['customer_id'] = index['customer_id'].astype(str)
+    return index
+
+
+def write_index(conn, dialect, index):
+    """Replace the stored index (a few thousand rows; readers see the old one until commit)"""
+    cursor = conn.cursor()
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {INDEX_TABLE} ("
+        "scope VARCHAR(20) NOT NULL, scope_value VARCHAR(100) NOT NULL, churn_band VARCHAR(20) NOT NULL, "
+        "rank INTEGER NOT NULL, customer_id VARCHAR(50) NOT NULL, churn_score DECIMAL(5,2), "
+        "risk_level VARCHAR(20), indexed_at TIMESTAMP, PRIMARY KEY (scope, scope_value, churn_band, rank))"
+    )
+    cursor.execute(f"DELETE FROM {INDEX_TABLE}")
+    rows = index.assign(indexed_at=datetime.now().isoformat(timespec='seconds'))[INDEX_COLUMNS]
+    if dialect == 'postgresql':
+        buffer = io.StringIO()
+        rows.to_csv(buffer, header=False, index=False)
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY {INDEX_TABLE} ({', '.join(INDEX_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    else:
+        cursor.executemany(
+            f"INSERT INTO {INDEX_TABLE} ({', '.join(INDEX_COLUMNS)}) VALUES ({', '.join('?' * len(INDEX_COLUMNS))})",
+            rows.astype(object).where(rows.notna(), None).itertuples(index=False, name=None)
+        )
+    cursor.close()
+    return len(rows)
+
+
+def rebuild_index(conn, dialect, depth=INDEX_DEPTH, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Full rebuild from one streaming pass over the customers table (caller commits)"""
+    chunks = read_query(conn, dialect, latest_customers_query(conn), chunk_size=chunk_size, name=CURSOR_NAME)
+    index = build_index(chunks, depth)
+    write_index(conn, dialect, index)
+    return index
+
+
+def refresh_index(conn, dialect, depth=INDEX_DEPTH, top_k=DEFAULT_TOP_K):
+    """Update the index for the customers in the scoring staging table (caller commits)
+
+    Called by score_database.py after scores are applied, in the same transaction.
+    Builds the index from scratch the first time.
+    """
+    index = read_index(conn, dialect)
+    if index is None:
+        return rebuild_index(conn, dialect, depth)
+
+    staged = list(read_query(conn, dialect, f"SELECT customer_id FROM {STAGING_TABLE}"))
+    rescored_ids = pd.concat(staged)['customer_id'] if staged else pd.Series([], dtype=object)
+    if rescored_ids.empty:
+        return index
+    rescored = list(read_query(
+        conn, dialect, latest_customers_query(conn, f" AND customer_id IN (SELECT customer_id FROM {STAGING_TABLE})")
+    ))
+    rescored = pd.concat(rescored, ignore_index=True) if rescored else pd.DataFrame(columns=SOURCE_COLUMNS)
+
+    index, refill = merge_rescored(index, rescored, rescored_ids, depth, top_k)
+    if refill:
+        reloaded = reload_groups(conn, dialect, refill, depth)
+        refilled = pd.MultiIndex.from_tuples(refill, names=GROUP_KEYS)
+        stale = index.set_index(GROUP_KEYS).index.isin(refilled)
+        index = top_entries(pd.concat([index[~stale].drop(columns=['rank']), reloaded], ignore_index=True), depth)
+    write_index(conn, dialect, index)
+    print(f"Refreshed risk index for {len(rescored_ids):,} rescored customers "
+          f"({len(refill)} groups reloaded)", file=sys.stderr)
+    return index
+
+
+def export_index(index, path, top_k=DEFAULT_TOP_K):
+    """Write the index as JSON: {scope: {scope_value: {churn_band: [entries]}}}"""
+    exported = {'generated_at': datetime.now().isoformat(), 'top_k': top_k, 'groups': {}}
+    served = index[index['rank'] <= top_k]
+    for (scope, scope_value, band), group in served.groupby(GROUP_KEYS, sort=True):
+        exported['groups'].setdefault(scope, {}).setdefault(scope_value, {})[band] = [
+            {'customer_id': row.customer_id, 'churn_score': round(float(row.churn_score), 2),
+             'risk_level': row.risk_level}
+            for row in group.sort_values('rank').itertuples(index=False)
+        ]
+    with open(path, 'w') as f:
+        json.dump(exported, f)
+    return path
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Materialized top-K at-risk customer index')
+    parser.add_argument('--dsn', default=None,
+                        help='PostgreSQL URL or sqlite:///path (default: DATABASE_URL or DB_* settings)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help=f'Rebuild {INDEX_TABLE} from the customers table')
+    build.add_argument('--depth', type=int, default=INDEX_DEPTH, help='Entries kept per group')
+    build.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    build.add_argument('--output', help='Also export the index as JSON')
+
+    show = subparsers.add_parser('show', help='Print the top entries of one group')
+    show.add_argument('--scope', choices=list(SCOPES), default='all')
+    show.add_argument('--value', default='all')
+    show.add_argument('--band', default=ALL_BANDS)
+    show.add_argument('--top-k', type=int, default=DEFAULT_TOP_K)
+
+    args = parser.parse_args()
+    conn, dialect = connect(args.dsn)
+    try:
+        if args.command == 'build':
+            start_time = time.time()
+            index = rebuild_index(conn, dialect, args.depth, args.chunk_size)
+            conn.commit()
+            groups = index.groupby(GROUP_KEYS).ngroups
+            print(f"Indexed {index['customer_id'].nunique():,} customers in {groups:,} groups "
+                  f"in {time.time() - start_time:.1f}s -> {INDEX_TABLE}", file=sys.stderr)
+            if args.output:
+                export_index(index, args.output)
+            return
+
+        index = read_index(conn, dialect)
+        if index is None:
+            print(f"No {INDEX_TABLE} table. Run: python risk_index.py build", file=sys.stderr)
+            sys.exit(1)
+        group = index[(index['scope'] == args.scope) & (index['scope_value'] == args.value)
+                      & (index['churn_band'] == args.band) & (index['rank'] <= args.top_k)]
+        print(group.sort_values('rank').to_string(index=False))
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
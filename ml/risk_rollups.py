@@ -0,0 +1,348 @@
+"""
+Precomputed Risk Rollups for BK Pulse
+Keeps churn-risk aggregates per branch, segment, product and retention officer
+in a small table (customer_risk_rollups) so dashboard and analytics pages read
+a few hundred rows instead of scanning the customers table on every load.
+
+Every group (scope, scope_value) holds the customer count, high / medium / low
+counts, the churn score sum (average = score_sum / customers), the expected
+number of churners (sum of churn probabilities) and a 10-bin churn score
+histogram. All of these are sums, so they update from deltas: a ledger table
+(customer_risk_rollup_members) records what each customer added (score, risk
+level and group keys at the time), and after score_database.py applies a
+partial rescore the rollups move by (new rows - recorded contributions) of the
+rescored customers, in the same transaction. A customer reassigned to another
+officer or branch is taken out of the group they were counted in.
+
+The rollups are eventually consistent: scores written by the server
+(predictions and customers routes, scripts/updateChurnScores.js) and deleted
+customers reach them at the customer's next rescore, or at the full rebuild
+that replaces the ledger once its oldest contribution is REBUILD_AFTER old.
+One snapshot per day is kept in customer_risk_rollup_snapshots for trend charts.
+
+Usage:
+    python risk_rollups.py build                                  # full rebuild from the customers table
+    python risk_rollups.py build --dsn sqlite:///path/to/bk_pulse.db --output risk_rollups.json
+    python risk_rollups.py show --scope branch
+    python risk_rollups.py trend --scope segment --value Retail --days 30
+"""
+
+import io
+import sys
+import json
+import time
+import argparse
+from datetime import datetime, date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from batch_scoring import DEFAULT_CHUNK_SIZE
+from score_database import connect, STAGING_TABLE
+from risk_index import latest_customers_query, read_query, index_exists
+
+ROLLUP_TABLE = 'customer_risk_rollups'
+SNAPSHOT_TABLE = 'customer_risk_rollup_snapshots'
+MEMBER_TABLE = 'customer_risk_rollup_members'
+CURSOR_NAME = 'bk_pulse_risk_rollups'
+HISTOGRAM_BINS = 10             # Churn score bins of 10 points (the last one includes 100)
+REBUILD_AFTER = timedelta(hours=24)     # Full rebuild once the oldest contribution is this old
+
+# Rollup scope -> customers column ('all' covers the whole book)
+SCOPES = {'all': None, 'branch': 'branch', 'segment': 'segment', 'product': 'product_type',
+          'officer': 'assigned_officer_id'}
+GROUP_KEYS = ['scope', 'scope_value']
+SOURCE_COLUMNS = ['customer_id', 'churn_score', 'risk_level', 'branch', 'segment', 'product_type',
+                  'assigned_officer_id']
+HISTOGRAM_COLUMNS = [f'hist_{i * 100 // HISTOGRAM_BINS:02d}' for i in range(HISTOGRAM_BINS)]
+# Additive columns: the only state a delta touches
+SUM_COLUMNS = ['customers', 'high_risk', 'medium_risk', 'low_risk', 'score_sum'] + HISTOGRAM_COLUMNS
+ROLLUP_COLUMNS = GROUP_KEYS + SUM_COLUMNS + ['avg_churn_score', 'expected_churn', 'updated_at']
+SNAPSHOT_COLUMNS = ['snapshot_date'] + ROLLUP_COLUMNS[:-1]
+MEMBER_COLUMNS = SOURCE_COLUMNS + ['added_at']
+STAGED_CUSTOMERS = f" AND customer_id IN (SELECT customer_id FROM {STAGING_TABLE})"
+
+
+def _empty_rollups():
+    """Rollups frame with no groups"""
+    return pd.DataFrame(columns=GROUP_KEYS + SUM_COLUMNS).set_index(GROUP_KEYS)
+
+
+def members(customers):
+    """Contributions of a chunk of latest customer rows: scored rows with string group keys"""
+    customers = customers[SOURCE_COLUMNS].assign(
+        customer_id=customers['customer_id'].astype(str),
+        churn_score=pd.to_numeric(customers['churn_score'], errors='coerce').astype(float),
+    )
+    customers = customers[customers['churn_score'].notna()]
+    for column in SCOPES.values():
+        if column is not None:
+            keys = customers[column]
+            customers[column] = keys.where(keys.isna(), keys.astype(str).str.replace(r'\.0$', '', regex=True))
+    return customers
+
+
+def aggregate(customers):
+    """Additive rollup columns per (scope, scope_value) for a chunk of latest customer rows"""
+    customers = members(customers)
+    scores = customers['churn_score'].to_numpy(dtype=float)
+    if not len(scores):
+        return _empty_rollups()
+
+    levels = customers['risk_level'].astype(str).str.lower().to_numpy()
+    bins = np.clip(scores // (100 / HISTOGRAM_BINS), 0, HISTOGRAM_BINS - 1).astype(np.int64)
+    values = pd.DataFrame({
+        'customers': 1,
+        'high_risk': (levels == 'high').astype(np.int64),
+        'medium_risk': (levels == 'medium').astype(np.int64),
+        'low_risk': (levels == 'low').astype(np.int64),
+        'score_sum': scores,
+        **{column: (bins == i).astype(np.int64) for i, column in enumerate(HISTOGRAM_COLUMNS)},
+    })
+
+    groups = []
+    for scope, column in SCOPES.items():
+        keys = pd.Series('all', index=customers.index) if column is None else customers[column]
+        present = keys.notna().to_numpy()
+        if not present.any():
+            continue
+        grouped = values[present].groupby(keys[present].to_numpy()).sum()
+        grouped.index = pd.MultiIndex.from_product([[scope], grouped.index], names=GROUP_KEYS)
+        groups.append(grouped)
+    return pd.concat(groups) if groups else _empty_rollups()
+
+
+def combine(*parts, sign=None):
+    """Sum rollup frames group by group (sign: +1 / -1 per part, default all +1)"""
+    sign = sign or [1] * len(parts)
+    parts = [part * s for part, s in zip(parts, sign) if part is not None and len(part)]
+    if not parts:
+        return _empty_rollups()
+    total = pd.concat(parts).groupby(level=GROUP_KEYS).sum()
+    return total[SUM_COLUMNS]
+
+
+def read_members(conn, dialect, where=''):
+    """Recorded contributions of the customers matching `where` (e.g. STAGED_CUSTOMERS)"""
+    frames = list(read_query(conn, dialect,
+                             f"SELECT {', '.join(SOURCE_COLUMNS)} FROM {MEMBER_TABLE} WHERE 1 = 1{where}"))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=SOURCE_COLUMNS)
+
+
+def members_built_at(conn, dialect):
+    """Time of the oldest recorded contribution (None when the ledger is missing or empty)"""
+    if not index_exists(conn, dialect, MEMBER_TABLE):
+        return None
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT MIN(added_at) FROM {MEMBER_TABLE}")
+    oldest = cursor.fetchone()[0]
+    cursor.close()
+    return pd.Timestamp(oldest).to_pydatetime() if oldest is not None else None
+
+
+def write_members(conn, dialect, customers, where=None):
+    """Record contributions, first dropping those of the customers matching `where` ('' drops all,
+    None only adds)"""
+    cursor = conn.cursor()
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {MEMBER_TABLE} ("
+        "customer_id VARCHAR(50) PRIMARY KEY, churn_score DOUBLE PRECISION NOT NULL, risk_level VARCHAR(20), "
+        "branch VARCHAR(100), segment VARCHAR(100), product_type VARCHAR(100), "
+        "assigned_officer_id VARCHAR(100), added_at TIMESTAMP NOT NULL)"
+    )
+    if where is not None:
+        cursor.execute(f"DELETE FROM {MEMBER_TABLE} WHERE 1 = 1{where}")
+    rows = members(customers).assign(added_at=datetime.now().isoformat(timespec='seconds'))
+    _copy_rows(cursor, dialect, MEMBER_TABLE, MEMBER_COLUMNS, rows)
+    cursor.close()
+    return len(rows)
+
+
+def finalize(rollups):
+    """Stored rows: integer counts, averages and expected churners next to the sums"""
+    rows = rollups[rollups['customers'] > 0].reset_index()
+    counts = [column for column in SUM_COLUMNS if column != 'score_sum']
+    rows[counts] = rows[counts].round().astype(np.int64)
+    rows['score_sum'] = rows['score_sum'].astype(float).round(4)
+    rows['avg_churn_score'] = (rows['score_sum'] / rows['customers']).round(4)
+    rows['expected_churn'] = (rows['score_sum'] / 100).round(4)
+    return rows.sort_values(GROUP_KEYS, kind='stable').reset_index(drop=True)
+
+
+def read_rollups(conn, dialect):
+    """Stored additive rollup columns indexed by (scope, scope_value), or None when not built"""
+    if not index_exists(conn, dialect, ROLLUP_TABLE):
+        return None
+    frames = list(read_query(conn, dialect, f"SELECT {', '.join(GROUP_KEYS + SUM_COLUMNS)} FROM {ROLLUP_TABLE}"))
+    if not frames:
+        return _empty_rollups()
+    rollups = pd.concat(frames, ignore_index=True)
+    rollups[SUM_COLUMNS] = rollups[SUM_COLUMNS].apply(pd.to_numeric, errors='coerce').fillna(0)
+    return rollups.set_index(GROUP_KEYS)
+
+
+def _copy_rows(cursor, dialect, table, columns, rows):
+    """Bulk insert (COPY on PostgreSQL)"""
+    rows = rows[columns]
+    if dialect == 'postgresql':
+        buffer = io.StringIO()
+        rows.to_csv(buffer, header=False, index=False)
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    else:
+        cursor.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            rows.astype(object).where(rows.notna(), None).itertuples(index=False, name=None)
+        )
+
+
+def write_rollups(conn, dialect, rollups, snapshot_date=None):
+    """Replace the stored rollups and today's snapshot (readers see the old ones until commit)"""
+    rows = finalize(rollups).assign(updated_at=datetime.now().isoformat(timespec='seconds'))
+    measures = ', '.join(f"{column} INTEGER NOT NULL" for column in SUM_COLUMNS if column != 'score_sum')
+    cursor = conn.cursor()
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} ("
+        f"scope VARCHAR(20) NOT NULL, scope_value VARCHAR(100) NOT NULL, {measures}, "
+        "score_sum DOUBLE PRECISION NOT NULL, avg_churn_score DOUBLE PRECISION, expected_churn DOUBLE PRECISION, "
+        "updated_at TIMESTAMP, PRIMARY KEY (scope, scope_value))"
+    )
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {SNAPSHOT_TABLE} ("
+        f"snapshot_date DATE NOT NULL, scope VARCHAR(20) NOT NULL, scope_value VARCHAR(100) NOT NULL, {measures}, "
+        "score_sum DOUBLE PRECISION NOT NULL, avg_churn_score DOUBLE PRECISION, expected_churn DOUBLE PRECISION, "
+        "PRIMARY KEY (snapshot_date, scope, scope_value))"
+    )
+    cursor.execute(f"DELETE FROM {ROLLUP_TABLE}")
+    _copy_rows(cursor, dialect, ROLLUP_TABLE, ROLLUP_COLUMNS, rows)
+
+    # One snapshot per day: the last refresh of the day wins
+    snapshot_date = (snapshot_date or date.today()).isoformat()
+    placeholder = '%s' if dialect == 'postgresql' else '?'
+    cursor.execute(f"DELETE FROM {SNAPSHOT_TABLE} WHERE snapshot_date = {placeholder}", (snapshot_date,))
+    _copy_rows(cursor, dialect, SNAPSHOT_TABLE, SNAPSHOT_COLUMNS, rows.assign(snapshot_date=snapshot_date))
+    cursor.close()
+    return rows
+
+
+def rebuild_rollups(conn, dialect, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Full rebuild of the rollups and the ledger from one streaming pass over the customers table
+    (caller commits)"""
+    # Empty the ledger, then record every customer as their chunk is rolled up
+    write_members(conn, dialect, pd.DataFrame(columns=SOURCE_COLUMNS), where='')
+    parts = []
+    query = latest_customers_query(conn, '', SOURCE_COLUMNS)
+    for chunk in read_query(conn, dialect, query, chunk_size=chunk_size, name=CURSOR_NAME):
+        parts.append(aggregate(chunk))
+        write_members(conn, dialect, chunk)
+    return write_rollups(conn, dialect, combine(*parts))
+
+
+def refresh_rollups(conn, dialect):
+    """Apply the delta of a partial rescore: stored + rollups(staged, now) - recorded contributions
+    (caller commits)
+
+    Called by score_database.py after scores are applied, in the same transaction.
+    Rebuilds from scratch the first time and once the ledger is REBUILD_AFTER old.
+    """
+    stored = read_rollups(conn, dialect)
+    built_at = members_built_at(conn, dialect)
+    if stored is None or built_at is None or datetime.now() - built_at > REBUILD_AFTER:
+        return rebuild_rollups(conn, dialect)
+    rescored = list(read_query(conn, dialect, latest_customers_query(conn, STAGED_CUSTOMERS, SOURCE_COLUMNS)))
+    rescored = pd.concat(rescored, ignore_index=True) if rescored else pd.DataFrame(columns=SOURCE_COLUMNS)
+    before = aggregate(read_members(conn, dialect, STAGED_CUSTOMERS))
+    rollups = combine(stored, aggregate(rescored), before, sign=[1, 1, -1])
+    rows = write_rollups(conn, dialect, rollups)
+    write_members(conn, dialect, rescored, where=STAGED_CUSTOMERS)
+    print(f"Refreshed risk rollups for {len(rescored):,} rescored customers "
+          f"({len(rows):,} groups)", file=sys.stderr)
+    return rows
+
+
+def read_snapshots(conn, dialect, scope='all', value='all', days=30):
+    """Daily snapshots of one group over the last `days` days, oldest first"""
+    if not index_exists(conn, dialect, SNAPSHOT_TABLE):
+        return None
+    since = (date.today() - timedelta(days=days)).isoformat()
+    frames = list(read_query(
+        conn, dialect,
+        f"SELECT {', '.join(SNAPSHOT_COLUMNS)} FROM {SNAPSHOT_TABLE} "
+        f"WHERE scope = ? AND scope_value = ? AND snapshot_date >= ? ORDER BY snapshot_date",
+        (scope, value, since)
+    ))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=SNAPSHOT_COLUMNS)
+
+
+def export_rollups(rows, path):
+    """Write the rollups as JSON: {scope: {scope_value: {measures..., histogram: [...]}}}"""
+    exported = {'generated_at': datetime.now().isoformat(), 'histogram_bins': HISTOGRAM_BINS, 'groups': {}}
+    for row in rows.to_dict('records'):
+        exported['groups'].setdefault(row['scope'], {})[row['scope_value']] = {
+            'customers': int(row['customers']),
+            'high_risk': int(row['high_risk']),
+            'medium_risk': int(row['medium_risk']),
+            'low_risk': int(row['low_risk']),
+            'avg_churn_score': float(row['avg_churn_score']),
+            'expected_churn': float(row['expected_churn']),
+            'histogram': [int(row[column]) for column in HISTOGRAM_COLUMNS],
+        }
+    with open(path, 'w') as f:
+        json.dump(exported, f)
+    return path
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Precomputed churn-risk rollups')
+    parser.add_argument('--dsn', default=None,
+                        help='PostgreSQL URL or sqlite:///path (default: DATABASE_URL or DB_* settings)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help=f'Rebuild {ROLLUP_TABLE} from the customers table')
+    build.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    build.add_argument('--output', help='Also export the rollups as JSON')
+
+    show = subparsers.add_parser('show', help='Print the rollups of one scope')
+    show.add_argument('--scope', choices=list(SCOPES), default='all')
+
+    trend = subparsers.add_parser('trend', help='Print the daily snapshots of one group')
+    trend.add_argument('--scope', choices=list(SCOPES), default='all')
+    trend.add_argument('--value', default='all')
+    trend.add_argument('--days', type=int, default=30)
+
+    args = parser.parse_args()
+    conn, dialect = connect(args.dsn)
+    try:
+        if args.command == 'build':
+            start_time = time.time()
+            rows = rebuild_rollups(conn, dialect, args.chunk_size)
+            conn.commit()
+            total = rows.loc[rows['scope'] == 'all', 'customers'].sum()
+            print(f"Rolled up {total:,} customers into {len(rows):,} groups "
+                  f"in {time.time() - start_time:.1f}s -> {ROLLUP_TABLE}", file=sys.stderr)
+            if args.output:
+                export_rollups(rows, args.output)
+            return
+
+        if args.command == 'trend':
+            snapshots = read_snapshots(conn, dialect, args.scope, args.value, args.days)
+            if snapshots is None:
+                print(f"No {SNAPSHOT_TABLE} table. Run: python risk_rollups.py build", file=sys.stderr)
+                sys.exit(1)
+            print(snapshots[['snapshot_date', 'customers', 'high_risk', 'medium_risk', 'low_risk',
+                             'avg_churn_score', 'expected_churn']].to_string(index=False))
+            return
+
+        rollups = read_rollups(conn, dialect)
+        if rollups is None:
+            print(f"No {ROLLUP_TABLE} table. Run: python risk_rollups.py build", file=sys.stderr)
+            sys.exit(1)
+        rows = finalize(rollups)
+        print(rows[rows['scope'] == args.scope].drop(columns=['scope']).to_string(index=False))
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,32 +1,20 @@
 """
 Complete ML Pipeline Runner
-Runs preprocessing and training in sequence
+Runs preprocessing, training, evaluation and export in-process (see pipeline.py).
+Stages whose code, parameters and input data are unchanged since their last run are skipped.
+
+Usage:
+    python run_pipeline.py                          # preprocess -> train -> evaluate -> export
+    python run_pipeline.py --eda                    # also run EDA, in parallel with preprocessing/training
+    python run_pipeline.py --force                  # re-run every stage
+    python run_pipeline.py --imbalance-strategy smote
+    python run_pipeline.py --out-of-core            # train from shards (train_out_of_core.py)
+    python run_pipeline.py --incremental            # warm-start the production model (incremental_train.py)
 """
 
-import subprocess
 import sys
 import os
-
-def run_script(script_name):
-    """Run a Python script and handle errors"""
-    print(f"\n{'='*60}")
-    print(f"Running: {script_name}")
-    print('='*60)
-    
-    try:
-        result = subprocess.run(
-            [sys.executable, script_name],
-            check=True,
-            capture_output=False
-        )
-        print(f"\n✓ {script_name} completed successfully!")
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"\n✗ {script_name} failed with error code {e.returncode}")
-        return False
-    except FileNotFoundError:
-        print(f"\n✗ Script not found: {script_name}")
-        return False
+import argparse
 
 
 def main():
@@ -35,11 +23,6 @@ def main():
     print("BK Pulse - Complete ML Pipeline")
     print("="*60)
     
-    scripts = [
-        'preprocess.py',
-        'train_model.py'
-    ]
-    
     # Check if we're in the ml directory
     if not os.path.exists('preprocess.py'):
         print("\n⚠ Warning: Scripts not found in current directory.")
@@ -48,13 +31,36 @@ def main():
         print("  python run_pipeline.py")
         sys.exit(1)
     
-    # Run scripts in sequence
-    for script in scripts:
-        success = run_script(script)
-        if not success:
-            print(f"\n✗ Pipeline stopped at {script}")
-            print("Please fix the errors and try again.")
-            sys.exit(1)
+    import pipeline
+    import train_model
+    
+    parser = argparse.ArgumentParser(description='Run the BK Pulse ML pipeline')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Continue the production model on new/changed rows only')
+    parser.add_argument('--eda', action='store_true', help='Also run exploratory data analysis')
+    parser.add_argument('--force', action='store_true', help='Re-run every stage even if unchanged')
+    parser.add_argument('--imbalance-strategy', choices=train_model.IMBALANCE_STRATEGIES,
+                        default=train_model.DEFAULT_IMBALANCE_STRATEGY)
+    parser.add_argument('--out-of-core', action='store_true', help='Train from shards')
+    args = parser.parse_args()
+    
+    try:
+        # Incremental mode continues the production model on new/changed rows only
+        # (incremental_train.py falls back to a full preprocess + train when needed)
+        if args.incremental:
+            import incremental_train
+            incremental_train.run_incremental()
+        else:
+            targets = ['export'] + (['explore'] if args.eda else [])
+            pipeline.run_pipeline(
+                targets=targets,
+                params={'imbalance_strategy': args.imbalance_strategy, 'out_of_core': args.out_of_core},
+                force=args.force
+            )
+    except Exception as e:
+        print(f"\n✗ Pipeline failed: {e}")
+        print("Please fix the errors and try again.")
+        sys.exit(1)
     
     print("\n" + "="*60)
     print("✓ Complete ML Pipeline Finished Successfully!")
@@ -66,4 +72,3 @@ def main():
 
 if __name__ == '__main__':
     main()
-
@@ -0,0 +1,365 @@
+"""
+Bulk Database Scoring Job for BK Pulse Churn Prediction
+Rescores the customers table directly from Python:
+  - streams customers through a server-side cursor
+  - converts rows the same way as transformCustomerForPrediction (server/utils/mlPredictor.js)
+  - scores them in large vectorized chunks
+  - writes scores back through a staging table (COPY on PostgreSQL) and one set-based UPDATE
+  - refreshes the top-K at-risk index (risk_index.py) for the rescored customers
+  - moves the precomputed risk rollups (risk_rollups.py) by the rescored customers' deltas
+
+Usage:
+    python ml/score_database.py                    # customers with no score or a stale score
+    python ml/score_database.py --all              # full-book rescore
+    python ml/score_database.py --dsn sqlite:///path/to/bk_pulse.db --all
+    python ml/scoring_job.py run --all             # resumable job, high-risk and stale customers first
+"""
+
+import io
+import os
+import sys
+import time
+import sqlite3
+import argparse
+from pathlib import Path
+
+import pandas as pd
+
+from batch_scoring import DEFAULT_CHUNK_SIZE, score_chunks
+from drift_monitor import DRIFT_REPORT_PATH, load_monitor
+from predict import load_artifacts, get_model_version
+from resource_governor import govern
+from scoring_metrics import write_metrics
+from scoring_profiler import install_signal_handler
+
+BASE_DIR = Path(__file__).parent.parent
+SERVER_ENV_PATH = BASE_DIR / 'server' / '.env'
+CURSOR_NAME = 'bk_pulse_churn_scoring'
+STAGING_TABLE = 'churn_score_staging'
+
+# customers columns read by transform_customer_rows (only those present in the table are selected)
+CUSTOMER_COLUMNS = [
+    'id', 'customer_id', 'segment', 'age', 'gender', 'nationality', 'product_type',
+    'branch', 'currency', 'account_balance', 'tenure_months', 'num_products',
+    'has_credit_card', 'account_status', 'transaction_frequency',
+    'average_transaction_value', 'mobile_banking_usage', 'branch_visits',
+    'complaint_history', 'account_age_months', 'days_since_last_transaction',
+    'account_open_date', 'last_transaction_date', 'created_at', 'updated_at'
+]
+
+
+def load_env_file(env_path=SERVER_ENV_PATH):
+    """Load database settings from server/.env without overriding the environment"""
+    if not Path(env_path).exists():
+        return
+    with open(env_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#') or '=' not in line:
+                continue
+            key, value = line.split('=', 1)
+            os.environ.setdefault(key.strip(), value.strip().strip('"').strip("'"))
+
+
+def connect(dsn=None):
+    """Open a database connection and return (connection, dialect)
+
+    Accepts sqlite:///path DSNs for local testing. Otherwise connects to
+    PostgreSQL using DATABASE_URL or the same DB_* settings as server/config/database.js.
+    """
+    load_env_file()
+    dsn = dsn or os.environ.get('DATABASE_URL')
+
+    if dsn and dsn.startswith('sqlite:'):
+        return sqlite3.connect(dsn.split(':///', 1)[-1]), 'sqlite'
+
+    try:
+        import psycopg2
+    except ImportError:
+        raise ImportError("psycopg2 is required for PostgreSQL scoring. Install with: pip install psycopg2-binary")
+
+    if dsn:
+        return psycopg2.connect(dsn), 'postgresql'
+    return psycopg2.connect(
+        host=os.environ.get('DB_HOST', 'localhost'),
+        port=os.environ.get('DB_PORT', 5432),
+        dbname=os.environ.get('DB_NAME', 'bk_pulse'),
+        user=os.environ.get('DB_USER', 'postgres'),
+        password=os.environ.get('DB_PASSWORD', 'password')
+    ), 'postgresql'
+
+
+def get_table_columns(conn, table='customers'):
+    """Return the column names of a table"""
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT * FROM {table} LIMIT 0')
+    columns = [desc[0] for desc in cursor.description]
+    cursor.close()
+    return columns
+
+
+def customer_filter(dialect, update_all=False):
+    """WHERE clause selecting the customers to rescore (same filter as updateChurnScores.js)"""
+    if update_all:
+        return ""
+    stale_cutoff = "CURRENT_DATE - INTERVAL '1 day'" if dialect == 'postgresql' else "date('now', '-1 day')"
+    return f" WHERE churn_score IS NULL OR updated_at < {stale_cutoff}"
+
+
+def build_customer_query(columns, dialect, update_all=False, limit=None):
+    """Build the customer selection query (same filter as updateChurnScores.js)"""
+    query = f"SELECT {', '.join(columns)} FROM customers"
+    query += customer_filter(dialect, update_all)
+    query += " ORDER BY id"
+    if limit:
+        query += f" LIMIT {int(limit)}"
+    return query
+
+
+def stream_customers(conn, dialect, chunk_size=DEFAULT_CHUNK_SIZE, update_all=False, limit=None):
+    """Yield customers as DataFrames of at most chunk_size rows
+
+    PostgreSQL uses a named (server-side) cursor so the full table is never
+    materialized on the client; SQLite cursors already step through rows lazily.
+    """
+    available = set(get_table_columns(conn))
+    columns = [col for col in CUSTOMER_COLUMNS if col in available]
+    query = build_customer_query(columns, dialect, update_all=update_all, limit=limit)
+
+    if dialect == 'postgresql':
+        cursor = conn.cursor(name=CURSOR_NAME)
+        cursor.itersize = chunk_size
+    else:
+        cursor = conn.cursor()
+    cursor.execute(query)
+
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield pd.DataFrame(rows, columns=[desc[0] for desc in cursor.description])
+    finally:
+        cursor.close()
+
+
+def _is_falsy(series):
+    """Mask of values JavaScript treats as falsy (null, NaN, 0, '', false)"""
+    falsy = series.isna()
+    values = series[~falsy]
+    if len(values):
+        falsy[~falsy] = values.map(lambda value: value == 0 or value == '' or value is False)
+    return falsy.astype(bool)
+
+
+def _or_default(series, default):
+    """Vectorized `value || default`"""
+    series = series.astype(object)
+    return series.where(~_is_falsy(series), default)
+
+
+def _column(df, name):
+    """Return a column, or an all-null column if the table does not have it"""
+    return df[name] if name in df.columns else pd.Series(None, index=df.index, dtype=object)
+
+
+def _to_naive_datetime(series):
+    """Parse database timestamps into timezone-naive datetimes"""
+    parsed = pd.to_datetime(series, errors='coerce', utc=True)
+    return parsed.dt.tz_localize(None)
+
+
+def transform_customer_rows(customers, now=None):
+    """Vectorized port of transformCustomerForPrediction from server/utils/mlPredictor.js"""
+    now = pd.Timestamp.now() if now is None else pd.Timestamp(now)
+    column = lambda name: _column(customers, name)
+
+    # Account_Age_Months from created_at, Days_Since_Last_Transaction from updated_at
+    months_since_created = ((now - _to_naive_datetime(column('created_at'))).dt.total_seconds() / (60 * 60 * 24 * 30)).round()
+    days_since_updated = ((now - _to_naive_datetime(column('updated_at'))).dt.total_seconds() / (60 * 60 * 24)).round()
+    account_age_months = _or_default(_or_default(column('account_age_months'), months_since_created), 12)
+    days_since_last_transaction = _or_default(_or_default(column('days_since_last_transaction'), days_since_updated), 0)
+
+    # Parse account_balance - handle string or number
+    balance = pd.to_numeric(
+        column('account_balance').astype(str).str.replace(',', '', regex=False), errors='coerce'
+    ).fillna(0.0)
+
+    ids = column('id')
+    customer_id = _or_default(column('customer_id'), ids.astype(str).where(ids.notna(), 'UNKNOWN'))
+
+    now_iso = now.isoformat()
+    account_open_date = _or_default(_or_default(column('account_open_date'), column('created_at')), now_iso)
+    last_transaction_date = _or_default(_or_default(column('last_transaction_date'), column('updated_at')), now_iso)
+
+    return pd.DataFrame({
+        'Customer_ID': customer_id.astype(str),
+        'Customer_Segment': _or_default(column('segment'), 'Retail').astype(str).str.capitalize(),
+        'Age': _or_default(column('age'), 50),
+        'Gender': _or_default(column('gender'), 'Male'),
+        'Nationality': _or_default(column('nationality'), 'Rwandan'),
+        'Account_Type': _or_default(column('product_type'), 'Savings'),
+        'Branch': _or_default(column('branch'), 'Kigali Main'),
+        'Currency': _or_default(column('currency'), 'RWF'),
+        'Balance': balance,
+        'Tenure_Months': _or_default(column('tenure_months'), account_age_months),
+        'Num_Products': _or_default(column('num_products'), 1),
+        'Has_Credit_Card': (~_is_falsy(column('has_credit_card'))).astype(int),
+        'Account_Status': _or_default(column('account_status'), 'Active'),
+        'Transaction_Frequency': _or_default(column('transaction_frequency'), 10),
+        'Average_Transaction_Value': _or_default(column('average_transaction_value'), balance * 0.05),
+        'Mobile_Banking_Usage': _or_default(column('mobile_banking_usage'), 10),
+        'Branch_Visits': _or_default(column('branch_visits'), 5),
+        'Complaint_History': _or_default(column('complaint_history'), 0),
+        'Account_Age_Months': account_age_months,
+        'Days_Since_Last_Transaction': days_since_last_transaction,
+        'Account_Open_Date': _to_naive_datetime(account_open_date),
+        'Last_Transaction_Date': _to_naive_datetime(last_transaction_date),
+    }, index=customers.index)
+
+
+def create_staging_table(conn, dialect):
+    """Create (or empty) the session-local staging table for scores"""
+    cursor = conn.cursor()
+    if dialect == 'postgresql':
+        cursor.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} ("
+            "customer_id VARCHAR(50) NOT NULL, churn_score DECIMAL(5,2), risk_level VARCHAR(20))"
+        )
+    else:
+        cursor.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} ("
+            "customer_id VARCHAR(50) PRIMARY KEY, churn_score DECIMAL(5,2), risk_level VARCHAR(20))"
+        )
+    cursor.execute(f"DELETE FROM {STAGING_TABLE}")
+    cursor.close()
+
+
+def stage_scores(conn, dialect, scores):
+    """Append a chunk of scores to the staging table (COPY on PostgreSQL)"""
+    scores = scores.loc[scores['customer_id'].notna(), ['customer_id', 'churn_score', 'risk_level']]
+    cursor = conn.cursor()
+    if dialect == 'postgresql':
+        buffer = io.StringIO()
+        scores.to_csv(buffer, header=False, index=False)
+        buffer.seek(0)
+        cursor.copy_expert(
+            f"COPY {STAGING_TABLE} (customer_id, churn_score, risk_level) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+    else:
+        cursor.executemany(
+            f"INSERT OR REPLACE INTO {STAGING_TABLE} (customer_id, churn_score, risk_level) VALUES (?, ?, ?)",
+            scores.itertuples(index=False, name=None)
+        )
+    cursor.close()
+    return len(scores)
+
+
+def apply_staged_scores(conn, dialect, model_version=None):
+    """Write all staged scores to customers with one set-based UPDATE (and the model version, if given)"""
+    cursor = conn.cursor()
+    params = () if model_version is None else (model_version,)
+    version = "" if model_version is None else "model_version = ?, "
+    if dialect == 'postgresql':
+        cursor.execute(
+            f"UPDATE customers c SET churn_score = s.churn_score, risk_level = s.risk_level, "
+            f"{version.replace('?', '%s')}"
+            f"updated_at = CURRENT_TIMESTAMP FROM {STAGING_TABLE} s WHERE c.customer_id = s.customer_id",
+            params
+        )
+    else:
+        cursor.execute(
+            f"UPDATE customers SET "
+            f"churn_score = (SELECT s.churn_score FROM {STAGING_TABLE} s WHERE s.customer_id = customers.customer_id), "
+            f"risk_level = (SELECT s.risk_level FROM {STAGING_TABLE} s WHERE s.customer_id = customers.customer_id), "
+            f"{version}updated_at = CURRENT_TIMESTAMP "
+            f"WHERE customer_id IN (SELECT customer_id FROM {STAGING_TABLE})",
+            params
+        )
+    updated = cursor.rowcount
+    cursor.close()
+    return updated
+
+
+def score_database(dsn=None, update_all=False, limit=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                   drift_report=DRIFT_REPORT_PATH, risk_index=True, rollups=True, shadow_models=None,
+                   shadow_log=None):
+    """Rescore customers in the database and return (scored, updated) counts"""
+    artifacts = load_artifacts()
+    monitor = load_monitor() if drift_report else None
+    shadow = None
+    if shadow_models:
+        from shadow_scoring import start_shadow
+        shadow = start_shadow(shadow_models, shadow_log)
+    conn, dialect = connect(dsn)
+    start_time = time.time()
+    scored = 0
+
+    try:
+        create_staging_table(conn, dialect)
+
+        customers = stream_customers(conn, dialect, chunk_size=chunk_size, update_all=update_all, limit=limit)
+        prediction_input = (transform_customer_rows(chunk) for chunk in customers)
+        for scores in score_chunks(prediction_input, artifacts, monitor, shadow):
+            scored += stage_scores(conn, dialect, scores)
+            print(f"Scored {scored:,} customers ({time.time() - start_time:.1f}s)...", file=sys.stderr)
+
+        # model_version is optional (server/sql/add_model_version_to_customers.sql)
+        model_version = get_model_version() if 'model_version' in get_table_columns(conn) else None
+        updated = apply_staged_scores(conn, dialect, model_version)
+        if rollups:
+            from risk_rollups import refresh_rollups
+            refresh_rollups(conn, dialect)
+        if risk_index:
+            # Same transaction: the top-K index never disagrees with the committed scores
+            from risk_index import refresh_index
+            refresh_index(conn, dialect)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    print(f"Updated {updated:,} customers in {time.time() - start_time:.1f}s", file=sys.stderr)
+    if monitor is not None:
+        monitor.write_report(drift_report, model_version=get_model_version())
+    if shadow is not None:
+        shadow.close()
+    return scored, updated
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Rescore the customers table in bulk')
+    parser.add_argument('--all', action='store_true', dest='update_all',
+                        help='Rescore every customer (default: only unscored or stale customers)')
+    parser.add_argument('--limit', type=int, default=None, help='Maximum number of customers to score')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f'Rows per scoring chunk (default: {DEFAULT_CHUNK_SIZE})')
+    parser.add_argument('--dsn', default=None,
+                        help='PostgreSQL URL or sqlite:///path (default: DATABASE_URL or DB_* settings)')
+    parser.add_argument('--drift-report', default=str(DRIFT_REPORT_PATH),
+                        help='Where to write the population drift report ("" to disable)')
+    parser.add_argument('--no-risk-index', action='store_false', dest='risk_index',
+                        help='Do not refresh the top-K at-risk index (risk_index.py)')
+    parser.add_argument('--no-rollups', action='store_false', dest='rollups',
+                        help='Do not update the precomputed risk rollups (risk_rollups.py)')
+    parser.add_argument('--shadow', nargs='?', const='all', default=None, metavar='MODELS',
+                        help='Also score with challenger models: "all" (default) or e.g. lightgbm,random_forest')
+    parser.add_argument('--shadow-log', help='CSV of per-customer production and challenger probabilities')
+    parser.add_argument('--metrics-output', help='Where to write the run metrics JSON '
+                        '(default: data/monitoring/metrics/score_database.json)')
+    args = parser.parse_args()
+    govern(role='score_database.py')
+    install_signal_handler()
+
+    score_database(dsn=args.dsn, update_all=args.update_all, limit=args.limit, chunk_size=args.chunk_size,
+                   drift_report=args.drift_report, risk_index=args.risk_index, rollups=args.rollups,
+                   shadow_models=args.shadow, shadow_log=args.shadow_log)
+    write_metrics('score_database', args.metrics_output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+"""
+Resumable Bulk Scoring Jobs for BK Pulse Churn Prediction
+Runs the database rescore as a job of durable work units that can resume after a failure.
+
+Planning freezes the customers to score into numbered work units of chunk_size rows
+(scoring_job_members) in risk-priority order:
+  - previously high-risk customers first, then unscored, medium and low risk
+  - within each tier, the stalest scores (oldest updated_at) first
+Each unit is scored, written back and marked done (scoring_job_units) in one
+transaction, so an interrupted run loses at most the unit in progress. Running
+again resumes the open job at its first pending unit. The job records the model
+version it was planned with; resuming with a different model needs --restart.
+
+Usage:
+    python ml/scoring_job.py run --all             # plan a full rescore, or resume the open job
+    python ml/scoring_job.py run --restart         # abandon the open job and plan a new one
+    python ml/scoring_job.py status
+"""
+
+import sys
+import time
+import argparse
+from datetime import datetime
+
+import pandas as pd
+
+from batch_scoring import DEFAULT_CHUNK_SIZE, score_chunk
+from drift_monitor import DRIFT_REPORT_PATH, load_monitor
+from predict import load_artifacts, get_model_version
+from score_database import (CUSTOMER_COLUMNS, connect, get_table_columns, customer_filter,
+                            transform_customer_rows, create_staging_table, stage_scores, apply_staged_scores)
+from risk_index import read_query
+from resource_governor import govern
+from scoring_metrics import serve_metrics, write_metrics
+from scoring_profiler import install_signal_handler
+
+JOBS_TABLE = 'scoring_jobs'
+UNITS_TABLE = 'scoring_job_units'
+MEMBERS_TABLE = 'scoring_job_members'
+
+# Scoring order: previously high risk, unscored, medium, low; stalest first within each tier
+PRIORITY_ORDER = (
+    "CASE WHEN churn_score IS NULL THEN 1 "
+    "WHEN CAST(churn_score AS REAL) > 70 THEN 0 "
+    "WHEN CAST(churn_score AS REAL) > 40 THEN 2 ELSE 3 END, "
+    "updated_at IS NOT NULL, updated_at, id"
+)
+
+
+def execute(conn, dialect, query, params=()):
+    """Run one statement with ? placeholders (converted to %s on PostgreSQL)"""
+    cursor = conn.cursor()
+    cursor.execute(query.replace('?', '%s') if dialect == 'postgresql' else query, params)
+    rowcount = cursor.rowcount
+    cursor.close()
+    return rowcount
+
+
+def create_job_tables(conn, dialect):
+    """Create the job, work unit and unit membership tables (if missing)"""
+    execute(conn, dialect,
+            f"CREATE TABLE IF NOT EXISTS {JOBS_TABLE} ("
+            "job_id VARCHAR(40) PRIMARY KEY, status VARCHAR(20) NOT NULL, model_version VARCHAR(100), "
+            "update_all BOOLEAN, chunk_size INTEGER, total_units INTEGER, total_rows INTEGER, "
+            "created_at TIMESTAMP, completed_at TIMESTAMP)")
+    execute(conn, dialect,
+            f"CREATE TABLE IF NOT EXISTS {UNITS_TABLE} ("
+            "job_id VARCHAR(40) NOT NULL, unit_id INTEGER NOT NULL, row_count INTEGER, "
+            "status VARCHAR(20) NOT NULL, scored INTEGER, completed_at TIMESTAMP, PRIMARY KEY (job_id, unit_id))")
+    execute(conn, dialect,
+            f"CREATE TABLE IF NOT EXISTS {MEMBERS_TABLE} ("
+            "job_id VARCHAR(40) NOT NULL, unit_id INTEGER NOT NULL, customer_row_id INTEGER NOT NULL)")
+    execute(conn, dialect,
+            f"CREATE INDEX IF NOT EXISTS idx_{MEMBERS_TABLE}_unit ON {MEMBERS_TABLE} (job_id, unit_id)")
+    conn.commit()
+
+
+def read_rows(conn, dialect, query, params=()):
+    """All rows of a query as one DataFrame"""
+    chunks = list(read_query(conn, dialect, query, params))
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+
+
+def find_open_job(conn, dialect):
+    """The most recent job that has not completed, as a dict (or None)"""
+    jobs = read_rows(conn, dialect,
+                     f"SELECT * FROM {JOBS_TABLE} WHERE status = 'running' ORDER BY created_at DESC, job_id DESC")
+    return None if jobs.empty else jobs.iloc[0].to_dict()
+
+
+def abandon_job(conn, dialect, job_id):
+    """Close a job without finishing it and drop its unit membership"""
+    execute(conn, dialect, f"UPDATE {JOBS_TABLE} SET status = 'abandoned' WHERE job_id = ?", (job_id,))
+    execute(conn, dialect, f"DELETE FROM {MEMBERS_TABLE} WHERE job_id = ?", (job_id,))
+    conn.commit()
+
+
+def plan_job(conn, dialect, update_all=False, chunk_size=DEFAULT_CHUNK_SIZE, model_version=None):
+    """Freeze the customers to rescore into priority-ordered work units (set-based, in the database)"""
+    job_id = datetime.now().strftime('%Y%m%d%H%M%S%f')
+    execute(conn, dialect,
+            f"INSERT INTO {MEMBERS_TABLE} (job_id, unit_id, customer_row_id) "
+            f"SELECT ?, (ROW_NUMBER() OVER (ORDER BY {PRIORITY_ORDER}) - 1) / ?, id "
+            f"FROM customers{customer_filter(dialect, update_all)}",
+            (job_id, int(chunk_size)))
+    execute(conn, dialect,
+            f"INSERT INTO {UNITS_TABLE} (job_id, unit_id, row_count, status) "
+            f"SELECT job_id, unit_id, COUNT(*), 'pending' FROM {MEMBERS_TABLE} WHERE job_id = ? "
+            f"GROUP BY job_id, unit_id",
+            (job_id,))
+    totals = read_rows(conn, dialect,
+                       f"SELECT COUNT(*) AS units, COALESCE(SUM(row_count), 0) AS row_total "
+                       f"FROM {UNITS_TABLE} WHERE job_id = ?", (job_id,)).iloc[0]
+    execute(conn, dialect,
+            f"INSERT INTO {JOBS_TABLE} (job_id, status, model_version, update_all, chunk_size, total_units, "
+            f"total_rows, created_at) VALUES (?, 'running', ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)",
+            (job_id, model_version, bool(update_all), int(chunk_size), int(totals['units']), int(totals['row_total'])))
+    conn.commit()
+    print(f"Planned job {job_id}: {int(totals['row_total']):,} customers in {int(totals['units']):,} units",
+          file=sys.stderr)
+    return find_open_job(conn, dialect)
+
+
+def pending_units(conn, dialect, job_id):
+    """Unit ids still to score, in priority order"""
+    units = read_rows(conn, dialect,
+                      f"SELECT unit_id FROM {UNITS_TABLE} WHERE job_id = ? AND status = 'pending' ORDER BY unit_id",
+                      (job_id,))
+    return [] if units.empty else units['unit_id'].astype(int).tolist()
+
+
+def read_unit(conn, dialect, job_id, unit_id):
+    """Customer rows of one work unit"""
+    available = set(get_table_columns(conn))
+    columns = ', '.join(col for col in CUSTOMER_COLUMNS if col in available)
+    return read_rows(conn, dialect,
+                     f"SELECT {columns} FROM customers WHERE id IN "
+                     f"(SELECT customer_row_id FROM {MEMBERS_TABLE} WHERE job_id = ? AND unit_id = ?)",
+                     (job_id, int(unit_id)))
+
+
+def score_unit(conn, dialect, job_id, unit_id, artifacts, monitor=None, risk_index=True, model_version=None,
+               rollups=True):
+    """Score one unit, write its scores and mark it done in a single transaction"""
+    try:
+        customers = read_unit(conn, dialect, job_id, unit_id)
+        create_staging_table(conn, dialect)
+        scored = 0
+        if not customers.empty:
+            scored = stage_scores(conn, dialect, score_chunk(transform_customer_rows(customers), artifacts, monitor))
+            apply_staged_scores(conn, dialect, model_version)
+            if rollups:
+                from risk_rollups import refresh_rollups
+                refresh_rollups(conn, dialect)
+            if risk_index:
+                from risk_index import refresh_index
+                refresh_index(conn, dialect)
+        execute(conn, dialect,
+                f"UPDATE {UNITS_TABLE} SET status = 'done', scored = ?, completed_at = CURRENT_TIMESTAMP "
+                f"WHERE job_id = ? AND unit_id = ?",
+                (scored, job_id, int(unit_id)))
+        conn.commit()
+        return scored
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def finish_job(conn, dialect, job_id):
+    """Mark a job completed once every unit is done and drop its unit membership"""
+    if pending_units(conn, dialect, job_id):
+        return False
+    execute(conn, dialect,
+            f"UPDATE {JOBS_TABLE} SET status = 'completed', completed_at = CURRENT_TIMESTAMP WHERE job_id = ?",
+            (job_id,))
+    execute(conn, dialect, f"DELETE FROM {MEMBERS_TABLE} WHERE job_id = ?", (job_id,))
+    conn.commit()
+    return True
+
+
+def run_job(dsn=None, update_all=False, chunk_size=DEFAULT_CHUNK_SIZE, restart=False,
+            drift_report=DRIFT_REPORT_PATH, risk_index=True, rollups=True):
+    """Resume the open scoring job (or plan a new one) and score its pending units"""
+    artifacts = load_artifacts()
+    model_version = get_model_version()
+    monitor = load_monitor() if drift_report else None
+    conn, dialect = connect(dsn)
+    start_time = time.time()
+    scored = failed = 0
+
+    try:
+        create_job_tables(conn, dialect)
+        job = find_open_job(conn, dialect)
+        if job is not None and restart:
+            abandon_job(conn, dialect, job['job_id'])
+            job = None
+        if job is not None and job['model_version'] != model_version:
+            raise RuntimeError(f"Open job {job['job_id']} was planned with model {job['model_version']}, "
+                               f"current model is {model_version}. Run again with --restart to rescore from scratch.")
+        if job is None:
+            job = plan_job(conn, dialect, update_all, chunk_size, model_version)
+        else:
+            print(f"Resuming job {job['job_id']}", file=sys.stderr)
+
+        # The customers table may have no model_version column (server/sql/add_model_version_to_customers.sql)
+        written_version = model_version if 'model_version' in get_table_columns(conn) else None
+        units = pending_units(conn, dialect, job['job_id'])
+        for position, unit_id in enumerate(units, start=1):
+            try:
+                scored += score_unit(conn, dialect, job['job_id'], unit_id, artifacts, monitor,
+                                     risk_index, written_version, rollups)
+            except Exception as e:
+                # Left pending: the next run retries it
+                failed += 1
+                print(f"Warning: Could not score unit {unit_id}: {e}", file=sys.stderr)
+                continue
+            print(f"Unit {unit_id} done ({position}/{len(units)}, {scored:,} customers, "
+                  f"{time.time() - start_time:.1f}s)...", file=sys.stderr)
+        completed = finish_job(conn, dialect, job['job_id'])
+    finally:
+        conn.close()
+
+    status = 'completed' if completed else f"{failed} unit(s) pending, run again to resume"
+    print(f"Job {job['job_id']}: scored {scored:,} customers in {time.time() - start_time:.1f}s ({status})",
+          file=sys.stderr)
+    if monitor is not None and scored:
+        monitor.write_report(drift_report, model_version=model_version)
+    return job['job_id'], scored, completed
+
+
+def job_status(dsn=None):
+    """Progress of the most recent jobs"""
+    conn, dialect = connect(dsn)
+    try:
+        create_job_tables(conn, dialect)
+        jobs = read_rows(conn, dialect,
+                         f"SELECT j.job_id, j.status, j.model_version, j.total_units, j.total_rows, "
+                         f"SUM(CASE WHEN u.status = 'done' THEN 1 ELSE 0 END) AS done_units, "
+                         f"COALESCE(SUM(u.scored), 0) AS scored "
+                         f"FROM {JOBS_TABLE} j LEFT JOIN {UNITS_TABLE} u ON u.job_id = j.job_id "
+                         f"GROUP BY j.job_id, j.status, j.model_version, j.total_units, j.total_rows, j.created_at "
+                         f"ORDER BY j.created_at DESC, j.job_id DESC LIMIT 10")
+    finally:
+        conn.close()
+    return jobs
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Resumable, checkpointed bulk scoring of the customers table')
+    parser.add_argument('--dsn', default=None,
+                        help='PostgreSQL URL or sqlite:///path (default: DATABASE_URL or DB_* settings)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run = subparsers.add_parser('run', help='Resume the open job, or plan and run a new one')
+    run.add_argument('--all', action='store_true', dest='update_all',
+                     help='Rescore every customer (default: only unscored or stale customers)')
+    run.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                     help=f'Customers per work unit (default: {DEFAULT_CHUNK_SIZE})')
+    run.add_argument('--restart', action='store_true', help='Abandon the open job and plan a new one')
+    run.add_argument('--drift-report', default=str(DRIFT_REPORT_PATH),
+                     help='Where to write the population drift report ("" to disable)')
+    run.add_argument('--no-risk-index', action='store_false', dest='risk_index',
+                     help='Do not refresh the top-K at-risk index (risk_index.py)')
+    run.add_argument('--no-rollups', action='store_false', dest='rollups',
+                     help='Do not update the precomputed risk rollups (risk_rollups.py)')
+    run.add_argument('--metrics-port', type=int, help='Serve Prometheus metrics on this port while the job runs')
+    run.add_argument('--metrics-output', help='Where to write the run metrics JSON '
+                     '(default: data/monitoring/metrics/scoring_job.json)')
+
+    subparsers.add_parser('status', help='Show the progress of recent jobs')
+    args = parser.parse_args()
+    govern(role='scoring_job.py')
+    install_signal_handler()
+
+    if args.command == 'run':
+        if args.metrics_port is not None:
+            serve_metrics(args.metrics_port)
+        _, _, completed = run_job(args.dsn, args.update_all, args.chunk_size, args.restart,
+                                  args.drift_report, args.risk_index, args.rollups)
+        write_metrics('scoring_job', args.metrics_output)
+        sys.exit(0 if completed else 1)
+
+    jobs = job_status(args.dsn)
+    print(jobs.to_string(index=False) if not jobs.empty else 'No scoring jobs')
+
+
+if __name__ == '__main__':
+    main()
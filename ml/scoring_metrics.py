@@ -0,0 +1,226 @@
+"""
+Runtime Metrics for BK Pulse Scoring
+In-process counters and latency histograms for the Python scoring layer.
+
+predict.py records into the module-level METRICS registry:
+  - requests and latency per scoring call (predict_churn / predict_frame) and model backend
+  - rows scored (model-scored vs decided by a business rule)
+  - artifact loads and load time
+  - prediction cache hits / misses
+  - SHAP explanations by source (computed, explanation store, global importances), SHAP time
+    and SHAP runs skipped or abandoned to meet a latency budget
+  - errors per backend and stage
+Recording is a dict lookup and a bisect per observation: a couple of
+microseconds per scoring call, and predict_frame records once per batch, not per
+row. Long-running modes serve the registry in Prometheus text format
+(serve_metrics); batch runs dump it as JSON when they finish (write_metrics).
+
+Usage:
+    python ml/distributed_scoring.py worker --queue /shared/run1 --metrics-port 9108   # GET :9108/metrics
+    python ml/batch_scoring.py customers.csv scores.csv     # -> data/monitoring/metrics/batch_scoring.json
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import threading
+from bisect import bisect_left
+from pathlib import Path
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BASE_DIR = Path(__file__).parent
+METRICS_DIR = BASE_DIR / '../data/monitoring/metrics'
+METRIC_PREFIX = 'bk_pulse_'
+# Seconds; covers single predictions (~ms) up to large batch chunks and SHAP
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    """Escape a Prometheus label value"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, values, extra=None):
+    """{name="value",...} (empty string when there are no labels)"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        """Add amount for one combination of label values"""
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def prometheus(self):
+        """Exposition lines"""
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+                for labels, value in sorted(self.values.items())]
+
+    def samples(self):
+        """Values as JSON-serializable dicts"""
+        return [{'labels': dict(zip(self.labelnames, labels)), 'value': value}
+                for labels, value in sorted(self.values.items())]
+
+
+class Histogram:
+    """Fixed-bucket histogram (per-bucket counts, cumulated when exported)"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}
+
+    def observe(self, value, *labels):
+        """Add one observation for one combination of label values"""
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def _cumulative(self, counts):
+        """Per-bucket counts as cumulative (le) counts"""
+        total, cumulative = 0, []
+        for count in counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+    def prometheus(self):
+        """Exposition lines (_bucket, _sum and _count series)"""
+        lines = []
+        for labels, (counts, total, count) in sorted(self.values.items()):
+            bounds = [repr(float(bound)) for bound in self.buckets] + ['+Inf']
+            for bound, cumulative in zip(bounds, self._cumulative(counts)):
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+    def samples(self):
+        """Values as JSON-serializable dicts"""
+        return [{'labels': dict(zip(self.labelnames, labels)),
+                 'buckets': dict(zip([str(bound) for bound in self.buckets] + ['+Inf'], self._cumulative(counts))),
+                 'sum': round(total, 6), 'count': count}
+                for labels, (counts, total, count) in sorted(self.values.items())]
+
+
+class ScoringMetrics:
+    """Registry of the scoring layer's metrics"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.requests = Counter(f'{METRIC_PREFIX}requests_total', 'Scoring calls', ('mode', 'backend'))
+        self.request_seconds = Histogram(f'{METRIC_PREFIX}request_seconds', 'Scoring call latency',
+                                         ('mode', 'backend'))
+        self.rows_scored = Counter(f'{METRIC_PREFIX}rows_scored_total', 'Customers scored',
+                                   ('backend', 'source'))
+        self.artifact_loads = Counter(f'{METRIC_PREFIX}artifact_loads_total', 'Model artifact loads', ('backend',))
+        self.artifact_load_seconds = Histogram(f'{METRIC_PREFIX}artifact_load_seconds', 'Model artifact load time',
+                                               ('backend',))
+        self.cache_requests = Counter(f'{METRIC_PREFIX}cache_requests_total', 'Prediction cache lookups',
+                                      ('result',))
+        self.shap_calls = Counter(f'{METRIC_PREFIX}shap_calls_total', 'SHAP explanations served',
+                                  ('backend', 'source'))
+        self.shap_seconds = Histogram(f'{METRIC_PREFIX}shap_seconds', 'SHAP computation time', ('backend',))
+        self.shap_deadline_misses = Counter(f'{METRIC_PREFIX}shap_deadline_misses_total',
+                                            'SHAP skipped or abandoned to meet a latency budget', ('backend',))
+        self.errors = Counter(f'{METRIC_PREFIX}errors_total', 'Errors', ('backend', 'stage'))
+        self.all = [self.requests, self.request_seconds, self.rows_scored, self.artifact_loads,
+                    self.artifact_load_seconds, self.cache_requests, self.shap_calls, self.shap_seconds,
+                    self.shap_deadline_misses, self.errors]
+
+    def record_request(self, mode, backend, started, model_rows=0, rule_rows=0):
+        """Count one scoring call that started at time.perf_counter() value `started`"""
+        self.requests.inc(mode, backend)
+        self.request_seconds.observe(time.perf_counter() - started, mode, backend)
+        if model_rows:
+            self.rows_scored.inc(backend, 'model', amount=model_rows)
+        if rule_rows:
+            self.rows_scored.inc(backend, 'rule', amount=rule_rows)
+
+    def prometheus(self):
+        """All metrics in Prometheus text exposition format"""
+        lines = []
+        for metric in self.all:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.prometheus())
+        lines.append(f"# HELP {METRIC_PREFIX}process_start_time_seconds Start time of the process")
+        lines.append(f"# TYPE {METRIC_PREFIX}process_start_time_seconds gauge")
+        lines.append(f"{METRIC_PREFIX}process_start_time_seconds {self.started_at}")
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self, role=None):
+        """All metrics as a JSON-serializable dict"""
+        return {
+            'generated_at': datetime.now().isoformat(),
+            'role': role,
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+            'uptime_seconds': round(time.time() - self.started_at, 3),
+            'metrics': {metric.name: {'type': metric.kind, 'help': metric.documentation,
+                                      'samples': metric.samples()} for metric in self.all},
+        }
+
+
+METRICS = ScoringMetrics()
+
+
+def backend_name(model):
+    """Backend label of a model (its estimator class, e.g. XGBClassifier)"""
+    return type(model).__name__
+
+
+def write_metrics(role, path=None):
+    """Dump the registry as JSON at the end of a batch run (data/monitoring/metrics/<role>.json by default)"""
+    path = Path(path) if path else METRICS_DIR / f"{role}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(METRICS.to_dict(role), f, indent=2)
+    print(f"Metrics -> {path}", file=sys.stderr)
+    return path
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """GET /metrics (Prometheus text) and /metrics.json"""
+
+    def do_GET(self):
+        if self.path.split('?')[0] == '/metrics':
+            body, content_type = METRICS.prometheus().encode(), 'text/plain; version=0.0.4; charset=utf-8'
+        elif self.path.split('?')[0] == '/metrics.json':
+            body, content_type = json.dumps(METRICS.to_dict()).encode(), 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port, host='0.0.0.0'):
+    """Serve the registry over HTTP from a background thread; returns the server"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving metrics on http://{host}:{server.server_port}/metrics", file=sys.stderr)
+    return server
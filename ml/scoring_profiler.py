@@ -0,0 +1,558 @@
+"""
+On-Demand Profiler for BK Pulse Scoring
+Profiles a running scoring process without redeploying it.
+
+Two modes:
+  - sample: a background thread samples the stacks of threads inside a scoring
+    call every SAMPLE_INTERVAL seconds for a bounded window (low overhead,
+    for long-running jobs)
+  - cprofile: cProfile for the next N scoring calls (exact, for one request)
+predict.py marks its scoring calls (predict_frame, predict_churn) and the
+stages inside them: feature building, scaling, predict_proba and SHAP. Helper
+threads started with in_scoring_call() (the SHAP worker under a latency budget)
+are profiled as part of the call that started them. Every stack is rooted at model=<version>;batch=<rows>;<stage>, so a flamegraph splits
+by model version, batch size and stage.
+
+Output goes to data/monitoring/profiles/:
+  <name>.collapsed   collapsed stacks ("frame;frame;frame count"), ready for
+                     flamegraph.pl / speedscope; cprofile stacks follow each
+                     function's heaviest caller and are weighted in microseconds
+  <name>.<stage>.prof  cProfile statistics per stage (cprofile mode; pstats / snakeviz)
+  <name>.json        summary: mode, model versions, batch sizes, time per stage
+
+Triggers:
+  - BK_PULSE_PROFILE=sample[:seconds] or cprofile[:requests] when the process starts
+    (the API server passes it on to every predict.py process)
+  - the start command below, which signals a running process (SIGUSR1)
+
+Usage:
+    BK_PULSE_PROFILE=cprofile python ml/predict.py < customer.json
+    python ml/scoring_profiler.py start 12345 --seconds 30              # sample PID 12345 for 30s
+    python ml/scoring_profiler.py start 12345 --mode cprofile --requests 1
+    python ml/scoring_profiler.py list
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import argparse
+import threading
+from pathlib import Path
+from functools import wraps
+from datetime import datetime
+
+BASE_DIR = Path(__file__).parent
+PROFILE_DIR = BASE_DIR / '../data/monitoring/profiles'
+PROFILE_ENV = 'BK_PULSE_PROFILE'
+DEFAULT_WINDOW_SECONDS = 30
+DEFAULT_REQUESTS = 1
+SAMPLE_INTERVAL = 0.005      # Seconds between stack samples
+MAX_STACK_DEPTH = 64         # Heaviest-caller chains in cprofile mode
+OTHER_STAGE = 'other'        # Time inside a scoring call but outside the marked stages
+
+_session = None              # Active profiling session, or None
+_pending = None              # (mode, amount) that starts a session at the next scoring call
+_lock = threading.RLock()    # Re-entrant: the signal handler may run while the main thread holds it
+
+
+def _frame_name(code):
+    """Collapsed-stack name of a code object: function (file:line)"""
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ',')
+
+
+def _tag(value):
+    """Frame-safe tag value"""
+    return str(value).replace(';', ',').replace(' ', '_')
+
+
+def _file_tag(value):
+    """Filename-safe tag value"""
+    return ''.join(c if c.isalnum() or c in '-_.' else '-' for c in str(value))
+
+
+class _Call:
+    """A scoring call in progress on one thread"""
+    __slots__ = ('version_source', 'model_version', 'batch_size', 'stage', 'started', 'stage_started', 'profiles',
+                 'helper_profiles', 'owner')
+
+    def __init__(self, version_source, batch_size):
+        self.version_source, self.model_version, self.batch_size = version_source, None, batch_size
+        self.stage = OTHER_STAGE
+        self.started = self.stage_started = time.perf_counter()
+        self.profiles = {}
+        self.helper_profiles = []    # (stage, cProfile.Profile) of helper threads
+        self.owner = threading.get_ident()
+
+    def version(self):
+        """Model version, resolved once the call has loaded its artifacts"""
+        if self.model_version is None:
+            self.model_version = self.version_source()
+        return self.model_version
+
+    def root(self, stage):
+        """Root frames of this call's stacks"""
+        return f"model={_tag(self.version())};batch={self.batch_size};{stage}"
+
+
+class _Session:
+    """State shared by both modes: calls in progress, stage timings and output"""
+    mode = None
+
+    def __init__(self):
+        self.calls = {}
+        self.stage_seconds = {}
+        self.batch_sizes = {}
+        self.model_versions = set()
+        self.requests = 0
+        self.started_at = datetime.now()
+
+    def begin(self, version_source, batch_size):
+        """Register a scoring call on this thread"""
+        call = _Call(version_source, batch_size)
+        self.calls[threading.get_ident()] = call
+        self.batch_sizes[batch_size] = self.batch_sizes.get(batch_size, 0) + 1
+        return call
+
+    def attach(self, call):
+        """Register this helper thread as part of a call running on another thread"""
+        self.calls[threading.get_ident()] = call
+
+    def detach(self):
+        """Unregister this helper thread"""
+        self.calls.pop(threading.get_ident(), None)
+
+    def end(self, call):
+        """Unregister a finished scoring call"""
+        self.calls.pop(threading.get_ident(), None)
+        self.model_versions.add(call.version())
+        self._add_stage_time(OTHER_STAGE, time.perf_counter() - call.started)
+        self.requests += 1
+
+    def enter_stage(self, name):
+        """Mark the start of a stage in this thread's call"""
+        call = self.calls.get(threading.get_ident())
+        if call is not None:
+            call.stage, call.stage_started = name, time.perf_counter()
+        return call
+
+    def exit_stage(self, name):
+        """Mark the end of a stage and account its time"""
+        call = self.calls.get(threading.get_ident())
+        if call is None or call.stage != name:
+            return None
+        elapsed = time.perf_counter() - call.stage_started
+        self._add_stage_time(name, elapsed)
+        # Stage time is reported on its own, not again as "other"
+        self._add_stage_time(OTHER_STAGE, -elapsed)
+        call.stage = OTHER_STAGE
+        return call
+
+    def _add_stage_time(self, name, seconds):
+        """Accumulate wall time per stage"""
+        self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + seconds
+
+    def output_name(self):
+        """Output file stem: time, pid, mode and model version(s)"""
+        versions = '+'.join(sorted(_file_tag(version) for version in self.model_versions)) or 'unknown'
+        return f"{self.started_at:%Y%m%d-%H%M%S}-{os.getpid()}-{self.mode}-{versions}"
+
+    def write(self, stacks, extra=None, profile_dir=None):
+        """Write the collapsed stacks and summary; returns the collapsed-stack path"""
+        profile_dir = Path(profile_dir or PROFILE_DIR)
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        name = self.output_name()
+        with open(profile_dir / f"{name}.collapsed", 'w') as f:
+            for stack, weight in sorted(stacks.items()):
+                if weight > 0:
+                    f.write(f"{stack} {weight}\n")
+        summary = {
+            'mode': self.mode,
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+            'started_at': self.started_at.isoformat(),
+            'finished_at': datetime.now().isoformat(),
+            'model_versions': sorted(str(version) for version in self.model_versions),
+            'batch_sizes': {str(size): count for size, count in sorted(self.batch_sizes.items())},
+            'requests': self.requests,
+            'stage_seconds': {stage: round(max(seconds, 0.0), 6) for stage, seconds in self.stage_seconds.items()},
+        }
+        summary.update(extra or {})
+        with open(profile_dir / f"{name}.json", 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"Profile -> {profile_dir / name}.collapsed", file=sys.stderr)
+        return profile_dir / f"{name}.collapsed"
+
+
+class SamplingSession(_Session):
+    """Sample the stacks of threads inside scoring calls for a bounded window"""
+    mode = 'sample'
+
+    def __init__(self, seconds=DEFAULT_WINDOW_SECONDS, interval=SAMPLE_INTERVAL):
+        super().__init__()
+        self.seconds, self.interval = seconds, interval
+        self.stacks = {}
+        self.samples = 0
+        self.thread = threading.Thread(target=self._run, name='scoring-profiler', daemon=True)
+
+    def start(self):
+        """Start the sampling thread"""
+        self.thread.start()
+        print(f"Profiling scoring calls for {self.seconds}s (sampling every {self.interval * 1000:.0f}ms)",
+              file=sys.stderr)
+        return self
+
+    def _sample(self):
+        """Record one stack per thread inside a scoring call"""
+        frames = sys._current_frames()
+        for thread_id, call in list(self.calls.items()):
+            frame = frames.get(thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            stack = call.root(call.stage) + ';' + ';'.join(reversed(names))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.samples += 1
+
+    def _run(self):
+        """Sample until the window closes, then write the profile"""
+        deadline = time.monotonic() + self.seconds
+        while time.monotonic() < deadline:
+            self._sample()
+            time.sleep(self.interval)
+        _finish(self)
+        self.write(self.stacks, {'window_seconds': self.seconds, 'interval_seconds': self.interval,
+                                 'samples': self.samples})
+
+
+class CProfileSession(_Session):
+    """cProfile every stage of the next N scoring calls"""
+    mode = 'cprofile'
+
+    def __init__(self, requests=DEFAULT_REQUESTS):
+        super().__init__()
+        self.remaining = requests
+        self.profiles = []       # (root frames, stage, cProfile.Profile) of finished calls
+        self.active = None
+        self.helpers = {}        # Thread id -> cProfile.Profile of a helper thread's current stage
+
+    def start(self):
+        """Report the session (profiling starts with the next scoring call)"""
+        print(f"Profiling the next {self.remaining} scoring call(s) with cProfile", file=sys.stderr)
+        return self
+
+    def begin(self, version_source, batch_size):
+        call = super().begin(version_source, batch_size)
+        self._switch(call, OTHER_STAGE)
+        return call
+
+    def end(self, call):
+        self._stop()
+        super().end(call)
+        self.profiles.extend((call.root(stage), stage, profile) for stage, profile in call.profiles.items())
+        self.profiles.extend((call.root(stage), stage, profile) for stage, profile in call.helper_profiles)
+        self.remaining -= 1
+        if self.remaining <= 0:
+            _finish(self)
+            self.close()
+
+    def enter_stage(self, name):
+        call = super().enter_stage(name)
+        if call is not None and call.owner == threading.get_ident():
+            self._switch(call, name)
+        elif call is not None:
+            self._enable_helper(call, name)
+        return call
+
+    def exit_stage(self, name):
+        call = super().exit_stage(name)
+        if call is not None and call.owner == threading.get_ident():
+            self._switch(call, OTHER_STAGE)
+        elif call is not None:
+            profile = self.helpers.pop(threading.get_ident(), None)
+            if profile is not None:
+                profile.disable()
+        return call
+
+    def _enable_helper(self, call, stage):
+        """Profile a helper thread's stage with its own profiler (only its stages are profiled)"""
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Only one profiler can be active at a time on some Python versions: stage time only
+            return
+        self.helpers[threading.get_ident()] = profile
+        call.helper_profiles.append((stage, profile))
+
+    def _switch(self, call, stage):
+        """Profile the rest of this call under another stage's profiler"""
+        import cProfile
+        self._stop()
+        profile = call.profiles.get(stage)
+        if profile is None:
+            profile = call.profiles[stage] = cProfile.Profile()
+        profile.enable()
+        self.active = profile
+
+    def _stop(self):
+        """Pause the running stage profiler"""
+        if self.active is not None:
+            self.active.disable()
+            self.active = None
+
+    def close(self):
+        """Write one .prof file per stage and heaviest-caller collapsed stacks"""
+        import pstats
+        self._stop()
+        name = self.output_name()
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        stacks, stage_files = {}, []
+        for stage in sorted({stage for _, stage, _ in self.profiles}):
+            profiles = [profile for _, profile_stage, profile in self.profiles if profile_stage == stage]
+            pstats.Stats(*profiles).dump_stats(PROFILE_DIR / f"{name}.{stage}.prof")
+            stage_files.append(f"{name}.{stage}.prof")
+        for root, _, profile in self.profiles:
+            for stack, weight in _collapse_stats(pstats.Stats(profile).stats).items():
+                key = root + ';' + stack
+                stacks[key] = stacks.get(key, 0) + weight
+        self.write(stacks, {'stage_profiles': stage_files})
+
+
+def _collapse_stats(stats):
+    """Approximate collapsed stacks from cProfile stats: own time along each function's heaviest caller chain"""
+    def label(func):
+        filename, line, function = func
+        return f"{function} ({os.path.basename(filename)}:{line})".replace(';', ',')
+
+    heaviest = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        if callers:
+            # callers: {caller: (call count, primitive calls, own time, cumulative time)}
+            heaviest[func] = max(callers.items(), key=lambda item: item[1][3])[0]
+
+    stacks = {}
+    for func, (_, _, own_time, _, _) in stats.items():
+        weight = int(round(own_time * 1e6))
+        if weight <= 0:
+            continue
+        chain, seen, current = [func], {func}, func
+        while current in heaviest and len(chain) < MAX_STACK_DEPTH:
+            current = heaviest[current]
+            if current in seen:
+                break
+            seen.add(current)
+            chain.append(current)
+        stack = ';'.join(label(item) for item in reversed(chain))
+        stacks[stack] = stacks.get(stack, 0) + weight
+    return stacks
+
+
+def _finish(session):
+    """Detach a session so new scoring calls are no longer profiled"""
+    global _session
+    with _lock:
+        if _session is session:
+            _session = None
+
+
+def parse_trigger(value):
+    """(mode, amount) from a trigger such as "sample:30" or "cprofile" (None when empty or invalid)"""
+    if not value:
+        return None
+    mode, _, amount = value.strip().lower().partition(':')
+    if mode not in ('sample', 'cprofile'):
+        print(f"Warning: Unknown {PROFILE_ENV} value {value!r} (expected sample[:seconds] or cprofile[:requests])",
+              file=sys.stderr)
+        return None
+    default = DEFAULT_WINDOW_SECONDS if mode == 'sample' else DEFAULT_REQUESTS
+    try:
+        amount = float(amount) if amount else default
+    except ValueError:
+        amount = default
+    return mode, amount
+
+
+def start_profiling(mode='sample', amount=None):
+    """Start a session now (sample: window seconds, cprofile: number of calls); returns it"""
+    global _session
+    with _lock:
+        if _session is not None:
+            print("Profiler already running", file=sys.stderr)
+            return _session
+        if mode == 'cprofile':
+            _session = CProfileSession(int(amount or DEFAULT_REQUESTS)).start()
+        else:
+            _session = SamplingSession(float(amount or DEFAULT_WINDOW_SECONDS)).start()
+        return _session
+
+
+def _start_pending():
+    """Start the session requested by the environment or a signal"""
+    global _pending
+    with _lock:
+        pending, _pending = _pending, None
+    if pending is not None:
+        start_profiling(*pending)
+
+
+def profiled_call(model_version, batch_size=None):
+    """Decorator marking a scoring call; batch_size defaults to len() of the first argument
+
+    model_version is a callable, only called while profiling (and once the call has loaded its model).
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if _pending is not None:
+                _start_pending()
+            session = _session
+            # Not profiling, or a scoring call nested inside another one
+            if session is None or threading.get_ident() in session.calls:
+                return function(*args, **kwargs)
+            size = batch_size if batch_size is not None else len(args[0])
+            call = session.begin(model_version, size)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                session.end(call)
+        return wrapper
+    return decorator
+
+
+def in_scoring_call(target):
+    """Wrap a helper thread's target so it is profiled as part of this thread's scoring call
+    (returned unchanged when not profiling)"""
+    session = _session
+    call = session.calls.get(threading.get_ident()) if session is not None else None
+    if call is None:
+        return target
+
+    @wraps(target)
+    def attached(*args, **kwargs):
+        session.attach(call)
+        try:
+            return target(*args, **kwargs)
+        finally:
+            session.detach()
+    return attached
+
+
+class _Stage:
+    """Context manager marking a stage of a scoring call (a no-op unless profiling)"""
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        session = _session
+        if session is not None:
+            session.enter_stage(self.name)
+        return self
+
+    def __exit__(self, *exc_info):
+        session = _session
+        if session is not None:
+            session.exit_stage(self.name)
+        return False
+
+
+_STAGES = {}
+
+
+def profile_stage(name):
+    """Stage marker for `with profile_stage('features'):` (reused, so free when idle)"""
+    stage = _STAGES.get(name)
+    if stage is None:
+        stage = _STAGES[name] = _Stage(name)
+    return stage
+
+
+def request_file(pid, profile_dir=None):
+    """Where the start command leaves the requested mode for a process"""
+    return Path(profile_dir or PROFILE_DIR) / f"request-{pid}.json"
+
+
+def _handle_signal(signum, frame):
+    """SIGUSR1: start the session the start command asked for (default: a sampling window)"""
+    global _pending
+    path = request_file(os.getpid())
+    mode, amount = 'sample', DEFAULT_WINDOW_SECONDS
+    try:
+        with open(path, 'r') as f:
+            request = json.load(f)
+        mode, amount = request.get('mode', mode), request.get('amount', amount)
+        path.unlink()
+    except (OSError, ValueError):
+        pass
+    if mode == 'sample':
+        start_profiling(mode, amount)
+    else:
+        # Started from the next scoring call, so the whole call is profiled
+        _pending = (mode, amount)
+
+
+def install_signal_handler():
+    """Let the start command profile this process (SIGUSR1; not available on Windows)"""
+    if hasattr(signal, 'SIGUSR1') and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, _handle_signal)
+
+
+def request_profile(pid, mode='sample', amount=None):
+    """Ask a running scoring process to profile itself"""
+    path = request_file(pid)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({'mode': mode, 'amount': amount}, f)
+    try:
+        os.kill(pid, signal.SIGUSR1)
+    except OSError:
+        path.unlink()
+        raise
+
+
+_pending = parse_trigger(os.environ.get(PROFILE_ENV))
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Profile a running scoring process')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    start = subparsers.add_parser('start', help='Profile a running batch_scoring / score_database / '
+                                                'scoring_job / distributed worker process')
+    start.add_argument('pid', type=int)
+    start.add_argument('--mode', choices=['sample', 'cprofile'], default='sample')
+    start.add_argument('--seconds', type=float, default=DEFAULT_WINDOW_SECONDS, help='Sampling window')
+    start.add_argument('--requests', type=int, default=DEFAULT_REQUESTS, help='Scoring calls to cProfile')
+
+    subparsers.add_parser('list', help='List the written profiles')
+    args = parser.parse_args()
+
+    if args.command == 'start':
+        try:
+            request_profile(args.pid, args.mode, args.seconds if args.mode == 'sample' else args.requests)
+        except OSError as e:
+            print(f"Could not signal process {args.pid}: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(f"Requested a {args.mode} profile from process {args.pid}; output in {PROFILE_DIR.resolve()}")
+        return
+
+    for path in sorted(PROFILE_DIR.glob('*.json')):
+        if path.name.startswith('request-'):
+            continue
+        with open(path, 'r') as f:
+            summary = json.load(f)
+        stages = ', '.join(f"{stage} {seconds:.3f}s" for stage, seconds in summary['stage_seconds'].items())
+        print(f"{path.stem}  {summary['requests']} call(s)  {stages}")
+
+
+if __name__ == '__main__':
+    main()
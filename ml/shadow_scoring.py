@@ -0,0 +1,272 @@
+"""
+Shadow / Challenger Scoring for BK Pulse Churn Prediction
+Scores live traffic with challenger models next to the production model,
+without changing what is returned.
+
+predict_frame() builds and scales the feature matrix once and scores it with
+the production model (load_artifacts()). When a ShadowScorer is passed in, the
+scaled matrix and the production probabilities are queued for a background
+thread, which scores them with every challenger (the other model artifacts, or
+any .pkl trained on the same scaler) and accumulates per-model statistics:
+  - mean probability, next to production's
+  - churn_prediction and risk_level agreement with production (and the
+    production x challenger risk-level matrix)
+  - mean / max absolute probability difference and correlation
+  - challenger scoring time
+Feature building and scaling dominate scoring time, so challengers cost a
+fraction of a duplicate run. If the challengers fall behind, whole chunks are
+skipped (counted as dropped_rows) rather than slowing production down.
+Per-customer probabilities can also be logged to a CSV.
+
+Usage:
+    python ml/batch_scoring.py customers.csv scores.csv --shadow                 # all other artifacts
+    python ml/score_database.py --shadow lightgbm,random_forest --shadow-log shadow.csv
+    python ml/shadow_scoring.py report
+"""
+
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+from pathlib import Path
+from datetime import datetime
+
+import numpy as np
+import joblib
+
+import predict
+from predict import get_model_version, loaded_model
+from resource_governor import configure_estimator
+
+BASE_DIR = Path(__file__).parent
+SHADOW_REPORT_PATH = BASE_DIR / '../data/monitoring/shadow_report.json'
+QUEUE_SIZE = 8               # Chunks waiting for the challengers; further chunks are dropped
+RISK_LEVELS = ['low', 'medium', 'high']
+# Challenger names for the artifacts of load_artifacts()'s fallback chain
+MODEL_CANDIDATES = {
+    'xgboost': 'XGBOOST_MODEL_PATH',
+    'lightgbm': 'LIGHTGBM_MODEL_PATH',
+    'gradient_boosting': 'GRADIENT_BOOSTING_MODEL_PATH',
+    'random_forest': 'RANDOM_FOREST_MODEL_PATH',
+}
+
+
+def risk_codes(probability):
+    """Index into RISK_LEVELS (same thresholds as predict.risk_levels)"""
+    return (probability > 0.4).astype(np.int64) + (probability > 0.7)
+
+
+def candidate_paths():
+    """{name: resolved path} of the model artifacts load_artifacts() can serve"""
+    # Read from the predict module at call time so overridden paths are honoured
+    return {name: getattr(predict, attribute).resolve() for name, attribute in MODEL_CANDIDATES.items()}
+
+
+def load_challengers(models='all'):
+    """Load challenger models: 'all' (every other artifact) or comma-separated names / .pkl paths"""
+    production_path = Path(loaded_model()['path']).resolve()
+    candidates = candidate_paths()
+
+    every_model = models in (None, '', 'all')
+    requested = list(candidates) if every_model else [item.strip() for item in models.split(',') if item.strip()]
+
+    challengers = []
+    for item in requested:
+        path = candidates.get(item, Path(item).resolve())
+        name = item if item in candidates else path.stem
+        if path == production_path or not path.exists():
+            # With 'all', the production model and missing artifacts are skipped silently
+            if not every_model:
+                print(f"Warning: Skipping challenger {item} ({'production model' if path.exists() else 'not found'})",
+                      file=sys.stderr)
+            continue
+        try:
+            model = joblib.load(path)
+        except Exception as e:
+            print(f"Warning: Could not load challenger {name}: {e}", file=sys.stderr)
+            continue
+        if not hasattr(model, 'predict_proba'):
+            print(f"Warning: Challenger {name} has no predict_proba", file=sys.stderr)
+            continue
+        challengers.append({'name': name, 'path': str(path), 'version': get_model_version(path),
+                            'model': configure_estimator(model)})
+    return challengers
+
+
+class Agreement:
+    """Running comparison of one challenger with production"""
+
+    def __init__(self):
+        self.rows = 0
+        self.sums = np.zeros(5)          # production, challenger, production^2, challenger^2, product
+        self.abs_difference = 0.0
+        self.max_abs_difference = 0.0
+        self.prediction_agreement = 0
+        self.risk_matrix = np.zeros((len(RISK_LEVELS), len(RISK_LEVELS)), dtype=np.int64)
+        self.seconds = 0.0
+
+    def update(self, production, challenger, seconds):
+        """Add one chunk of production and challenger probabilities"""
+        self.rows += len(production)
+        self.sums += [production.sum(), challenger.sum(), (production ** 2).sum(), (challenger ** 2).sum(),
+                      (production * challenger).sum()]
+        difference = np.abs(production - challenger)
+        self.abs_difference += difference.sum()
+        self.max_abs_difference = max(self.max_abs_difference, float(difference.max(initial=0.0)))
+        self.prediction_agreement += int(((production > 0.5) == (challenger > 0.5)).sum())
+        pairs = risk_codes(production) * len(RISK_LEVELS) + risk_codes(challenger)
+        self.risk_matrix += np.bincount(pairs, minlength=self.risk_matrix.size).reshape(self.risk_matrix.shape)
+        self.seconds += seconds
+
+    def summary(self):
+        """Agreement statistics as a JSON-serializable dict"""
+        n = self.rows
+        if n == 0:
+            return {'rows': 0}
+        sum_p, sum_c, sum_p2, sum_c2, sum_pc = self.sums
+        covariance = sum_pc / n - (sum_p / n) * (sum_c / n)
+        variance = (sum_p2 / n - (sum_p / n) ** 2) * (sum_c2 / n - (sum_c / n) ** 2)
+        return {
+            'rows': n,
+            'production_mean_probability': round(sum_p / n, 6),
+            'mean_probability': round(sum_c / n, 6),
+            'prediction_agreement': round(self.prediction_agreement / n, 6),
+            'risk_level_agreement': round(np.trace(self.risk_matrix) / n, 6),
+            'risk_level_matrix': {
+                production_level: dict(zip(RISK_LEVELS, self.risk_matrix[i].tolist()))
+                for i, production_level in enumerate(RISK_LEVELS)
+            },
+            'mean_abs_difference': round(self.abs_difference / n, 6),
+            'max_abs_difference': round(self.max_abs_difference, 6),
+            'correlation': round(covariance / np.sqrt(variance), 6) if variance > 0 else None,
+            'seconds': round(self.seconds, 3),
+            'ms_per_1k_rows': round(self.seconds / n * 1e6, 3),
+        }
+
+
+class ShadowScorer:
+    """Scores queued production chunks with the challengers on a background thread"""
+
+    def __init__(self, challengers, log_path=None, queue_size=QUEUE_SIZE):
+        self.challengers = challengers
+        self.production = {'name': loaded_model()['name'], 'version': get_model_version()}
+        self.agreement = {challenger['name']: Agreement() for challenger in challengers}
+        self.log_path = Path(log_path) if log_path else None
+        self.rows = self.dropped_rows = 0
+        self.started_at = datetime.now()
+        self._log_header = True
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name='shadow-scoring', daemon=True)
+        self._thread.start()
+
+    def submit(self, features_scaled, production_probability, customers=None):
+        """Queue one scored chunk for the challengers (never blocks; drops the chunk if the queue is full)"""
+        if not self.challengers:
+            return
+        try:
+            self._queue.put_nowait((features_scaled, np.asarray(production_probability, dtype=float), customers))
+        except queue.Full:
+            self.dropped_rows += len(production_probability)
+
+    def _run(self):
+        """Background thread: score queued chunks until close()"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                self._score(*item)
+            except Exception as e:
+                print(f"Warning: Shadow scoring failed for a chunk: {e}", file=sys.stderr)
+
+    def _score(self, features_scaled, production, customers):
+        """Score one chunk with every challenger and update the statistics (and the log)"""
+        columns = {'production': production}
+        for challenger in self.challengers:
+            started = time.perf_counter()
+            probability = challenger['model'].predict_proba(features_scaled)[:, 1]
+            self.agreement[challenger['name']].update(production, probability, time.perf_counter() - started)
+            columns[challenger['name']] = probability
+        self.rows += len(production)
+
+        if self.log_path is not None:
+            import pandas as pd
+            from batch_scoring import resolve_customer_ids
+            log = pd.DataFrame(columns)
+            if customers is not None:
+                log.insert(0, 'customer_id', resolve_customer_ids(customers).to_numpy())
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+            log.round(6).to_csv(self.log_path, mode='w' if self._log_header else 'a', header=self._log_header,
+                                index=False)
+            self._log_header = False
+
+    def report(self):
+        """Per-challenger comparison with production"""
+        return {
+            'generated_at': datetime.now().isoformat(),
+            'started_at': self.started_at.isoformat(),
+            'production': self.production,
+            'rows': self.rows,
+            'dropped_rows': self.dropped_rows,
+            'challengers': {
+                challenger['name']: dict(version=challenger['version'], **self.agreement[challenger['name']].summary())
+                for challenger in self.challengers
+            },
+        }
+
+    def close(self, report_path=SHADOW_REPORT_PATH):
+        """Wait for the queued chunks, then write and return the report"""
+        self._queue.put(None)
+        self._thread.join()
+        report = self.report()
+        if report_path:
+            report_path = Path(report_path)
+            report_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(report_path, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"Shadow scoring report ({len(self.challengers)} challengers, {self.rows:,} rows) -> {report_path}",
+                  file=sys.stderr)
+        return report
+
+
+def start_shadow(models='all', log_path=None):
+    """Load the challengers and start a ShadowScorer (None when there are no challengers)"""
+    challengers = load_challengers(models)
+    if not challengers:
+        print("Warning: No challenger models to shadow-score", file=sys.stderr)
+        return None
+    print(f"Shadow scoring with {', '.join(challenger['name'] for challenger in challengers)}", file=sys.stderr)
+    return ShadowScorer(challengers, log_path)
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Challenger models scored next to production')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    report = subparsers.add_parser('report', help='Print the last shadow scoring report')
+    report.add_argument('--path', default=str(SHADOW_REPORT_PATH))
+    subparsers.add_parser('challengers', help='List the challenger models that would be loaded')
+    args = parser.parse_args()
+
+    if args.command == 'challengers':
+        for challenger in load_challengers():
+            print(f"{challenger['name']}  {challenger['version']}  {challenger['path']}")
+        return
+
+    with open(args.path, 'r') as f:
+        report = json.load(f)
+    print(f"Production: {report['production']['name']} ({report['production']['version']}), "
+          f"{report['rows']:,} rows, {report['dropped_rows']:,} dropped")
+    for name, stats in report['challengers'].items():
+        if not stats['rows']:
+            print(f"  {name}: no rows")
+            continue
+        print(f"  {name}: agreement {stats['prediction_agreement']:.1%} (risk level {stats['risk_level_agreement']:.1%}), "
+              f"mean |diff| {stats['mean_abs_difference']:.4f}, correlation {stats['correlation']}, "
+              f"{stats['ms_per_1k_rows']} ms/1k rows")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,546 @@
+"""
+Streaming EDA Engine for BK Pulse Churn Dataset
+Computes the statistics of explore_data.py in one chunked pass over the raw CSV
+using mergeable accumulators, so memory stays bounded by the chunk size:
+  - row counts, missing-value counts and the churn distribution
+  - mean / variance / min / max per numerical column (Chan's parallel update)
+  - histograms on a power-of-two bin grid that coarsens as the range grows
+  - counts and churn rates per category
+  - the pairwise-complete correlation matrix
+
+Each chunk is summarized independently and summaries are merged, so chunks can
+be summarized in parallel. Plots are rendered from the merged summary in
+parallel worker processes. An optional sample fraction summarizes a random
+subset of every chunk.
+"""
+
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # Figures are rendered in worker processes without a display
+import matplotlib.pyplot as plt
+import seaborn as sns
+from joblib import Parallel, delayed
+
+from predict import clean_numeric_series
+
+DEFAULT_CHUNK_SIZE = 100000
+HISTOGRAM_BINS = 50
+PLOT_DPI = 300
+
+CATEGORICAL_COLS = ['Customer_Segment', 'Gender', 'Nationality', 'Account_Type',
+                    'Branch', 'Currency', 'Account_Status']
+NUMERICAL_COLS = ['Age', 'Tenure_Months', 'Num_Products', 'Balance',
+                  'Transaction_Frequency', 'Mobile_Banking_Usage', 'Branch_Visits',
+                  'Complaint_History', 'Account_Age_Months', 'Days_Since_Last_Transaction']
+CORRELATION_COLS = NUMERICAL_COLS + ['Churn_Flag']
+HEATMAP_COLS = ['Age', 'Tenure_Months', 'Num_Products', 'Balance', 'Transaction_Frequency', 'Churn_Flag']
+
+
+class StreamingMoments:
+    """Count, mean, sum of squared deviations, min and max per column"""
+
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self, n_columns):
+        self.count = np.zeros(n_columns)
+        self.mean = np.zeros(n_columns)
+        self.m2 = np.zeros(n_columns)
+        self.min = np.full(n_columns, np.inf)
+        self.max = np.full(n_columns, -np.inf)
+
+    def update(self, values):
+        """Add a (rows, columns) float array; NaN values are ignored"""
+        other = StreamingMoments(values.shape[1])
+        other.count = np.sum(~np.isnan(values), axis=0).astype(float)
+        present = other.count > 0
+        if present.any():
+            other.mean[present] = np.nanmean(values[:, present], axis=0)
+            other.m2[present] = np.nansum((values[:, present] - other.mean[present]) ** 2, axis=0)
+            other.min[present] = np.nanmin(values[:, present], axis=0)
+            other.max[present] = np.nanmax(values[:, present], axis=0)
+        self.merge(other)
+
+    def merge(self, other):
+        """Combine with another accumulator over the same columns"""
+        total = self.count + other.count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = other.mean - self.mean
+            self.mean = np.where(total > 0, self.mean + delta * other.count / total, 0.0)
+            self.m2 = np.where(total > 0, self.m2 + other.m2 + delta ** 2 * self.count * other.count / total, 0.0)
+        self.count = total
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+
+    def std(self):
+        """Sample standard deviation (ddof=1, as pandas describe)"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 1, np.sqrt(self.m2 / (self.count - 1)), np.nan)
+
+
+class StreamingHistogram:
+    """Histogram on bins [k * 2**exponent, (k + 1) * 2**exponent)
+
+    The bin width doubles (merging neighbouring bins) whenever the observed range
+    needs more than max_bins bins, so histograms over any data merge exactly.
+    """
+
+    __slots__ = ('max_bins', 'exponent', 'start', 'counts')
+
+    def __init__(self, max_bins=HISTOGRAM_BINS):
+        self.max_bins = max_bins
+        self.exponent = None
+        self.start = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    @staticmethod
+    def _coarsen(start, counts, steps):
+        """Re-bin counts after doubling the bin width `steps` times"""
+        for _ in range(steps):
+            index = np.arange(start, start + len(counts)) // 2
+            start = start // 2
+            if len(counts):
+                counts = np.bincount(index - start, weights=counts).astype(np.int64)
+        return start, counts
+
+    def _fit_exponent(self, low, high, exponent):
+        """Smallest exponent >= exponent at which [low, high] spans at most max_bins bins"""
+        while np.floor(high / 2.0 ** exponent) - np.floor(low / 2.0 ** exponent) >= self.max_bins:
+            exponent += 1
+        return exponent
+
+    def _add(self, exponent, start, counts):
+        """Add counts binned at `exponent` to this histogram"""
+        if self.exponent is None:
+            self.exponent, self.start, self.counts = exponent, start, counts
+            return
+        target = max(self.exponent, exponent)
+        while True:
+            self.start, self.counts = self._coarsen(self.start, self.counts, target - self.exponent)
+            start, counts = self._coarsen(start, counts, target - exponent)
+            self.exponent = exponent = target
+            low = min(self.start, start)
+            high = max(self.start + len(self.counts), start + len(counts))
+            if high - low <= self.max_bins:
+                break
+            target += 1
+        merged = np.zeros(high - low, dtype=np.int64)
+        merged[self.start - low:self.start - low + len(self.counts)] += self.counts
+        merged[start - low:start - low + len(counts)] += counts
+        self.start, self.counts = low, merged
+
+    def update(self, values):
+        """Add an array of values (NaN / inf are ignored)"""
+        values = values[np.isfinite(values)]
+        if not len(values):
+            return
+        low, high = values.min(), values.max()
+        if self.exponent is None:
+            exponent = int(np.ceil(np.log2((high - low) / self.max_bins))) if high > low else 0
+        else:
+            exponent = self.exponent
+        exponent = self._fit_exponent(low, high, exponent)
+        index = np.floor(values / 2.0 ** exponent).astype(np.int64)
+        start = int(index.min())
+        self._add(exponent, start, np.bincount(index - start).astype(np.int64))
+
+    def merge(self, other):
+        """Combine with another histogram"""
+        if other.exponent is not None:
+            self._add(other.exponent, other.start, other.counts.copy())
+
+    def edges(self):
+        """Bin edges matching counts"""
+        if self.exponent is None:
+            return np.zeros(1)
+        return np.arange(self.start, self.start + len(self.counts) + 1) * 2.0 ** self.exponent
+
+    def quantile(self, q):
+        """Approximate quantile, interpolated within the bin that contains it"""
+        total = self.counts.sum()
+        if total == 0:
+            return np.nan
+        edges = self.edges()
+        cumulative = np.cumsum(self.counts)
+        position = np.searchsorted(cumulative, q * total)
+        before = cumulative[position - 1] if position > 0 else 0
+        fraction = (q * total - before) / self.counts[position] if self.counts[position] else 0.0
+        return edges[position] + fraction * (edges[position + 1] - edges[position])
+
+
+class CorrelationAccumulator:
+    """Pairwise-complete sums for a correlation matrix (as DataFrame.corr)
+
+    Values are shifted by a fixed per-column reference before summing to keep
+    the sums of squares numerically stable; merged accumulators share the shift.
+    """
+
+    __slots__ = ('columns', 'shift', 'n', 'sums', 'sum_squares', 'cross')
+
+    def __init__(self, columns, shift):
+        size = len(columns)
+        self.columns = list(columns)
+        self.shift = np.asarray(shift, dtype=float)
+        self.n = np.zeros((size, size))
+        self.sums = np.zeros((size, size))         # sums[i, j]: sum of x_i where x_i and x_j are present
+        self.sum_squares = np.zeros((size, size))
+        self.cross = np.zeros((size, size))
+
+    def update(self, values):
+        """Add a (rows, columns) float array; NaN values are ignored pairwise"""
+        values = values - self.shift
+        present = ~np.isnan(values)
+        filled = np.where(present, values, 0.0)
+        weights = present.astype(float)
+        self.n += weights.T @ weights
+        self.sums += filled.T @ weights
+        self.sum_squares += (filled * filled).T @ weights
+        self.cross += filled.T @ filled
+
+    def merge(self, other):
+        """Combine with another accumulator (same columns and shift)"""
+        self.n += other.n
+        self.sums += other.sums
+        self.sum_squares += other.sum_squares
+        self.cross += other.cross
+
+    def correlation(self):
+        """Correlation matrix as a DataFrame"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            covariance = self.n * self.cross - self.sums * self.sums.T
+            variance = self.n * self.sum_squares - self.sums ** 2
+            corr = covariance / np.sqrt(variance * variance.T)
+        return pd.DataFrame(np.clip(corr, -1, 1), index=self.columns, columns=self.columns)
+
+
+def add_counts(total, counts):
+    """Add two count tables (Series/DataFrames) aligned on their labels"""
+    if total is None or total.empty:
+        return counts
+    if counts.empty:
+        return total
+    return total.add(counts, fill_value=0)
+
+
+class EDASummary:
+    """All mergeable accumulators for one pass over the dataset"""
+
+    __slots__ = ('rows', 'columns', 'missing', 'churn_counts', 'moments', 'histograms',
+                 'categories', 'age_by_churn', 'correlation')
+
+    def __init__(self, shift):
+        self.rows = 0
+        self.columns = []
+        self.missing = pd.Series(dtype='int64')
+        self.churn_counts = pd.Series(dtype='int64')
+        self.moments = StreamingMoments(len(NUMERICAL_COLS))
+        self.histograms = {col: StreamingHistogram() for col in NUMERICAL_COLS}
+        self.categories = {}
+        self.age_by_churn = pd.DataFrame(dtype='int64')
+        self.correlation = CorrelationAccumulator(CORRELATION_COLS, shift)
+
+    def update(self, chunk):
+        """Accumulate one chunk of (column-normalized) raw rows"""
+        self.rows += len(chunk)
+        self.columns = self.columns or list(chunk.columns)
+        self.missing = self.missing.add(chunk.isna().sum(), fill_value=0).astype('int64')
+
+        churn = chunk['Churn_Flag']
+        self.churn_counts = self.churn_counts.add(churn.value_counts(), fill_value=0).astype('int64')
+
+        numeric = numeric_frame(chunk)
+        values = numeric[NUMERICAL_COLS].to_numpy(dtype=float)
+        self.moments.update(values)
+        for i, col in enumerate(NUMERICAL_COLS):
+            self.histograms[col].update(values[:, i])
+        self.correlation.update(numeric[CORRELATION_COLS].to_numpy(dtype=float))
+
+        for col in CATEGORICAL_COLS:
+            if col in chunk.columns:
+                stats = churn.groupby(chunk[col]).agg(['count', 'sum'])
+                self.categories[col] = add_counts(self.categories.get(col), stats)
+        self.age_by_churn = add_counts(self.age_by_churn, pd.crosstab(numeric['Age'], churn))
+
+    def merge(self, other):
+        """Combine with the summary of other chunks"""
+        self.rows += other.rows
+        self.columns = self.columns or other.columns
+        self.missing = self.missing.add(other.missing, fill_value=0).astype('int64')
+        self.churn_counts = self.churn_counts.add(other.churn_counts, fill_value=0).astype('int64')
+        self.moments.merge(other.moments)
+        for col in NUMERICAL_COLS:
+            self.histograms[col].merge(other.histograms[col])
+        self.correlation.merge(other.correlation)
+        for col, stats in other.categories.items():
+            self.categories[col] = add_counts(self.categories.get(col), stats)
+        self.age_by_churn = add_counts(self.age_by_churn, other.age_by_churn)
+        return self
+
+
+def normalize_columns(chunk):
+    """Strip padded column names such as ' Balance '"""
+    return chunk.rename(columns=lambda col: col.strip())
+
+
+def numeric_frame(chunk):
+    """Numerical columns as floats, with Balance cleaned as in explore_data.clean_balance"""
+    numeric = pd.DataFrame(index=chunk.index)
+    for col in CORRELATION_COLS:
+        if col == 'Balance':
+            numeric[col] = clean_numeric_series(chunk[col]) if col in chunk.columns else 0.0
+        else:
+            numeric[col] = pd.to_numeric(chunk[col], errors='coerce') if col in chunk.columns else np.nan
+    return numeric
+
+
+def summarize_chunk(chunk, shift):
+    """Summary of a single chunk"""
+    summary = EDASummary(shift)
+    summary.update(chunk)
+    return summary
+
+
+def iter_chunks(data_path, chunk_size=DEFAULT_CHUNK_SIZE, sample_fraction=None, seed=42):
+    """Read the raw CSV in chunks, optionally keeping a random sample of each chunk"""
+    for chunk_number, chunk in enumerate(pd.read_csv(data_path, chunksize=chunk_size, low_memory=False)):
+        chunk = normalize_columns(chunk)
+        if sample_fraction is not None and sample_fraction < 1:
+            chunk = chunk.sample(frac=sample_fraction, random_state=seed + chunk_number)
+        yield chunk
+
+
+def streaming_summary(data_path, chunk_size=DEFAULT_CHUNK_SIZE, sample_fraction=None, n_jobs=1):
+    """Summarize the dataset in one chunked pass (chunks summarized on n_jobs workers)"""
+    chunks = iter_chunks(data_path, chunk_size, sample_fraction)
+    first = next(chunks)
+    # The first chunk's means are the shift for the correlation sums
+    shift = np.nan_to_num(numeric_frame(first)[CORRELATION_COLS].mean().to_numpy(dtype=float))
+
+    summary = summarize_chunk(first, shift)
+    if n_jobs == 1:
+        for chunk in chunks:
+            summary.update(chunk)
+    else:
+        parts = Parallel(n_jobs=n_jobs, pre_dispatch='2*n_jobs')(
+            delayed(summarize_chunk)(chunk, shift) for chunk in chunks
+        )
+        for part in parts:
+            summary.merge(part)
+    return summary
+
+
+def weighted_box_stats(values, counts, label):
+    """Boxplot statistics (as matplotlib's boxplot) from value counts"""
+    order = np.argsort(values)
+    values, counts = np.asarray(values, dtype=float)[order], np.asarray(counts, dtype=float)[order]
+    cumulative = np.cumsum(counts) / counts.sum()
+
+    def quantile(q):
+        return float(np.interp(q, cumulative - counts / counts.sum() / 2, values))
+
+    q1, median, q3 = quantile(0.25), quantile(0.5), quantile(0.75)
+    iqr = q3 - q1
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    return {
+        'label': label,
+        'q1': q1, 'med': median, 'q3': q3,
+        'whislo': float(inside.min()), 'whishi': float(inside.max()),
+        'fliers': values[(values < inside.min()) | (values > inside.max())],
+    }
+
+
+def plot_churn_distribution(churn_counts, path):
+    """Pie chart of churn vs non-churn"""
+    fig, ax = plt.subplots(figsize=(8, 6))
+    ax.pie([churn_counts.get(0, 0), churn_counts.get(1, 0)], labels=['Non-Churn', 'Churn'],
+           autopct='%1.1f%%', startangle=90)
+    ax.set_title('Churn Distribution')
+    fig.savefig(path, dpi=PLOT_DPI, bbox_inches='tight')
+    plt.close(fig)
+
+
+def plot_churn_by_segment(churn_rates, path):
+    """Bar chart of churn rate per customer segment"""
+    fig, ax = plt.subplots(figsize=(10, 6))
+    churn_rates.plot(kind='bar', ax=ax)
+    ax.set_title('Churn Rate by Customer Segment')
+    ax.set_xlabel('Customer Segment')
+    ax.set_ylabel('Churn Rate')
+    ax.tick_params(axis='x', rotation=45)
+    fig.savefig(path, dpi=PLOT_DPI, bbox_inches='tight')
+    plt.close(fig)
+
+
+def plot_balance_distribution(edges, counts, path):
+    """Histogram of balances from precomputed bins"""
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax.stairs(counts, edges, fill=True, edgecolor='black')
+    ax.set_title('Balance Distribution')
+    ax.set_xlabel('Balance')
+    ax.set_ylabel('Frequency')
+    ax.set_yscale('log')
+    fig.savefig(path, dpi=PLOT_DPI, bbox_inches='tight')
+    plt.close(fig)
+
+
+def plot_correlation_heatmap(corr_matrix, path):
+    """Annotated correlation heatmap"""
+    fig, ax = plt.subplots(figsize=(12, 10))
+    sns.heatmap(corr_matrix, annot=True, fmt='.2f', cmap='coolwarm', center=0, ax=ax)
+    ax.set_title('Correlation Heatmap')
+    fig.savefig(path, dpi=PLOT_DPI, bbox_inches='tight')
+    plt.close(fig)
+
+
+def plot_age_by_churn(box_stats, path):
+    """Age boxplot per churn flag from precomputed statistics"""
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax.bxp(box_stats)
+    ax.set_title('Age Distribution by Churn Status')
+    ax.set_xlabel('Churn Flag')
+    ax.set_ylabel('Age')
+    fig.savefig(path, dpi=PLOT_DPI, bbox_inches='tight')
+    plt.close(fig)
+
+
+def plot_tasks(summary, output_dir):
+    """(plot function, arguments) for every figure, built from the summary only"""
+    balance = summary.histograms['Balance']
+    tasks = [
+        (plot_churn_distribution, (summary.churn_counts, f'{output_dir}/churn_distribution.png')),
+        (plot_balance_distribution, (balance.edges(), balance.counts, f'{output_dir}/balance_distribution.png')),
+        (plot_correlation_heatmap, (summary.correlation.correlation().loc[HEATMAP_COLS, HEATMAP_COLS],
+                                    f'{output_dir}/correlation_heatmap.png')),
+    ]
+    if 'Customer_Segment' in summary.categories:
+        segment = summary.categories['Customer_Segment']
+        tasks.append((plot_churn_by_segment, (segment['sum'] / segment['count'], f'{output_dir}/churn_by_segment.png')))
+    if not summary.age_by_churn.empty:
+        box_stats = [
+            weighted_box_stats(summary.age_by_churn.index.to_numpy(), summary.age_by_churn[flag].to_numpy(), str(flag))
+            for flag in summary.age_by_churn.columns
+        ]
+        tasks.append((plot_age_by_churn, (box_stats, f'{output_dir}/age_by_churn.png')))
+    return tasks
+
+
+def render_plots(summary, output_dir, n_jobs=-1):
+    """Render every figure in parallel worker processes"""
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = plot_tasks(summary, output_dir)
+    Parallel(n_jobs=n_jobs)(delayed(function)(*args) for function, args in tasks)
+    return len(tasks)
+
+
+def basic_statistics(summary):
+    """Basic statistics in the format of explore_data.basic_statistics"""
+    print("\n" + "="*60)
+    print("Basic Statistics")
+    print("="*60)
+
+    shape = (summary.rows, len(summary.columns))
+    print(f"\nDataset Shape: {shape}")
+    print(f"Total Records: {summary.rows:,}")
+    print(f"Total Features: {shape[1]}")
+
+    print("\nMissing Values:")
+    missing_df = pd.DataFrame({
+        'Missing Count': summary.missing,
+        'Missing Percentage': summary.missing / max(summary.rows, 1) * 100
+    })
+    missing_df = missing_df[missing_df['Missing Count'] > 0].sort_values('Missing Count', ascending=False)
+    print(missing_df.to_string() if len(missing_df) > 0 else "No missing values found!")
+
+    print("\nChurn Distribution:")
+    churn_pct = summary.churn_counts / summary.churn_counts.sum() * 100
+    print(f"Non-Churn (0): {summary.churn_counts.get(0, 0):,} ({churn_pct.get(0, 0):.2f}%)")
+    print(f"Churn (1): {summary.churn_counts.get(1, 0):,} ({churn_pct.get(1, 0):.2f}%)")
+
+    return {
+        'shape': shape,
+        'missing_values': summary.missing.to_dict(),
+        'churn_distribution': summary.churn_counts.to_dict()
+    }
+
+
+def categorical_analysis(summary):
+    """Categorical analysis in the format of explore_data.categorical_analysis"""
+    print("\n" + "="*60)
+    print("Categorical Variables Analysis")
+    print("="*60)
+
+    results = {}
+    for col in CATEGORICAL_COLS:
+        if col not in summary.categories:
+            continue
+        stats = summary.categories[col]
+        print(f"\n{col}:")
+        print(stats['count'].astype('int64').sort_values(ascending=False).head(10).to_string())
+
+        churn_by_cat = pd.DataFrame({'Count': stats['count'].astype('int64'),
+                                     'Churn_Rate': stats['sum'] / stats['count']})
+        churn_by_cat = churn_by_cat.sort_values('Churn_Rate', ascending=False)
+        print(f"\nChurn Rate by {col}:")
+        print(churn_by_cat.head(10).to_string())
+        results[col] = churn_by_cat.to_dict()
+
+    return results
+
+
+def numerical_analysis(summary):
+    """Numerical analysis in the format of explore_data.numerical_analysis (quartiles are approximate)"""
+    print("\n" + "="*60)
+    print("Numerical Variables Analysis")
+    print("="*60)
+
+    moments = summary.moments
+    summary_stats = pd.DataFrame({
+        'count': moments.count,
+        'mean': moments.mean,
+        'std': moments.std(),
+        'min': moments.min,
+        '25%': [summary.histograms[col].quantile(0.25) for col in NUMERICAL_COLS],
+        '50%': [summary.histograms[col].quantile(0.50) for col in NUMERICAL_COLS],
+        '75%': [summary.histograms[col].quantile(0.75) for col in NUMERICAL_COLS],
+        'max': moments.max,
+    }, index=NUMERICAL_COLS).T
+    print("\nNumerical Variables Summary:")
+    print(summary_stats.to_string())
+
+    print("\nCorrelation with Churn Flag:")
+    correlations = summary.correlation.correlation()['Churn_Flag'].sort_values(ascending=False)
+    print(correlations.to_string())
+
+    return {
+        'summary_stats': summary_stats.to_dict(),
+        'correlations': correlations.to_dict()
+    }
+
+
+def run_streaming_eda(data_path, output_dir, chunk_size=DEFAULT_CHUNK_SIZE, sample_fraction=None, n_jobs=1):
+    """Single-pass EDA: returns (stats, categorical, numerical) as explore_data's analysis functions"""
+    start_time = time.time()
+    mode = f"sampling {sample_fraction:.0%} of rows" if sample_fraction else "all rows"
+    print(f"Streaming dataset in chunks of {chunk_size:,} ({mode})...")
+    summary = streaming_summary(data_path, chunk_size, sample_fraction, n_jobs)
+    print(f"Summarized {summary.rows:,} rows in {time.time() - start_time:.1f}s")
+
+    stats = basic_statistics(summary)
+    categorical = categorical_analysis(summary)
+    numerical = numerical_analysis(summary)
+
+    print("\n" + "="*60)
+    print("Creating Visualizations...")
+    print("="*60)
+    plot_start = time.time()
+    n_plots = render_plots(summary, output_dir)
+    print(f"Rendered {n_plots} plots in {time.time() - plot_start:.1f}s")
+    print(f"Visualizations saved to: {output_dir}")
+
+    stats['sample_fraction'] = sample_fraction
+    stats['generated_at'] = datetime.now().isoformat()
+    return stats, categorical, numerical
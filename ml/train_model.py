@@ -15,7 +15,14 @@ from sklearn.metrics import (
     roc_auc_score, classification_report, confusion_matrix
 )
 from sklearn.model_selection import cross_val_score, StratifiedKFold
+from sklearn.base import clone
+from sklearn.utils.class_weight import compute_sample_weight
 import joblib
+import time
+import argparse
+import tracemalloc
+
+from resource_governor import govern, split_threads
 
 # Optional imports for advanced models
 try:
@@ -34,6 +41,7 @@ except ImportError:
 
 try:
     from imblearn.over_sampling import SMOTE
+    from imblearn.pipeline import Pipeline as ImbPipeline
     SMOTE_AVAILABLE = True
 except ImportError:
     SMOTE_AVAILABLE = False
@@ -47,6 +55,21 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 PROCESSED_DATA_DIR = os.path.join(BASE_DIR, 'data', 'processed')
 MODELS_DIR = os.path.join(BASE_DIR, 'data', 'models')
 METRICS_DIR = os.path.join(BASE_DIR, 'data', 'models', 'metrics')
+EXPLANATIONS_DIR = os.path.join(BASE_DIR, 'data', 'models', 'explanations')
+EXPLANATION_SAMPLE_SIZE = 1000
+
+# Class imbalance handling
+#   class_weight   - no resampling; models use class_weight='balanced' / scale_pos_weight / sample weights
+#   undersample    - stratified random undersampling of the majority class
+#   chunked_smote  - SMOTE run independently on stratified chunks (bounded k-NN cost per chunk)
+#   smote_cv       - SMOTE on the training set, and inside each CV fold instead of before CV
+#   smote          - SMOTE on the full training set before training (original behaviour)
+IMBALANCE_STRATEGIES = ['class_weight', 'undersample', 'chunked_smote', 'smote_cv', 'smote']
+SMOTE_STRATEGIES = ['chunked_smote', 'smote_cv', 'smote']
+DEFAULT_IMBALANCE_STRATEGY = 'class_weight'
+SMOTE_CHUNK_SIZE = 50000
+UNDERSAMPLE_RATIO = 1.0  # Majority rows kept per minority row
+CV_FOLDS = 5
 
 
 def load_processed_data():
@@ -79,24 +102,8 @@ def load_processed_data():
     return X_train, X_test, y_train, y_test
 
 
-def evaluate_model(model, X_train, X_test, y_train, y_test, model_name):
-    """Evaluate a model and return metrics"""
-    # Train
-    model.fit(X_train, y_train)
-    
-    # Predictions
-    y_train_pred = model.predict(X_train)
-    y_test_pred = model.predict(X_test)
-    
-    # Probabilities
-    if hasattr(model, 'predict_proba'):
-        y_train_proba = model.predict_proba(X_train)[:, 1]
-        y_test_proba = model.predict_proba(X_test)[:, 1]
-    else:
-        y_train_proba = None
-        y_test_proba = None
-    
-    # Metrics
+def compute_metrics(model_name, y_train, y_train_pred, y_test, y_test_pred, y_test_proba=None, cv_scores=None):
+    """Compute the metrics dictionary saved for every model from its predictions"""
     train_acc = accuracy_score(y_train, y_train_pred)
     test_acc = accuracy_score(y_test, y_test_pred)
     
@@ -117,9 +124,9 @@ def evaluate_model(model, X_train, X_test, y_train, y_test, model_name):
         metrics['test_roc_auc'] = roc_auc_score(y_test, y_test_proba)
     
     # Cross-validation
-    cv_scores = cross_val_score(model, X_train, y_train, cv=5, scoring='roc_auc', n_jobs=-1)
-    metrics['cv_mean'] = cv_scores.mean()
-    metrics['cv_std'] = cv_scores.std()
+    if cv_scores is not None:
+        metrics['cv_mean'] = cv_scores.mean()
+        metrics['cv_std'] = cv_scores.std()
     
     # Classification report
     metrics['classification_report'] = classification_report(y_test, y_test_pred, output_dict=True)
@@ -133,14 +140,51 @@ def evaluate_model(model, X_train, X_test, y_train, y_test, model_name):
         'tp': int(cm[1, 1])
     }
     
-    return metrics, model
+    return metrics
 
 
-def train_models(X_train, X_test, y_train, y_test):
-    """Train multiple models with regularization to prevent overfitting"""
-    # Calculate class weight for imbalanced data
-    pos_weight = len(y_train[y_train==0]) / len(y_train[y_train==1])
+def evaluate_model(model, X_train, X_test, y_train, y_test, model_name, sample_weight=None, cv_estimator=None, cv_data=None):
+    """Evaluate a model and return metrics
+
+    sample_weight is passed to the final fit. cv_estimator (e.g. a SMOTE + model
+    pipeline) replaces the model in cross-validation and cv_data (X, y) replaces
+    the training rows there when given.
+    """
+    # Train
+    if sample_weight is not None:
+        model.fit(X_train, y_train, sample_weight=sample_weight)
+    else:
+        model.fit(X_train, y_train)
+    
+    # Predictions
+    y_train_pred = model.predict(X_train)
+    y_test_pred = model.predict(X_test)
+    
+    # Probabilities
+    if hasattr(model, 'predict_proba'):
+        y_test_proba = model.predict_proba(X_test)[:, 1]
+    else:
+        y_test_proba = None
+    
+    # Cross-validation (fold models get the same sample weights as the final fit)
+    X_cv, y_cv = cv_data if cv_data is not None else (X_train, y_train)
+    cv_params = {'sample_weight': sample_weight} if sample_weight is not None and cv_data is None else None
+    # Folds run in parallel with estimator threads from build_models (folds x threads = allocation)
+    cv_jobs, _ = split_threads(CV_FOLDS)
+    cv_scores = cross_val_score(cv_estimator if cv_estimator is not None else model,
+                                X_cv, y_cv, cv=CV_FOLDS, scoring='roc_auc', n_jobs=cv_jobs, params=cv_params)
     
+    metrics = compute_metrics(model_name, y_train, y_train_pred, y_test, y_test_pred, y_test_proba, cv_scores)
+    return metrics, model
+
+
+def build_models(pos_weight):
+    """Candidate models with regularization to prevent overfitting
+
+    pos_weight is the negative/positive class ratio used as XGBoost scale_pos_weight.
+    Estimator threads are this process's allocation divided between the parallel CV folds.
+    """
+    _, threads = split_threads(CV_FOLDS)
     models = {
         'Logistic Regression': LogisticRegression(
             max_iter=1000, 
@@ -158,7 +202,7 @@ def train_models(X_train, X_test, y_train, y_test):
             max_samples=0.4,  # Use only 40% of samples per tree (bootstrap)
             random_state=42, 
             class_weight='balanced', 
-            n_jobs=-1
+            n_jobs=threads
         ),
         'Gradient Boosting': GradientBoostingClassifier(
             n_estimators=10,  # Very few
@@ -184,7 +228,8 @@ def train_models(X_train, X_test, y_train, y_test):
             reg_lambda=3.0,  # Much more L2 regularization
             random_state=42, 
             eval_metric='logloss', 
-            scale_pos_weight=pos_weight
+            scale_pos_weight=pos_weight,
+            n_jobs=threads
         )
     
     if LIGHTGBM_AVAILABLE:
@@ -199,9 +244,62 @@ def train_models(X_train, X_test, y_train, y_test):
             reg_lambda=3.0,  # Much more L2 regularization
             random_state=42, 
             verbose=-1, 
-            class_weight='balanced'
+            class_weight='balanced',
+            n_jobs=threads
         )
     
+    return models
+
+
+def print_model_metrics(metrics):
+    """Print the headline metrics of one trained model"""
+    print(f"  Train Accuracy: {metrics['train_accuracy']:.4f}")
+    print(f"  Test Accuracy: {metrics['test_accuracy']:.4f}")
+    print(f"  Overfitting Gap: {metrics['overfitting_gap']:.4f} (train - test)")
+    print(f"  Test F1-Score: {metrics['test_f1']:.4f}")
+    if 'test_roc_auc' in metrics:
+        print(f"  Test ROC-AUC: {metrics['test_roc_auc']:.4f}")
+    if metrics['overfitting_gap'] > 0.05:
+        print(f"  ⚠️  WARNING: High overfitting gap detected!")
+
+
+def select_best_model(results, trained_models):
+    """Pick the best model (name, model) and add its selection score to every result"""
+    # Find best model - prefer models with lower overfitting gap
+    # Score = test_roc_auc - (overfitting_gap * 10) to penalize overfitting
+    for r in results:
+        r['score'] = r.get('test_roc_auc', r['test_f1']) - (r['overfitting_gap'] * 10)
+    
+    best_model_name = max(results, key=lambda x: x['score'])['model_name']
+    best_model = trained_models[best_model_name]
+    
+    print(f"\nBest model selected based on: test_roc_auc - (overfitting_gap * 10)")
+    best_metrics = next(r for r in results if r['model_name'] == best_model_name)
+    print(f"  Score: {best_metrics['score']:.4f}")
+    print(f"  Overfitting Gap: {best_metrics['overfitting_gap']:.4f}")
+    
+    return best_model_name, best_model
+
+
+def balancing_sample_weight(model, y, imbalance_strategy=DEFAULT_IMBALANCE_STRATEGY):
+    """Balanced per-row weights for models without a class weight parameter (None otherwise)"""
+    if imbalance_strategy == 'class_weight' and not any(
+            param in model.get_params() for param in ('class_weight', 'scale_pos_weight')):
+        # Gradient Boosting has no class_weight parameter, so weight samples instead
+        return compute_sample_weight('balanced', y)
+    return None
+
+
+def train_models(X_train, X_test, y_train, y_test, imbalance_strategy=DEFAULT_IMBALANCE_STRATEGY, X_cv=None, y_cv=None):
+    """Train multiple models with regularization to prevent overfitting
+
+    For the smote_cv strategy, X_cv/y_cv are the original (not resampled)
+    training rows and cross-validation resamples inside each fold.
+    """
+    # Calculate class weight for imbalanced data
+    pos_weight = len(y_train[y_train==0]) / len(y_train[y_train==1])
+    models = build_models(pos_weight)
+    
     results = []
     trained_models = {}
     
@@ -211,31 +309,23 @@ def train_models(X_train, X_test, y_train, y_test):
     
     for name, model in models.items():
         print(f"\nTraining {name}...")
-        metrics, trained_model = evaluate_model(model, X_train, X_test, y_train, y_test, name)
+        sample_weight = balancing_sample_weight(model, y_train, imbalance_strategy)
+        cv_estimator = None
+        cv_data = None
+        if imbalance_strategy == 'smote_cv' and X_cv is not None:
+            # Resample inside each fold so synthetic rows never leak into validation folds
+            cv_estimator = ImbPipeline([('smote', SMOTE(random_state=42)), ('model', clone(model))])
+            cv_data = (X_cv, y_cv)
+        metrics, trained_model = evaluate_model(
+            model, X_train, X_test, y_train, y_test, name,
+            sample_weight=sample_weight, cv_estimator=cv_estimator, cv_data=cv_data
+        )
         results.append(metrics)
         trained_models[name] = trained_model
         
-        print(f"  Train Accuracy: {metrics['train_accuracy']:.4f}")
-        print(f"  Test Accuracy: {metrics['test_accuracy']:.4f}")
-        print(f"  Overfitting Gap: {metrics['overfitting_gap']:.4f} (train - test)")
-        print(f"  Test F1-Score: {metrics['test_f1']:.4f}")
-        if 'test_roc_auc' in metrics:
-            print(f"  Test ROC-AUC: {metrics['test_roc_auc']:.4f}")
-        if metrics['overfitting_gap'] > 0.05:
-            print(f"  ⚠️  WARNING: High overfitting gap detected!")
+        print_model_metrics(metrics)
     
-    # Find best model - prefer models with lower overfitting gap
-    # Score = test_roc_auc - (overfitting_gap * 10) to penalize overfitting
-    for r in results:
-        r['score'] = r.get('test_roc_auc', r['test_f1']) - (r['overfitting_gap'] * 10)
-    
-    best_model_name = max(results, key=lambda x: x['score'])['model_name']
-    best_model = trained_models[best_model_name]
-    
-    print(f"\nBest model selected based on: test_roc_auc - (overfitting_gap * 10)")
-    best_metrics = next(r for r in results if r['model_name'] == best_model_name)
-    print(f"  Score: {best_metrics['score']:.4f}")
-    print(f"  Overfitting Gap: {best_metrics['overfitting_gap']:.4f}")
+    best_model_name, best_model = select_best_model(results, trained_models)
     
     print("\n" + "="*60)
     print(f"Best Model: {best_model_name}")
@@ -244,8 +334,166 @@ def train_models(X_train, X_test, y_train, y_test):
     return results, trained_models, best_model_name, best_model
 
 
-def save_model(model, model_name, metrics, version=None):
-    """Save trained model and metrics"""
+def undersample_majority(X, y, ratio=UNDERSAMPLE_RATIO):
+    """Stratified random undersampling: keep all minority rows and ratio x as many majority rows"""
+    counts = y.value_counts()
+    minority_class, majority_class = counts.idxmin(), counts.idxmax()
+    n_majority = min(counts[majority_class], int(counts[minority_class] * ratio))
+    majority_index = y[y == majority_class].sample(n=n_majority, random_state=42).index
+    keep = y.index[(y == minority_class).to_numpy()].append(majority_index).sort_values()
+    return X.loc[keep].reset_index(drop=True), y.loc[keep].reset_index(drop=True)
+
+
+def chunked_smote(X, y, chunk_size=SMOTE_CHUNK_SIZE):
+    """SMOTE on stratified chunks so neighbour search cost stays bounded as data grows"""
+    n_chunks = int(np.ceil(len(X) / chunk_size))
+    if n_chunks < 2:
+        return SMOTE(random_state=42).fit_resample(X, y)
+    splitter = StratifiedKFold(n_splits=n_chunks, shuffle=True, random_state=42)
+    X_parts, y_parts = [], []
+    for _, chunk_index in splitter.split(X, y):
+        X_chunk, y_chunk = SMOTE(random_state=42).fit_resample(X.iloc[chunk_index], y.iloc[chunk_index])
+        X_parts.append(X_chunk)
+        y_parts.append(y_chunk)
+    return pd.concat(X_parts, ignore_index=True), pd.concat(y_parts, ignore_index=True)
+
+
+def full_smote(X, y):
+    """SMOTE on the full training set"""
+    return SMOTE(random_state=42).fit_resample(X, y)
+
+
+# Resampling step per strategy (None = train on the original rows)
+IMBALANCE_RESAMPLERS = {
+    'class_weight': None,
+    'undersample': undersample_majority,
+    'chunked_smote': chunked_smote,
+    'smote_cv': full_smote,
+    'smote': full_smote,
+}
+
+
+def resample_training_data(X_train, y_train, strategy):
+    """Apply an imbalance strategy and measure its time and peak memory
+
+    Returns (X_train, y_train, cost) where cost is recorded next to the model metrics.
+    """
+    rows_before = len(X_train)
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    
+    resampler = IMBALANCE_RESAMPLERS[strategy]
+    if resampler is not None:
+        X_train, y_train = resampler(X_train, y_train)
+    
+    elapsed = time.perf_counter() - start_time
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    cost = {
+        'strategy': strategy,
+        'resample_seconds': round(elapsed, 3),
+        'resample_peak_memory_mb': round(peak_memory / (1024 * 1024), 2),
+        'rows_before': rows_before,
+        'rows_after': len(X_train),
+    }
+    return X_train, y_train, cost
+
+
+def display_feature_name(feature):
+    """Readable feature name (same formatting as predict.py uses for SHAP output)"""
+    return feature.replace('_encoded', '').replace('_', ' ').title()
+
+
+def compute_shap_summary(model, X_sample):
+    """Compute mean |SHAP|, mean SHAP and the base value on a sample (None if SHAP is unavailable)"""
+    try:
+        import shap
+    except ImportError:
+        print("SHAP not available - explanation artifacts will only contain global importances")
+        return None
+    
+    try:
+        explainer = shap.TreeExplainer(model)
+        shap_values = explainer.shap_values(X_sample)
+    except Exception as e:
+        print(f"Warning: Could not compute SHAP values for explanation artifacts: {e}")
+        return None
+    
+    # Binary classification: keep the positive class (churn=1)
+    if isinstance(shap_values, list):
+        shap_values = shap_values[1]
+    shap_values = np.asarray(shap_values)
+    if shap_values.ndim == 3:
+        shap_values = shap_values[:, :, 1]
+    
+    base_value = np.atleast_1d(explainer.expected_value)
+    return {
+        'base_value': float(base_value[-1]),
+        'mean_abs_shap': np.abs(shap_values).mean(axis=0),
+        'mean_shap': shap_values.mean(axis=0),
+    }
+
+
+def compute_explanation_artifacts(model, model_name, X_reference, version):
+    """Build global explanation artifacts for a trained model
+
+    Contains normalized global importances, mean |SHAP| per feature on a sample
+    of X_reference, and per-feature baselines (mean SHAP and mean scaled value).
+    """
+    feature_names = list(X_reference.columns)
+    sample = X_reference.sample(
+        n=min(EXPLANATION_SAMPLE_SIZE, len(X_reference)), random_state=42
+    )
+    shap_summary = compute_shap_summary(model, sample)
+    
+    if hasattr(model, 'feature_importances_'):
+        importances = np.asarray(model.feature_importances_, dtype=float)
+    elif hasattr(model, 'coef_'):
+        importances = np.abs(np.asarray(model.coef_, dtype=float)).ravel()
+    elif shap_summary is not None:
+        importances = shap_summary['mean_abs_shap']
+    else:
+        importances = np.zeros(len(feature_names))
+    if importances.sum() > 0:
+        importances = importances / importances.sum()
+    
+    features = []
+    for i, feature in enumerate(feature_names):
+        features.append({
+            'feature': feature,
+            'display_name': display_feature_name(feature),
+            'importance': float(importances[i]),
+            'mean_abs_shap': float(shap_summary['mean_abs_shap'][i]) if shap_summary else None,
+            'mean_shap': float(shap_summary['mean_shap'][i]) if shap_summary else None,
+            'baseline_value': float(sample[feature].mean()),
+        })
+    features.sort(key=lambda f: f['importance'], reverse=True)
+    
+    return {
+        'model_name': model_name,
+        'version': version,
+        'generated_at': datetime.now().isoformat(),
+        'sample_size': len(sample),
+        'shap_available': shap_summary is not None,
+        'base_value': shap_summary['base_value'] if shap_summary else None,
+        'features': features,
+    }
+
+
+def save_explanation_artifacts(model, model_name, X_reference, version):
+    """Save explanation artifacts as a small JSON file read by predict.py and /model-info"""
+    os.makedirs(EXPLANATIONS_DIR, exist_ok=True)
+    explanations = compute_explanation_artifacts(model, model_name, X_reference, version)
+    explanations_path = f'{EXPLANATIONS_DIR}/{model_name.lower().replace(" ", "_")}_{version}.json'
+    with open(explanations_path, 'w') as f:
+        json.dump(explanations, f, indent=2)
+    print(f"Explanations saved to: {explanations_path}")
+    return explanations_path
+
+
+def save_model(model, model_name, metrics, version=None, X_reference=None):
+    """Save trained model, metrics and (given reference data) explanation artifacts"""
     os.makedirs(MODELS_DIR, exist_ok=True)
     os.makedirs(METRICS_DIR, exist_ok=True)
     
@@ -267,16 +515,15 @@ def save_model(model, model_name, metrics, version=None):
     latest_path = f'{MODELS_DIR}/latest_{model_name.lower().replace(" ", "_")}.pkl'
     joblib.dump(model, latest_path)
     
+    # Save global explanations so serving never has to load the model or an explainer for them
+    if X_reference is not None:
+        save_explanation_artifacts(model, model_name, X_reference, version)
+    
     return model_path, metrics_path
 
 
-def save_all_results(results, trained_models, best_model_name, best_model):
-    """Save all model results"""
-    # Save best model
-    best_metrics = next(r for r in results if r['model_name'] == best_model_name)
-    save_model(best_model, best_model_name, best_metrics, version='best')
-    
-    # Save comparison report
+def save_comparison_report(results):
+    """Save the model comparison report and print its summary table"""
     comparison_path = f'{METRICS_DIR}/model_comparison_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
     with open(comparison_path, 'w') as f:
         json.dump(results, f, indent=2)
@@ -292,29 +539,58 @@ def save_all_results(results, trained_models, best_model_name, best_model):
     return comparison_path
 
 
-def main():
+def save_all_results(results, trained_models, best_model_name, best_model, X_reference=None):
+    """Save all model results"""
+    # Save best model
+    best_metrics = next(r for r in results if r['model_name'] == best_model_name)
+    save_model(best_model, best_model_name, best_metrics, version='best', X_reference=X_reference)
+    
+    # Save comparison report
+    return save_comparison_report(results)
+
+
+def train_with_imbalance_strategy(X_train, X_test, y_train, y_test, imbalance_strategy=DEFAULT_IMBALANCE_STRATEGY):
+    """Apply an imbalance strategy, train every model and record the strategy cost in each result"""
+    if imbalance_strategy in SMOTE_STRATEGIES and not SMOTE_AVAILABLE:
+        print(f"\n{imbalance_strategy} requires imbalanced-learn - falling back to class_weight")
+        imbalance_strategy = 'class_weight'
+    print(f"\nHandling class imbalance with strategy: {imbalance_strategy}")
+    X_original, y_original = X_train, y_train
+    X_train, y_train, imbalance_cost = resample_training_data(X_train, y_train, imbalance_strategy)
+    print(f"  Training set: {imbalance_cost['rows_before']} -> {imbalance_cost['rows_after']} samples "
+          f"({imbalance_cost['resample_seconds']:.2f}s, peak {imbalance_cost['resample_peak_memory_mb']:.1f} MB)")
+    
+    # Train models
+    train_start = time.perf_counter()
+    results, trained_models, best_model_name, best_model = train_models(
+        X_train, X_test, y_train, y_test,
+        imbalance_strategy=imbalance_strategy, X_cv=X_original, y_cv=y_original
+    )
+    imbalance_cost['total_training_seconds'] = round(time.perf_counter() - train_start, 3)
+    for metrics in results:
+        metrics['imbalance'] = imbalance_cost
+    
+    return results, trained_models, best_model_name, best_model
+
+
+def main(imbalance_strategy=DEFAULT_IMBALANCE_STRATEGY):
     """Main training function"""
     print("="*60)
     print("BK Pulse - Churn Prediction Model Training")
     print("="*60)
+    govern(role='train_model.py', quiet=False)
     
     # Load data
     X_train, X_test, y_train, y_test = load_processed_data()
     
-    # Handle class imbalance with SMOTE if available
-    if SMOTE_AVAILABLE:
-        print("\nApplying SMOTE to handle class imbalance...")
-        smote = SMOTE(random_state=42)
-        X_train, y_train = smote.fit_resample(X_train, y_train)
-        print(f"After SMOTE - Training set: {len(X_train)} samples")
-    
-    # Train models
-    results, trained_models, best_model_name, best_model = train_models(
-        X_train, X_test, y_train, y_test
+    # Handle class imbalance and train models
+    results, trained_models, best_model_name, best_model = train_with_imbalance_strategy(
+        X_train, X_test, y_train, y_test, imbalance_strategy
     )
     
     # Save results
-    save_all_results(results, trained_models, best_model_name, best_model)
+    # Explanations are computed on held-out data rather than SMOTE-resampled rows
+    save_all_results(results, trained_models, best_model_name, best_model, X_reference=X_test)
     
     print("\n" + "="*60)
     print("Training Complete!")
@@ -322,5 +598,9 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Train churn prediction models')
+    parser.add_argument('--imbalance-strategy', choices=IMBALANCE_STRATEGIES, default=DEFAULT_IMBALANCE_STRATEGY,
+                        help=f'How to handle class imbalance (default: {DEFAULT_IMBALANCE_STRATEGY})')
+    args = parser.parse_args()
+    main(imbalance_strategy=args.imbalance_strategy)
 
@@ -0,0 +1,376 @@
+"""
+Out-of-Core Training Script for BK Pulse Churn Prediction
+Trains the same candidate models as train_model.py without loading X_train
+into memory. The preprocessed data is read as shards:
+  data/processed/shards/<split>/part-00000.csv   feature columns + Churn_Flag
+  data/processed/shards/<split>/shards.json      shard files, row and churn counts
+
+Shards are written from X_train.csv / X_test.csv by a single streaming pass
+when missing or older than the CSVs (or can be produced by another job in the
+same layout).
+
+  XGBoost              external-memory DMatrix fed by a shard iterator
+  LightGBM             Dataset built from lightgbm.Sequence shards
+  Logistic Regression  SGD logistic regression, partial_fit over the shards
+  Random Forest /
+  Gradient Boosting    fitted on a uniform sample of OUT_OF_CORE_SAMPLE_SIZE rows
+
+Metrics are computed on predictions streamed over every shard and saved with
+train_model.save_all_results(), so the output matches train_model.py.
+
+Usage:
+    python train_out_of_core.py
+    python train_out_of_core.py --shard-rows 500000 --sample-size 200000
+"""
+
+import os
+import json
+import shutil
+import argparse
+import tempfile
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.linear_model import SGDClassifier
+from sklearn.model_selection import cross_val_score
+
+import train_model
+from resource_governor import govern, split_threads
+
+# Configuration
+SHARDS_DIR = os.path.join(train_model.PROCESSED_DATA_DIR, 'shards')
+TARGET_COL = 'Churn_Flag'
+SHARD_ROWS = 250000                # Rows per shard written from the processed CSVs
+OUT_OF_CORE_SAMPLE_SIZE = 200000   # Rows kept in memory for sampled models and cross-validation
+SGD_EPOCHS = 5                     # Passes over the shards for the SGD logistic regression
+
+
+def shards_dir(split):
+    """Directory holding the shards of one split ('train' or 'test')"""
+    return os.path.join(SHARDS_DIR, split)
+
+
+def write_shards(split, shard_rows=SHARD_ROWS):
+    """Split X_<split>.csv / y_<split>.csv into shard files in one streaming pass"""
+    X_path = os.path.join(train_model.PROCESSED_DATA_DIR, f'X_{split}.csv')
+    y_path = os.path.join(train_model.PROCESSED_DATA_DIR, f'y_{split}.csv')
+    for file_path in (X_path, y_path):
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(
+                f"Processed data file not found: {file_path}\n"
+                "Please run preprocess.py first to generate the processed data files."
+            )
+
+    split_dir = shards_dir(split)
+    if os.path.exists(split_dir):
+        shutil.rmtree(split_dir)
+    os.makedirs(split_dir)
+
+    shards = []
+    X_chunks = pd.read_csv(X_path, chunksize=shard_rows)
+    y_chunks = pd.read_csv(y_path, chunksize=shard_rows)
+    for shard_number, (X_chunk, y_chunk) in enumerate(zip(X_chunks, y_chunks)):
+        X_chunk[TARGET_COL] = y_chunk.iloc[:, 0].to_numpy()
+        file_name = f'part-{shard_number:05d}.csv'
+        X_chunk.to_csv(os.path.join(split_dir, file_name), index=False)
+        shards.append({
+            'file': file_name,
+            'rows': int(len(X_chunk)),
+            'positives': int(X_chunk[TARGET_COL].sum()),
+        })
+
+    manifest = {
+        'feature_names': [col for col in X_chunk.columns if col != TARGET_COL],
+        'shards': shards,
+    }
+    with open(os.path.join(split_dir, 'shards.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Wrote {len(shards)} {split} shard(s) to: {split_dir}")
+    return manifest
+
+
+def load_manifest(split, shard_rows=SHARD_ROWS):
+    """Shard manifest of a split, (re)writing the shards when missing or stale"""
+    manifest_path = os.path.join(shards_dir(split), 'shards.json')
+    X_path = os.path.join(train_model.PROCESSED_DATA_DIR, f'X_{split}.csv')
+    if os.path.exists(manifest_path) and (
+            not os.path.exists(X_path) or os.path.getmtime(manifest_path) >= os.path.getmtime(X_path)):
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    return write_shards(split, shard_rows)
+
+
+@lru_cache(maxsize=1)
+def load_shard(path):
+    """Read one shard as (X, y) numpy arrays; only the most recent shard stays cached"""
+    shard = pd.read_csv(path)
+    y = shard.pop(TARGET_COL).to_numpy(dtype=np.int64)
+    return shard.to_numpy(dtype=np.float64), y
+
+
+def shard_paths(split, manifest):
+    """Absolute paths of a split's shard files"""
+    return [os.path.join(shards_dir(split), shard['file']) for shard in manifest['shards']]
+
+
+def iter_shards(split, manifest):
+    """Yield (X, y) arrays shard by shard"""
+    for path in shard_paths(split, manifest):
+        yield load_shard(path)
+
+
+def sample_rows(split, manifest, sample_size, seed=42):
+    """Uniform sample of sample_size rows across all shards (memory bounded by sample + one shard)"""
+    rng = np.random.default_rng(seed)
+    X_sample, y_sample, keys = None, None, None
+    for X, y in iter_shards(split, manifest):
+        shard_keys = rng.random(len(y))
+        if X_sample is None:
+            X_sample, y_sample, keys = X, y, shard_keys
+        else:
+            X_sample = np.vstack([X_sample, X])
+            y_sample = np.concatenate([y_sample, y])
+            keys = np.concatenate([keys, shard_keys])
+        if len(keys) > sample_size:
+            keep = np.argpartition(keys, sample_size)[:sample_size]
+            X_sample, y_sample, keys = X_sample[keep], y_sample[keep], keys[keep]
+    return (pd.DataFrame(X_sample, columns=manifest['feature_names']),
+            pd.Series(y_sample, name=TARGET_COL))
+
+
+def class_counts(manifest):
+    """(negatives, positives) over all shards of a split"""
+    rows = sum(shard['rows'] for shard in manifest['shards'])
+    positives = sum(shard['positives'] for shard in manifest['shards'])
+    return rows - positives, positives
+
+
+def train_xgboost(model, split, manifest):
+    """Train XGBoost from an external-memory DMatrix fed shard by shard"""
+    import xgboost as xgb
+
+    class ShardIterator(xgb.DataIter):
+        """Feeds shards to XGBoost one at a time"""
+
+        def __init__(self, cache_prefix):
+            self._paths = shard_paths(split, manifest)
+            self._position = 0
+            super().__init__(cache_prefix=cache_prefix)
+
+        def next(self, input_data):
+            if self._position == len(self._paths):
+                return False
+            X, y = load_shard(self._paths[self._position])
+            input_data(data=X, label=y, feature_names=manifest['feature_names'])
+            self._position += 1
+            return True
+
+        def reset(self):
+            self._position = 0
+
+    cache_dir = tempfile.mkdtemp(prefix='xgb_cache_')
+    try:
+        iterator = ShardIterator(os.path.join(cache_dir, 'cache'))
+        params = model.get_xgb_params()
+        if hasattr(xgb, 'ExtMemQuantileDMatrix'):
+            dtrain = xgb.ExtMemQuantileDMatrix(iterator)
+            params['tree_method'] = 'hist'
+        else:
+            dtrain = xgb.DMatrix(iterator)
+        booster = xgb.train(params, dtrain, num_boost_round=model.get_params()['n_estimators'])
+        del dtrain  # Release the cache pages before the cache directory is removed
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    # Load the booster into the sklearn wrapper so saved models work with predict.py unchanged
+    booster.feature_names = None
+    model.load_model(bytearray(booster.save_raw(raw_format='ubj')))
+    return model
+
+
+def train_lightgbm(model, split, manifest):
+    """Train LightGBM from a Dataset constructed over lightgbm.Sequence shards"""
+    import lightgbm as lgb
+    from sklearn.preprocessing import LabelEncoder
+
+    class ShardSequence(lgb.Sequence):
+        """Random access to one shard for LightGBM's sampled bin construction"""
+
+        def __init__(self, path, rows):
+            self.path = path
+            self.rows = rows
+            self.batch_size = min(rows, 65536)
+
+        def __len__(self):
+            return self.rows
+
+        def __getitem__(self, index):
+            return load_shard(self.path)[0][index]
+
+    paths = shard_paths(split, manifest)
+    sequences = [ShardSequence(path, shard['rows']) for path, shard in zip(paths, manifest['shards'])]
+    labels = np.concatenate([
+        pd.read_csv(path, usecols=[TARGET_COL])[TARGET_COL].to_numpy() for path in paths
+    ])
+
+    # class_weight='balanced' becomes per-row weights, as in LGBMClassifier.fit
+    negatives, positives = class_counts(manifest)
+    class_weight = {0: len(labels) / (2 * negatives), 1: len(labels) / (2 * positives)}
+    weights = np.where(labels == 1, class_weight[1], class_weight[0])
+
+    sklearn_params = model.get_params()
+    params = {
+        key: value for key, value in sklearn_params.items()
+        if value is not None and key not in ('n_estimators', 'class_weight', 'importance_type')
+    }
+    params['objective'] = 'binary'
+    dtrain = lgb.Dataset(sequences, label=labels, weight=weights,
+                         feature_name=manifest['feature_names'], params=params)
+    booster = lgb.train(params, dtrain, num_boost_round=sklearn_params['n_estimators'])
+
+    # Adopt the booster into the sklearn wrapper so saved models work with predict.py unchanged
+    model._Booster = booster
+    model._n_features = model._n_features_in = booster.num_feature()
+    model._le = LabelEncoder().fit([0, 1])
+    model._classes = model._le.classes_
+    model._n_classes = 2
+    model._objective = 'binary'
+    model._evals_result = {}
+    model._best_score = {}
+    model._best_iteration = booster.best_iteration
+    model.fitted_ = True
+    return model
+
+
+def train_sgd_logistic(model, split, manifest, n_rows, epochs=SGD_EPOCHS):
+    """Logistic regression fitted with partial_fit over the shards (same L2 strength and class weights)"""
+    negatives, positives = class_counts(manifest)
+    class_weight = {0: n_rows / (2 * negatives), 1: n_rows / (2 * positives)}
+    sgd = SGDClassifier(
+        loss='log_loss',
+        penalty='l2',
+        alpha=1.0 / (model.C * n_rows),  # LogisticRegression C scaled to per-sample SGD loss
+        random_state=42
+    )
+    rng = np.random.default_rng(42)
+    for epoch in range(epochs):
+        for X, y in iter_shards(split, manifest):
+            order = rng.permutation(len(y))
+            sgd.partial_fit(X[order], y[order], classes=np.array([0, 1]),
+                            sample_weight=np.where(y[order] == 1, class_weight[1], class_weight[0]))
+    return sgd
+
+
+def predict_split(model, split, manifest):
+    """Stream predictions over a split: (y_true, y_pred, churn probability)"""
+    y_true, y_pred, y_proba = [], [], []
+    for X, y in iter_shards(split, manifest):
+        if hasattr(model, 'feature_names_in_'):
+            X = pd.DataFrame(X, columns=manifest['feature_names'])
+        proba = model.predict_proba(X)[:, 1]
+        y_true.append(y)
+        y_pred.append(model.predict(X))
+        y_proba.append(proba)
+    return np.concatenate(y_true), np.concatenate(y_pred), np.concatenate(y_proba)
+
+
+def train_models_out_of_core(sample_size=OUT_OF_CORE_SAMPLE_SIZE, shard_rows=SHARD_ROWS):
+    """Train every candidate model from shards; returns the same values as train_model.train_models"""
+    train_manifest = load_manifest('train', shard_rows)
+    test_manifest = load_manifest('test', shard_rows)
+    negatives, positives = class_counts(train_manifest)
+    n_rows = negatives + positives
+    print(f"Training set: {n_rows} samples in {len(train_manifest['shards'])} shard(s)")
+    print(f"Test set: {sum(s['rows'] for s in test_manifest['shards'])} samples")
+
+    # In-memory sample for sampled models and cross-validation
+    X_sample, y_sample = sample_rows('train', train_manifest, sample_size)
+    print(f"In-memory sample: {len(X_sample)} rows")
+
+    models = train_model.build_models(pos_weight=negatives / positives)
+    results = []
+    trained_models = {}
+
+    print("\n" + "="*60)
+    print("Training Models (out-of-core)")
+    print("="*60)
+
+    for name, model in models.items():
+        print(f"\nTraining {name}...")
+        cv_estimator = clone(model)
+        sample_weight = None
+        if name == 'XGBoost':
+            trained_model = train_xgboost(model, 'train', train_manifest)
+            mode = 'external_memory'
+        elif name == 'LightGBM':
+            trained_model = train_lightgbm(model, 'train', train_manifest)
+            mode = 'sequence'
+        elif name == 'Logistic Regression':
+            trained_model = train_sgd_logistic(model, 'train', train_manifest, n_rows)
+            cv_estimator = clone(trained_model).set_params(alpha=1.0 / (model.C * len(X_sample)),
+                                                           class_weight='balanced')
+            mode = 'partial_fit'
+        else:
+            # Random Forest / Gradient Boosting have no incremental fit in sklearn; weighted
+            # like train_model.train_models where the model has no class weight parameter
+            sample_weight = train_model.balancing_sample_weight(model, y_sample)
+            trained_model = model.fit(X_sample, y_sample, sample_weight=sample_weight)
+            mode = 'sampled'
+
+        y_train, y_train_pred, _ = predict_split(trained_model, 'train', train_manifest)
+        y_test, y_test_pred, y_test_proba = predict_split(trained_model, 'test', test_manifest)
+        # Cross-validating on the full history would mean training every model five more times
+        cv_jobs, _ = split_threads(train_model.CV_FOLDS)
+        cv_params = {'sample_weight': sample_weight} if sample_weight is not None else None
+        cv_scores = cross_val_score(cv_estimator, X_sample, y_sample, cv=train_model.CV_FOLDS,
+                                    scoring='roc_auc', n_jobs=cv_jobs, params=cv_params)
+
+        metrics = train_model.compute_metrics(name, y_train, y_train_pred, y_test, y_test_pred,
+                                              y_test_proba, cv_scores)
+        metrics['training_mode'] = f'out_of_core:{mode}'
+        metrics['training_rows'] = len(X_sample) if mode == 'sampled' else n_rows
+        metrics['cv_sample_size'] = len(X_sample)
+        results.append(metrics)
+        trained_models[name] = trained_model
+
+        train_model.print_model_metrics(metrics)
+
+    best_model_name, best_model = train_model.select_best_model(results, trained_models)
+
+    print("\n" + "="*60)
+    print(f"Best Model: {best_model_name}")
+    print("="*60)
+
+    return results, trained_models, best_model_name, best_model, test_manifest
+
+
+def main(sample_size=OUT_OF_CORE_SAMPLE_SIZE, shard_rows=SHARD_ROWS):
+    """Main out-of-core training function"""
+    print("="*60)
+    print("BK Pulse - Out-of-Core Churn Model Training")
+    print("="*60)
+    govern(role='train_out_of_core.py')
+
+    results, trained_models, best_model_name, best_model, test_manifest = train_models_out_of_core(
+        sample_size=sample_size, shard_rows=shard_rows
+    )
+
+    # Explanations only need a small sample of held-out rows
+    X_reference, _ = sample_rows('test', test_manifest, train_model.EXPLANATION_SAMPLE_SIZE)
+    train_model.save_all_results(results, trained_models, best_model_name, best_model, X_reference=X_reference)
+
+    print("\n" + "="*60)
+    print("Training Complete!")
+    print("="*60)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train churn models from preprocessed shards')
+    parser.add_argument('--shard-rows', type=int, default=SHARD_ROWS,
+                        help=f'Rows per shard when splitting the processed CSVs (default: {SHARD_ROWS})')
+    parser.add_argument('--sample-size', type=int, default=OUT_OF_CORE_SAMPLE_SIZE,
+                        help=f'Rows kept in memory for sampled models and CV (default: {OUT_OF_CORE_SAMPLE_SIZE})')
+    args = parser.parse_args()
+    main(sample_size=args.sample_size, shard_rows=args.shard_rows)
@@ -0,0 +1,261 @@
+"""
+Counterfactual What-If Engine for BK Pulse Churn Prediction
+Estimates how much a retention action would lower each customer's churn risk
+by re-scoring the customer with the action applied to their features.
+
+Every model-scored customer is expanded into a grid of perturbed feature
+vectors - each action in WHAT_IF_ACTIONS alone and in combinations of up to
+max_combined actions - and the whole grid of a chunk is scaled and scored in
+one predict_proba call. Variants that reduce the churn probability are ranked
+per customer. Rule-decided customers are skipped (their outcome is fixed).
+
+Usage:
+    python what_if.py simulate --input customers.csv --output what_if.csv
+    python what_if.py simulate --dsn sqlite:///path/to/bk_pulse.db     # nightly job -> what_if_simulations
+    echo '{"customer_data": {...}, "include_what_if": true}' | python predict.py
+"""
+
+import io
+import sys
+import time
+import argparse
+from itertools import combinations
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from predict import FEATURE_COLS, load_artifacts, get_model_version, prepare_features_batch
+from business_rules import evaluate_business_rules
+from batch_scoring import resolve_customer_ids, read_customer_file
+from resource_governor import govern, resolve_jobs, split_threads, configure_estimator
+
+DEFAULT_CHUNK_SIZE = 10000      # Customers per chunk; the scored grid is (variants + 1) times larger
+DEFAULT_TOP_K = 5
+DEFAULT_MAX_COMBINED = 2
+MIN_RISK_REDUCTION = 0.001      # Smaller probability changes are reported as no effect
+RESULTS_TABLE = 'what_if_simulations'
+
+# Retention actions as feature perturbations (operation applied to the unscaled feature)
+WHAT_IF_ACTIONS = [
+    {'name': 'add_product', 'feature': 'Num_Products', 'operation': 'add', 'value': 1,
+     'label': 'Add one product'},
+    {'name': 'add_credit_card', 'feature': 'Has_Credit_Card', 'operation': 'set', 'value': 1,
+     'label': 'Issue a credit card'},
+    {'name': 'activate_mobile_banking', 'feature': 'Mobile_Banking_Usage', 'operation': 'at_least', 'value': 20,
+     'label': 'Activate mobile banking (20+ sessions)'},
+    {'name': 'resolve_complaints', 'feature': 'Complaint_History', 'operation': 'set', 'value': 0,
+     'label': 'Resolve open complaints'},
+    {'name': 'reactivate_account', 'feature': 'Days_Since_Last_Transaction', 'operation': 'at_most', 'value': 30,
+     'label': 'Reactivate (transaction within 30 days)'},
+]
+
+OPERATIONS = {
+    'set': lambda values, value: np.full_like(values, value),
+    'add': lambda values, value: values + value,
+    'at_least': lambda values, value: np.maximum(values, value),
+    'at_most': lambda values, value: np.minimum(values, value),
+}
+
+
+def build_variants(actions=WHAT_IF_ACTIONS, max_combined=DEFAULT_MAX_COMBINED):
+    """Every combination of 1..max_combined actions, as tuples of actions"""
+    return [
+        combo
+        for size in range(1, min(max_combined, len(actions)) + 1)
+        for combo in combinations(actions, size)
+    ]
+
+
+def proper_subsets(variants):
+    """For each variant, the positions of the other variants made of a subset of its actions"""
+    names = [frozenset(action['name'] for action in variant) for variant in variants]
+    return [[other for other, subset in enumerate(names) if subset < name] for name in names]
+
+
+def build_grid(features, variants):
+    """Stack the unperturbed features and one perturbed copy per variant
+
+    Returns (grid, changed): grid has shape (len(variants) + 1, n, n_features)
+    with grid[0] the original features; changed[v, i] is False where variant v
+    leaves customer i's features untouched (e.g. already has a credit card).
+    """
+    base = features[FEATURE_COLS].to_numpy(dtype=np.float64)
+    grid = np.broadcast_to(base, (len(variants) + 1,) + base.shape).copy()
+    for position, variant in enumerate(variants, start=1):
+        for action in variant:
+            column = FEATURE_COLS.index(action['feature'])
+            grid[position, :, column] = OPERATIONS[action['operation']](grid[position, :, column], action['value'])
+    changed = (grid[1:] != base).any(axis=2)
+    return grid, changed
+
+
+def score_grid(grid, model, scaler):
+    """Scale and score a whole grid in one pass; returns probabilities of shape grid.shape[:2]"""
+    flat = pd.DataFrame(grid.reshape(-1, grid.shape[2]), columns=FEATURE_COLS)
+    return model.predict_proba(scaler.transform(flat))[:, 1].reshape(grid.shape[:2])
+
+
+def simulate_frame(customers, model, scaler, encoders, variants=None, top_k=DEFAULT_TOP_K):
+    """Ranked risk reductions per model-scored customer (long format, one row per customer and variant)"""
+    variants = build_variants() if variants is None else variants
+    customers = customers[evaluate_business_rules(customers).isna().to_numpy()]
+    if customers.empty:
+        return None
+
+    grid, changed = build_grid(prepare_features_batch(customers, encoders), variants)
+    probabilities = score_grid(grid, model, scaler)
+    baseline = probabilities[0]
+    delta = probabilities[1:] - baseline
+    # Variants that change nothing, do not lower the risk, or do no better than one of their
+    # own sub-combinations sort last and are dropped
+    useful = changed & (delta <= -MIN_RISK_REDUCTION)
+    for position, subsets in enumerate(proper_subsets(variants)):
+        if subsets:
+            useful[position] &= delta[position] <= delta[subsets].min(axis=0) - MIN_RISK_REDUCTION
+    delta = np.where(useful, delta, np.inf)
+
+    order = np.argsort(delta, axis=0, kind='stable')[:top_k]
+    ranked_delta = np.take_along_axis(delta, order, axis=0)
+    keep = np.isfinite(ranked_delta)
+    rank, customer = np.nonzero(keep)
+    variant = order[rank, customer]
+
+    names = np.array(['+'.join(action['name'] for action in combo) for combo in variants], dtype=object)
+    labels = np.array([' + '.join(action['label'] for action in combo) for combo in variants], dtype=object)
+    customer_ids = resolve_customer_ids(customers).to_numpy(dtype=object)
+    return pd.DataFrame({
+        'customer_id': customer_ids[customer],
+        'rank': rank + 1,
+        'action': names[variant],
+        'label': labels[variant],
+        'actions_combined': np.array([len(combo) for combo in variants])[variant],
+        'baseline_probability': np.round(baseline[customer], 6),
+        'churn_probability': np.round(probabilities[1:][variant, customer], 6),
+        'risk_delta': np.round(ranked_delta[keep], 6),
+    }).sort_values(['customer_id', 'rank'], kind='stable', ignore_index=True)
+
+
+def simulate_customer(customer_data, top_k=DEFAULT_TOP_K):
+    """What-if results for one customer, as a list of dicts (used by predict.py)"""
+    model, scaler, encoders = load_artifacts()
+    results = simulate_frame(pd.DataFrame([customer_data]), model, scaler, encoders, top_k=top_k)
+    if results is None:
+        return []
+    return [
+        {
+            'action': row.action,
+            'label': row.label,
+            'baseline_probability': float(row.baseline_probability),
+            'churn_probability': float(row.churn_probability),
+            'risk_delta': float(row.risk_delta),
+            'risk_reduction_points': round(-float(row.risk_delta) * 100, 1),
+        }
+        for row in results.itertuples(index=False)
+    ]
+
+
+def create_results_table(conn, dialect):
+    """Create the what_if_simulations table read by the API server (if missing)"""
+    cursor = conn.cursor()
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {RESULTS_TABLE} ("
+        "customer_id VARCHAR(50) NOT NULL, rank INTEGER NOT NULL, action VARCHAR(200) NOT NULL, "
+        "label VARCHAR(255), actions_combined INTEGER, baseline_probability DECIMAL(8,6), "
+        "churn_probability DECIMAL(8,6), risk_delta DECIMAL(8,6), model_version VARCHAR(100), "
+        "simulated_at TIMESTAMP, PRIMARY KEY (customer_id, rank))"
+    )
+    cursor.close()
+
+
+def write_results(conn, dialect, results):
+    """Append a chunk of results to what_if_simulations (COPY on PostgreSQL)"""
+    results = results[results['customer_id'].notna()]
+    columns = list(results.columns)
+    cursor = conn.cursor()
+    if dialect == 'postgresql':
+        buffer = io.StringIO()
+        results.to_csv(buffer, header=False, index=False)
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY {RESULTS_TABLE} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    else:
+        cursor.executemany(
+            f"INSERT OR REPLACE INTO {RESULTS_TABLE} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            results.astype(object).itertuples(index=False, name=None)
+        )
+    cursor.close()
+    return len(results)
+
+
+def run_simulations(chunks, n_jobs=-1, top_k=DEFAULT_TOP_K, max_combined=DEFAULT_MAX_COMBINED):
+    """Simulate every chunk in parallel, yielding result frames tagged with the model version"""
+    model, scaler, encoders = load_artifacts()
+    model_version = get_model_version()
+    simulated_at = datetime.now().isoformat(timespec='seconds')
+    variants = build_variants(max_combined=max_combined)
+    # Worker processes share this process's thread allocation
+    n_jobs = resolve_jobs(n_jobs)
+    configure_estimator(model, split_threads(n_jobs)[1])
+
+    results = Parallel(n_jobs=n_jobs, return_as='generator')(
+        delayed(simulate_frame)(chunk, model, scaler, encoders, variants, top_k) for chunk in chunks
+    )
+    for result in results:
+        if result is not None and not result.empty:
+            yield result.assign(model_version=model_version, simulated_at=simulated_at)
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Counterfactual what-if simulation of retention actions')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    simulate = subparsers.add_parser('simulate', help='Simulate every customer in a file or the customers table')
+    simulate.add_argument('--input', help='Customer CSV or JSON lines file')
+    simulate.add_argument('--output', help='Output CSV (with --input)')
+    simulate.add_argument('--dsn', help='Database to read customers from and write what_if_simulations to')
+    simulate.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    simulate.add_argument('--top-k', type=int, default=DEFAULT_TOP_K, help='Ranked actions kept per customer')
+    simulate.add_argument('--max-combined', type=int, default=DEFAULT_MAX_COMBINED,
+                          help='Largest number of actions simulated together')
+    simulate.add_argument('--jobs', type=int, default=-1, help='Parallel worker processes (default: all cores)')
+    args = parser.parse_args()
+    govern(role='what_if.py')
+
+    start_time = time.time()
+    total = 0
+    options = dict(n_jobs=args.jobs, top_k=args.top_k, max_combined=args.max_combined)
+
+    if args.input:
+        if not args.output:
+            parser.error('--output is required with --input')
+        header = True
+        for results in run_simulations(read_customer_file(args.input, args.chunk_size), **options):
+            results.to_csv(args.output, mode='w' if header else 'a', header=header, index=False)
+            header = False
+            total += len(results)
+        print(f"Wrote {total:,} what-if results in {time.time() - start_time:.1f}s -> {args.output}", file=sys.stderr)
+        return
+
+    from score_database import connect, stream_customers, transform_customer_rows
+    conn, dialect = connect(args.dsn)
+    try:
+        create_results_table(conn, dialect)
+        # Full nightly refresh: readers see the previous results until the commit
+        conn.cursor().execute(f"DELETE FROM {RESULTS_TABLE}")
+        customers = stream_customers(conn, dialect, chunk_size=args.chunk_size, update_all=True)
+        chunks = (transform_customer_rows(chunk) for chunk in customers)
+        for results in run_simulations(chunks, **options):
+            total += write_results(conn, dialect, results)
+            print(f"Simulated {total:,} actions ({time.time() - start_time:.1f}s)...", file=sys.stderr)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    print(f"Wrote {total:,} what-if results in {time.time() - start_time:.1f}s -> {RESULTS_TABLE}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
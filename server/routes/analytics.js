@@ -286,5 +286,117 @@ router.get('/budget-roi', authenticateToken, requireRole(['retentionManager', 'a
   }
 });
 
+// Precomputed risk rollups maintained by the Python scoring job (ml/risk_rollups.py)
+const ROLLUP_SCOPES = {
+  all: null,
+  branch: 'branch',
+  segment: 'segment',
+  product: 'product_type',
+  officer: 'assigned_officer_id'
+};
+const ROLLUP_HISTOGRAM_BINS = 10;
+
+// @route   GET /api/analytics/risk-rollups
+// @desc    Risk-band counts, average churn score, expected churners and score histogram per group,
+//          plus the daily trend of one group
+// @access  Private
+router.get('/risk-rollups', authenticateToken, async (req, res) => {
+  try {
+    const { scope = 'all' } = req.query;
+    const value = scope === 'all' ? 'all' : req.query.value;
+    const days = Math.min(parseInt(req.query.days) || 30, 365);
+
+    if (!(scope in ROLLUP_SCOPES)) {
+      return res.status(400).json({
+        success: false,
+        message: `Invalid scope. Use one of: ${Object.keys(ROLLUP_SCOPES).join(', ')}`
+      });
+    }
+
+    const histogramColumns = Array.from({ length: ROLLUP_HISTOGRAM_BINS }, (_, i) =>
+      `hist_${String(i * 10).padStart(2, '0')}`);
+    let groups;
+    let trend = [];
+    let source = 'rollups';
+    try {
+      const result = await pool.query(`
+        SELECT scope_value, customers, high_risk, medium_risk, low_risk, avg_churn_score, expected_churn,
+               ${histogramColumns.join(', ')}, updated_at
+        FROM customer_risk_rollups
+        WHERE scope = $1
+        ORDER BY customers DESC
+      `, [scope]);
+      groups = result.rows;
+      if (value) {
+        const trendResult = await pool.query(`
+          SELECT snapshot_date, customers, high_risk, medium_risk, low_risk, avg_churn_score, expected_churn
+          FROM customer_risk_rollup_snapshots
+          WHERE scope = $1 AND scope_value = $2 AND snapshot_date >= CURRENT_DATE - $3::int
+          ORDER BY snapshot_date ASC
+        `, [scope, String(value), days]);
+        trend = trendResult.rows;
+      }
+    } catch (rollupError) {
+      // Rollups not built yet (python ml/risk_rollups.py build): aggregate the customers table instead
+      source = 'customers';
+      const column = ROLLUP_SCOPES[scope] || "'all'";
+      const histogram = histogramColumns.map((name, i) => (
+        `COUNT(CASE WHEN LEAST(FLOOR(churn_score / 10), ${ROLLUP_HISTOGRAM_BINS - 1}) = ${i} THEN 1 END) as ${name}`
+      ));
+      const result = await pool.query(`
+        SELECT
+          ${column}::text as scope_value,
+          COUNT(*) as customers,
+          COUNT(CASE WHEN risk_level = 'high' THEN 1 END) as high_risk,
+          COUNT(CASE WHEN risk_level = 'medium' THEN 1 END) as medium_risk,
+          COUNT(CASE WHEN risk_level = 'low' THEN 1 END) as low_risk,
+          AVG(churn_score) as avg_churn_score,
+          SUM(churn_score) / 100 as expected_churn,
+          ${histogram.join(',\n          ')}
+        FROM customers
+        WHERE churn_score IS NOT NULL AND ${column} IS NOT NULL
+        GROUP BY 1
+        ORDER BY customers DESC
+      `);
+      groups = result.rows;
+    }
+
+    res.json({
+      success: true,
+      data: {
+        scope,
+        source,
+        groups: groups.map(row => ({
+          value: row.scope_value,
+          customers: parseInt(row.customers || 0),
+          highRisk: parseInt(row.high_risk || 0),
+          mediumRisk: parseInt(row.medium_risk || 0),
+          lowRisk: parseInt(row.low_risk || 0),
+          avgChurnScore: parseFloat(parseFloat(row.avg_churn_score || 0).toFixed(2)),
+          expectedChurn: parseFloat(parseFloat(row.expected_churn || 0).toFixed(1)),
+          histogram: histogramColumns.map(name => parseInt(row[name] || 0)),
+          updatedAt: row.updated_at || null
+        })),
+        trend: trend.map(row => ({
+          date: row.snapshot_date,
+          customers: parseInt(row.customers || 0),
+          highRisk: parseInt(row.high_risk || 0),
+          mediumRisk: parseInt(row.medium_risk || 0),
+          lowRisk: parseInt(row.low_risk || 0),
+          avgChurnScore: parseFloat(parseFloat(row.avg_churn_score || 0).toFixed(2)),
+          expectedChurn: parseFloat(parseFloat(row.expected_churn || 0).toFixed(1))
+        }))
+      }
+    });
+  } catch (error) {
+    console.error('Error fetching risk rollups:', error);
+    res.status(500).json({
+      success: false,
+      message: 'Failed to fetch risk rollups',
+      error: error.message
+    });
+  }
+});
+
 module.exports = router;
 
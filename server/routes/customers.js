@@ -168,6 +168,93 @@ router.get('/stats/summary', authenticateToken, async (req, res) => {
   }
 });
 
+// Top-K at-risk index maintained by the Python scoring job (ml/risk_index.py)
+const RISK_INDEX_TOP_K = 50;
+const RISK_INDEX_SCOPES = {
+  all: null,
+  branch: 'branch',
+  segment: 'segment',
+  officer: 'assigned_officer_id'
+};
+
+// @route   GET /api/customers/top-at-risk
+// @desc    Highest-risk customers of a branch, segment or officer, optionally within one risk band
+// @access  Private
+router.get('/top-at-risk', authenticateToken, async (req, res) => {
+  try {
+    const { scope = 'all', band = 'all' } = req.query;
+    const value = scope === 'all' ? 'all' : String(req.query.value || '');
+    const limit = Math.min(parseInt(req.query.limit) || 20, RISK_INDEX_TOP_K);
+
+    if (!(scope in RISK_INDEX_SCOPES)) {
+      return res.status(400).json({
+        success: false,
+        message: `Invalid scope. Use one of: ${Object.keys(RISK_INDEX_SCOPES).join(', ')}`
+      });
+    }
+
+    let customers;
+    let source = 'index';
+    try {
+      // Precomputed index: no sort over the customers table
+      const result = await pool.query(`
+        SELECT i.rank, i.customer_id, i.churn_score, i.risk_level, i.indexed_at,
+               c.name, c.segment, c.branch, c.assigned_officer_id
+        FROM customer_risk_index i
+        LEFT JOIN LATERAL (
+          SELECT name, segment, branch, assigned_officer_id
+          FROM customers
+          WHERE customers.customer_id = i.customer_id
+          ORDER BY updated_at DESC NULLS LAST, id DESC
+          LIMIT 1
+        ) c ON true
+        WHERE i.scope = $1 AND i.scope_value = $2 AND i.churn_band = $3
+        ORDER BY i.rank
+        LIMIT $4
+      `, [scope, value, band, limit]);
+      customers = result.rows;
+    } catch (indexError) {
+      // Index not built yet (python ml/risk_index.py build): sort the customers table instead
+      source = 'customers';
+      const params = [];
+      let whereClause = 'WHERE churn_score IS NOT NULL';
+      if (RISK_INDEX_SCOPES[scope]) {
+        params.push(value);
+        whereClause += ` AND ${RISK_INDEX_SCOPES[scope]} = $${params.length}`;
+      }
+      if (band !== 'all') {
+        params.push(band);
+        whereClause += ` AND risk_level = $${params.length}`;
+      }
+      params.push(limit);
+      const result = await pool.query(`
+        SELECT customer_id, churn_score, risk_level, name, segment, branch, assigned_officer_id
+        FROM customers
+        ${whereClause}
+        ORDER BY churn_score DESC, customer_id ASC
+        LIMIT $${params.length}
+      `, params);
+      customers = result.rows.map((row, position) => ({ rank: position + 1, ...row }));
+    }
+
+    res.json({
+      success: true,
+      scope,
+      value,
+      band,
+      source,
+      customers
+    });
+  } catch (error) {
+    console.error('Error fetching top at-risk customers:', error);
+    res.status(500).json({
+      success: false,
+      message: 'Failed to fetch top at-risk customers',
+      error: error.message
+    });
+  }
+});
+
 // @route   GET /api/customers/:id/shap
 // @desc    Get SHAP values for a customer prediction
 // @access  Private
@@ -315,6 +402,18 @@ router.get('/:id/recommendations', authenticateToken, async (req, res) => {
       });
     }
 
+    // Model-simulated action effects from the nightly what-if job (ml/what_if.py), when it has run
+    let whatIf = [];
+    try {
+      const whatIfResult = await pool.query(
+        'SELECT action, baseline_probability, churn_probability, risk_delta FROM what_if_simulations WHERE customer_id = $1 ORDER BY rank',
+        [dbCustomer.customer_id]
+      );
+      whatIf = whatIfResult.rows;
+    } catch (whatIfError) {
+      // The table is created by the first simulation run
+    }
+
     // Get prediction with SHAP values
     let prediction;
     try {
@@ -343,7 +442,8 @@ router.get('/:id/recommendations', authenticateToken, async (req, res) => {
       const recommendations = generateRecommendations(
         dbCustomer,
         fallbackPrediction,
-        []
+        [],
+        whatIf
       );
       
       return res.json({
@@ -363,7 +463,8 @@ router.get('/:id/recommendations', authenticateToken, async (req, res) => {
     const recommendations = generateRecommendations(
       dbCustomer,
       prediction,
-      prediction.shap_values || []
+      prediction.shap_values || [],
+      whatIf
     );
 
     // Optionally save recommendations to database
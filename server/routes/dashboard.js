@@ -4,6 +4,19 @@ const { authenticateToken, requireRole } = require('../middleware/auth');
 
 const router = express.Router();
 
+// Precomputed risk rollups maintained by the Python scoring job (ml/risk_rollups.py)
+async function queryRollups(rollupQuery, fallbackQuery, params = []) {
+  try {
+    const result = await pool.query(rollupQuery, params);
+    if (result.rows.length > 0) {
+      return result;
+    }
+  } catch (rollupError) {
+    // Rollups not built yet (python ml/risk_rollups.py build): aggregate the customers table instead
+  }
+  return pool.query(fallbackQuery, params);
+}
+
 // @route   GET /api/dashboard/overview
 // @desc    Get dashboard overview data based on user role
 // @access  Private
@@ -226,7 +239,8 @@ async function getRetentionAnalystData() {
     riskDistResult
   ] = await Promise.all([
     pool.query('SELECT COUNT(*) as count FROM customers').catch(() => ({ rows: [{ count: 0 }] })),
-    pool.query(
+    queryRollups(
+      "SELECT avg_churn_score as avg_churn FROM customer_risk_rollups WHERE scope = 'all'",
       'SELECT AVG(churn_score) as avg_churn FROM customers WHERE churn_score IS NOT NULL'
     ).catch(() => ({ rows: [{ avg_churn: 0 }] })),
     pool.query('SELECT COUNT(*) as count FROM customer_segments').catch(() => ({ rows: [{ count: 0 }] })),
@@ -237,7 +251,12 @@ async function getRetentionAnalystData() {
       ORDER BY evaluation_date DESC 
       LIMIT 1
     `).catch(() => ({ rows: [] })),
-    pool.query(`
+    queryRollups(`
+      SELECT scope_value as segment, customers, avg_churn_score as avg_churn_rate
+      FROM customer_risk_rollups
+      WHERE scope = 'segment'
+      ORDER BY customers DESC
+    `, `
       SELECT 
         segment,
         COUNT(*) as customers,
@@ -247,7 +266,13 @@ async function getRetentionAnalystData() {
       GROUP BY segment
       ORDER BY customers DESC
     `).catch(() => ({ rows: [] })),
-    pool.query(`
+    queryRollups(`
+      SELECT 'high' as risk_level, high_risk as count FROM customer_risk_rollups WHERE scope = 'all'
+      UNION ALL
+      SELECT 'medium', medium_risk FROM customer_risk_rollups WHERE scope = 'all'
+      UNION ALL
+      SELECT 'low', low_risk FROM customer_risk_rollups WHERE scope = 'all'
+    `, `
       SELECT risk_level, COUNT(*) as count
       FROM customers
       WHERE risk_level IS NOT NULL
@@ -7,12 +7,71 @@ const express = require('express');
 const router = express.Router();
 const pool = require('../config/database');
 const { authenticateToken } = require('../middleware/auth');
+const fs = require('fs');
+const path = require('path');
+const { spawn } = require('child_process');
+
+// Report written by ml/outcome_evaluation.py (incremental histograms over realized outcomes)
+const OUTCOME_REPORT_PATH = path.join(__dirname, '../../data/monitoring/outcome_evaluation.json');
+const OUTCOME_EVALUATION_SCRIPT = path.join(__dirname, '../../ml/outcome_evaluation.py');
+const OUTCOME_REPORT_MAX_AGE_MS = 15 * 60 * 1000; // Refresh in the background when older than 15 minutes
+let outcomeUpdateRunning = false;
+
+/**
+ * Start an incremental outcome evaluation in the background (at most one at a time)
+ */
+function refreshOutcomeReport() {
+  if (outcomeUpdateRunning) return;
+  outcomeUpdateRunning = true;
+  const isWindows = process.platform === 'win32';
+  const python = spawn(isWindows ? 'python' : 'python3', [OUTCOME_EVALUATION_SCRIPT, 'update'], {
+    shell: isWindows,
+    cwd: path.join(__dirname, '../../'),
+    stdio: 'ignore'
+  });
+  python.on('error', (error) => {
+    outcomeUpdateRunning = false;
+    console.error('Outcome evaluation failed to start:', error.message);
+  });
+  python.on('close', (code) => {
+    outcomeUpdateRunning = false;
+    if (code !== 0) console.error(`Outcome evaluation exited with code ${code}`);
+  });
+}
+
+/**
+ * Read the precomputed outcome report, or null if there is none yet
+ */
+function readOutcomeReport() {
+  try {
+    const stats = fs.statSync(OUTCOME_REPORT_PATH);
+    const report = JSON.parse(fs.readFileSync(OUTCOME_REPORT_PATH, 'utf8'));
+    return { report, age: Date.now() - stats.mtimeMs };
+  } catch (error) {
+    return null;
+  }
+}
 
 // @route   GET /api/model-validation/metrics
 // @desc    Get model validation metrics comparing predictions vs actual outcomes
 // @access  Private
 router.get('/metrics', authenticateToken, async (req, res) => {
   try {
+    // Serve the precomputed report (adds ROC-AUC, calibration, by_branch, by_model_version);
+    // ?live=true recomputes from the customers table below
+    const precomputed = req.query.live === 'true' ? null : readOutcomeReport();
+    if (precomputed) {
+      if (precomputed.age > OUTCOME_REPORT_MAX_AGE_MS) refreshOutcomeReport();
+      return res.json({
+        success: true,
+        source: 'outcome_evaluation',
+        generated_at: precomputed.report.generated_at,
+        model_version: precomputed.report.model_version,
+        metrics: precomputed.report.metrics
+      });
+    }
+    if (req.query.live !== 'true') refreshOutcomeReport();
+
     // Get all customers with both churn_score and actual_churn_flag
     const result = await pool.query(`
       SELECT 
@@ -154,6 +213,7 @@ router.get('/metrics', authenticateToken, async (req, res) => {
 
     res.json({
       success: true,
+      source: 'live',
       metrics: {
         total,
         accuracy: Math.round(accuracy * 10000) / 100, // Percentage with 2 decimals
@@ -14,18 +14,20 @@ const {
  * @access  Private (Officer, Analyst, Manager, Admin)
  * @param   {Object} req.body.customer_data - Customer data object
  * @param   {Boolean} req.body.include_shap - Whether to include SHAP explainability values
+ * @param   {Number} req.body.latency_budget_ms - Optional latency budget; SHAP falls back to global importances if it does not fit
  * @returns {Object} Prediction results with churn_score, risk_level, and optional SHAP values
  */
 router.post('/single', authenticateToken, requireRole(['retentionOfficer', 'retentionAnalyst', 'retentionManager', 'admin']), async (req, res) => {
   try {
     const customerData = req.body.customer_data || req.body;
     const includeShap = req.body.include_shap === true;
+    const latencyBudgetMs = Number(req.body.latency_budget_ms) || undefined;
     
     if (!customerData) {
       return res.status(400).json({ message: 'Customer data is required' });
     }
     
-    const prediction = await predictChurn(customerData, includeShap);
+    const prediction = await predictChurn(customerData, includeShap, latencyBudgetMs);
     
     res.json({
       success: true,
@@ -236,19 +238,17 @@ router.get('/model-info', authenticateToken, requireRole(['retentionOfficer', 'r
       'SELECT * FROM model_performance ORDER BY evaluation_date DESC LIMIT 10'
     );
     
-    // Try to get feature importance from model file if available
+    // Feature importance precomputed at training time (ml/train_model.py -> data/models/explanations/)
     let featureImportance = [];
     try {
-      const modelPath = path.join(__dirname, '../../data/models/xgboost_best.pkl');
-      if (fs.existsSync(modelPath)) {
-        // Load model to get feature importance (this would require Python or reading pickle)
-        // Feature importance extraction
-        // In production, you'd want to extract this from the actual model
-        if (metrics && metrics.classification_report) {
-          // Extract top features from metrics if available
-          // Extract feature importance from model
-          featureImportance = [];
-        }
+      const explanationsPath = path.join(__dirname, '../../data/models/explanations/xgboost_best.json');
+      if (fs.existsSync(explanationsPath)) {
+        const explanations = JSON.parse(fs.readFileSync(explanationsPath, 'utf8'));
+        featureImportance = (explanations.features || []).map(feature => ({
+          feature: feature.display_name || feature.feature,
+          importance: feature.importance,
+          mean_abs_shap: feature.mean_abs_shap
+        }));
       }
     } catch (err) {
       // Feature importance extraction failed, continue without it
@@ -0,0 +1,11 @@
+-- Add model_version column to customers table
+-- Records which model produced churn_score, so realized outcomes can be evaluated per model version
+-- (ml/outcome_evaluation.py, by_model_version in /api/model-validation/metrics)
+
+-- Add the column if it doesn't exist
+ALTER TABLE customers
+ADD COLUMN IF NOT EXISTS model_version VARCHAR(100);
+
+-- Add comment to column
+COMMENT ON COLUMN customers.model_version IS
+'Version of the churn model that produced churn_score (written by ml/score_database.py).';
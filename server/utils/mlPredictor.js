@@ -7,17 +7,24 @@ const { spawn } = require('child_process');
 const path = require('path');
 
 const PYTHON_SCRIPT_PATH = path.join(__dirname, '../../ml/predict.py');
+// predict.py processes run at once by predictChurnBatch; each gets an equal share of the
+// CPU budget (BK_PULSE_WORKERS, see ml/resource_governor.py) instead of every core
+const ML_CONCURRENCY = 5;
+// Latency budget for single predictions: predict.py always returns the prediction and only runs
+// SHAP if it fits, otherwise it falls back to global importances (see explanation_source)
+const DEFAULT_LATENCY_BUDGET_MS = 5000;
 
 /**
  * Predict churn for a single customer
  * @param {Object} customerData - Customer data object
  * @param {Boolean} includeShap - Whether to include SHAP values
+ * @param {Number} latencyBudgetMs - Time budget for the prediction and its explanation (null for none)
  * @returns {Promise<Object>} Prediction results
  */
-function predictChurn(customerData, includeShap = false) {
+function predictChurn(customerData, includeShap = false, latencyBudgetMs = DEFAULT_LATENCY_BUDGET_MS) {
   return new Promise((resolve, reject) => {
     try {
-      // Apply BK business rules BEFORE prediction
+      // Apply BK business rules BEFORE prediction (keep in sync with ml/business_rules.py)
       const accountType = customerData.Account_Type || customerData.account_type || customerData.product_type;
       const daysSinceLastTransaction = customerData.Days_Since_Last_Transaction || 
                                        customerData.days_since_last_transaction || 0;
@@ -47,7 +54,8 @@ function predictChurn(customerData, includeShap = false) {
       // Convert customer data to JSON string with SHAP flag
       const inputData = {
         customer_data: customerData,
-        include_shap: includeShap
+        include_shap: includeShap,
+        latency_budget_ms: latencyBudgetMs
       };
       const jsonData = JSON.stringify(inputData);
       
@@ -61,7 +69,8 @@ function predictChurn(customerData, includeShap = false) {
       const python = spawn(pythonCmd, [PYTHON_SCRIPT_PATH], {
         shell: isWindows, // Use shell on Windows for better compatibility
         cwd: path.join(__dirname, '../../'), // Set working directory to project root
-        stdio: ['pipe', 'pipe', 'pipe'] // stdin, stdout, stderr
+        stdio: ['pipe', 'pipe', 'pipe'], // stdin, stdout, stderr
+        env: { ...process.env, BK_PULSE_WORKERS: process.env.BK_PULSE_WORKERS || String(ML_CONCURRENCY) }
       });
       
       // Write JSON data to stdin
@@ -160,7 +169,7 @@ async function predictChurnBatch(customersData, onProgress) {
   
   // Process in smaller batches to avoid overwhelming the system and reduce timeouts
   // Reduced from 10 to 5 to give each Python process more resources
-  const batchSize = 5;
+  const batchSize = ML_CONCURRENCY;
   let processed = 0;
   
   for (let i = 0; i < customersData.length; i += batchSize) {
@@ -128,9 +128,10 @@ function calculateTimeline(churnScore, baseTimeline) {
  * @param {Object} customer - Customer data
  * @param {Object} prediction - ML prediction results
  * @param {Array} shapValues - SHAP values from model
+ * @param {Array} whatIf - What-if simulation results (ml/what_if.py), defaults to prediction.what_if
  * @returns {Array} Array of recommendation objects
  */
-function generateRecommendations(customer, prediction, shapValues = []) {
+function generateRecommendations(customer, prediction, shapValues = [], whatIf = []) {
   const recommendations = [];
   const churnScore = prediction.churn_score || 0;
   const riskLevel = prediction.risk_level || 'low';
@@ -482,6 +483,9 @@ function generateRecommendations(customer, prediction, shapValues = []) {
     }
   }
 
+  // Replace heuristic impact ranges with model-simulated risk reductions where available
+  applyWhatIfEstimates(recommendations, whatIf.length > 0 ? whatIf : (prediction.what_if || []));
+
   // Sort by priority and confidence
   const priorityOrder = { high: 3, medium: 2, low: 1 };
   recommendations.sort((a, b) => {
@@ -495,6 +499,45 @@ function generateRecommendations(customer, prediction, shapValues = []) {
   return recommendations.slice(0, 5);
 }
 
+/**
+ * What-if simulation actions (ml/what_if.py) and the recommendation each one models
+ */
+const WHAT_IF_RECOMMENDATIONS = {
+  add_product: 'Premium Account Upgrade',
+  add_credit_card: 'Credit Card Cross-Sell',
+  activate_mobile_banking: 'Digital Banking Training',
+  resolve_complaints: 'Assign Senior Relationship Manager',
+  reactivate_account: 'Send Reactivation Campaign'
+};
+
+/**
+ * Attach model-based risk reductions from what-if simulations to matching recommendations
+ * @param {Array} recommendations - Recommendations to update in place
+ * @param {Array} whatIf - Simulation results with action, baseline_probability, churn_probability, risk_delta
+ */
+function applyWhatIfEstimates(recommendations, whatIf = []) {
+  const resultsByRecommendation = {};
+  whatIf.forEach(result => {
+    // Combined actions cannot be attributed to a single recommendation
+    const recommendationAction = WHAT_IF_RECOMMENDATIONS[result.action];
+    if (recommendationAction) {
+      resultsByRecommendation[recommendationAction] = result;
+    }
+  });
+
+  recommendations.forEach(recommendation => {
+    const result = resultsByRecommendation[recommendation.action];
+    if (!result) return;
+    // DECIMAL columns arrive as strings from PostgreSQL
+    const reduction = Math.round(-Number(result.risk_delta) * 1000) / 10;
+    const before = (Number(result.baseline_probability) * 100).toFixed(1);
+    const after = (Number(result.churn_probability) * 100).toFixed(1);
+    recommendation.estimatedImpact = `Model estimate - reduces churn risk by ${reduction} points (${before}% to ${after}%)`;
+    recommendation.modelRiskReduction = reduction;
+  });
+}
+
 module.exports = {
-  generateRecommendations
+  generateRecommendations,
+  applyWhatIfEstimates
 };